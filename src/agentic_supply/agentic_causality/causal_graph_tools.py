@@ -3,8 +3,11 @@ from neuro_san.interfaces.coded_tool import CodedTool
 import os
 
 from agentic_supply.causality_assistant.causal_graph import CausalGraph
-from agentic_supply.utilities.config import DATA_NAMES
+from agentic_supply.utilities.config import DATA_NAMES, RENDER_OPEN_BROWSER
+from agentic_supply.utilities.execution import tool_executor
+from agentic_supply.utilities.rendering import open_in_browser
 from agentic_supply.utilities.log_utils import set_logging, get_logger
+from agentic_supply.utilities.instrumentation import instrument_tool
 
 
 set_logging()
@@ -21,6 +24,7 @@ class CausalGraphVisualiser(CodedTool):
     Implementations are expected to clean up after themselves.
     """
 
+    @instrument_tool
     async def async_invoke(self, args: Dict[str, Any], sly_data: Dict[str, Any]) -> Any:
         """
         Called when the coded tool is invoked asynchronously by the agent hierarchy.
@@ -48,8 +52,11 @@ class CausalGraphVisualiser(CodedTool):
         logger.info(f"data_name from sly_data : {data_name}")
 
         causal_graph = CausalGraph(data_name)
-        causal_graph.visualise()
-        return "The causal graph was visualised, see the newly opened tab"
+        # the plot is drawn on its own figure with the Agg canvas, so a thread is enough
+        plot = await tool_executor.run(causal_graph.visualise)
+        if RENDER_OPEN_BROWSER:
+            open_in_browser(plot)
+        return f"The causal graph was visualised, see {plot.html_path}"
 
 
 class CausalGraphRefutator(CodedTool):
@@ -62,6 +69,7 @@ class CausalGraphRefutator(CodedTool):
     Implementations are expected to clean up after themselves.
     """
 
+    @instrument_tool
     async def async_invoke(self, args: Dict[str, Any], sly_data: Dict[str, Any]) -> Any:
         """
         Called when the coded tool is invoked asynchronously by the agent hierarchy.
@@ -89,5 +97,5 @@ class CausalGraphRefutator(CodedTool):
         logger.info(f"data_name from sly_data : {data_name}")
 
         causal_graph = CausalGraph(data_name)
-        refutation = causal_graph.refutate()
-        return f"The causal graph refutation report was correctly generated and visualised, see the newly opened tab for the visualisation.\n\n\nRefutation report :\n{refutation}"
+        refutation = await tool_executor.run(causal_graph.refutate, in_worker=True)
+        return f"The causal graph refutation report was correctly generated and visualised.\n\n\nRefutation report :\n{refutation}"
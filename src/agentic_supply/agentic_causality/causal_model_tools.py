@@ -3,16 +3,23 @@ from neuro_san.interfaces.coded_tool import CodedTool
 import os
 
 from agentic_supply.causality_assistant.causal_graph import CausalGraph
-from agentic_supply.causality_assistant.causal_analysis import CausalAnalysis
-from agentic_supply.utilities.config import DATA_NAMES
+from agentic_supply.causality_assistant.causal_analysis import CausalAnalysis, run_from_cache
+from agentic_supply.utilities.config import DATA_NAMES, EVALUATION_MAX_NUM_SAMPLES
 from agentic_supply.data_assistant.data_downloading import download_data
+from agentic_supply.utilities.execution import tool_executor
 from agentic_supply.utilities.log_utils import set_logging, get_logger
+from agentic_supply.utilities.instrumentation import instrument_tool
 
 
 set_logging()
 logger = get_logger(__name__)
 
 
+def _get_evaluation_report(data_name: DATA_NAMES) -> str:
+    # persisted by model hash : the evaluation only runs again when the model or the data changed
+    return CausalAnalysis.from_cache(data_name).evaluate(max_num_samples=EVALUATION_MAX_NUM_SAMPLES).evaluation_report
+
+
 class CausalModelEvaluator(CodedTool):
     """
     CodedTool implementation of a calculator for the math_guy test.
@@ -23,6 +30,7 @@ class CausalModelEvaluator(CodedTool):
     Implementations are expected to clean up after themselves.
     """
 
+    @instrument_tool
     async def async_invoke(self, args: Dict[str, Any], sly_data: Dict[str, Any]) -> Any:
         """
         Called when the coded tool is invoked asynchronously by the agent hierarchy.
@@ -50,8 +58,9 @@ class CausalModelEvaluator(CodedTool):
         logger.info(f"data_name from sly_data : {data_name}")
 
         causal_graph = CausalGraph(data_name)
-        causal_analysis = CausalAnalysis(causal_graph, model_from_file=True)
-        causal_analysis.evaluate()
+        causal_analysis = await tool_executor.run(CausalAnalysis.from_cache, data_name, causal_graph)
+        # the evaluation runs in a worker process, on the worker's own cached model : its report is set on the instance of the tool server
+        causal_analysis.evaluation_report = await tool_executor.run(_get_evaluation_report, data_name, in_worker=True)
         return f"The model was correctly evaluated.\n\nModel fit report :\n{causal_analysis.fit_report}\n\nModel evaluation report :\n{causal_analysis.evaluation_report}"
 
 
@@ -65,6 +74,7 @@ class CausalModelGenerator(CodedTool):
     Implementations are expected to clean up after themselves.
     """
 
+    @instrument_tool
     async def async_invoke(self, args: Dict[str, Any], sly_data: Dict[str, Any]) -> Any:
         """
         Called when the coded tool is invoked asynchronously by the agent hierarchy.
@@ -91,8 +101,6 @@ class CausalModelGenerator(CodedTool):
         data_name: DATA_NAMES = sly_data["data_name"]
         logger.info(f"data_name from sly_data : {data_name}")
 
-        causal_graph = CausalGraph(data_name)
-        causal_analysis = CausalAnalysis(causal_graph, model_from_file=True)
-        data = causal_analysis.generate_data()
+        data = await tool_executor.run(run_from_cache, data_name, "generate_data", in_worker=True)
         target_path = download_data(df=data)
         return f"The data was correctly generated and saved at {target_path}"
@@ -2,10 +2,19 @@ from typing import Any, Dict
 from neuro_san.interfaces.coded_tool import CodedTool
 import pandas as pd
 
-from agentic_supply.causality_assistant.causal_analysis import CausalAnalysis
-from agentic_supply.utilities.config import DATA_NAMES, CAUSAL_INFLUENCE_TYPES, ROOT_CAUSE_TYPES, WHAT_IF_QUESTION_TYPES
+from agentic_supply.causality_assistant.approximation import Approximation
+from agentic_supply.causality_assistant.causal_analysis import CausalAnalysis, run_from_cache
+from agentic_supply.utilities.config import (
+    DATA_NAMES,
+    CAUSAL_INFLUENCE_TYPES,
+    ROOT_CAUSE_TYPES,
+    WHAT_IF_QUESTION_TYPES,
+    TOOL_APPROXIMATION_LEVEL,
+)
 from agentic_supply.data_assistant.data_downloading import select_target_path, download_data
+from agentic_supply.utilities.execution import tool_executor
 from agentic_supply.utilities.log_utils import set_logging, get_logger
+from agentic_supply.utilities.instrumentation import instrument_tool
 
 
 set_logging()
@@ -22,6 +31,7 @@ class CausalInfluenceQuantificator(CodedTool):
     Implementations are expected to clean up after themselves.
     """
 
+    @instrument_tool
     async def async_invoke(self, args: Dict[str, Any], sly_data: Dict[str, Any]) -> Any:
         """
         Called when the coded tool is invoked asynchronously by the agent hierarchy.
@@ -50,12 +60,15 @@ class CausalInfluenceQuantificator(CodedTool):
         causal_influence_type: CAUSAL_INFLUENCE_TYPES = args.get("causal_influence_type")
         logger.info(f"causal_influence_type from args : {causal_influence_type}")
 
-        causal_analysis = CausalAnalysis(data_name, model_from_file=True)
-
         if causal_influence_type == "arrow":
-            _, _, interpretation = causal_analysis.get_arrow_strength()
+            # served from the result cache of the tool server once computed
+            causal_analysis = await tool_executor.run(CausalAnalysis.from_cache, data_name)
+            _, _, interpretation = await tool_executor.run(causal_analysis.get_arrow_strength)
         elif causal_influence_type == "intrinsic":
-            _, _, interpretation = causal_analysis.get_intrinsic_causal_influence()
+            approximation = Approximation.from_level(TOOL_APPROXIMATION_LEVEL)
+            _, _, interpretation = await tool_executor.run(
+                run_from_cache, data_name, "get_intrinsic_causal_influence", approximation=approximation, in_worker=True
+            )
         else:
             raise ValueError("invalid causal_influence_type")
 
@@ -72,6 +85,7 @@ class RootCauseAnalyser(CodedTool):
     Implementations are expected to clean up after themselves.
     """
 
+    @instrument_tool
     async def async_invoke(self, args: Dict[str, Any], sly_data: Dict[str, Any]) -> Any:
         """
         Called when the coded tool is invoked asynchronously by the agent hierarchy.
@@ -98,24 +112,48 @@ class RootCauseAnalyser(CodedTool):
         data_name: DATA_NAMES = sly_data["data_name"]
         logger.info(f"data_name from sly_data : {data_name}")
         root_cause_type: ROOT_CAUSE_TYPES = args.get("root_cause_type")
-        logger.info(f"root_cause_type from args : {root_cause_type}")
-
-        causal_analysis = CausalAnalysis(data_name, model_from_file=True)
-        data_old = None
-        if data_name == "supply_chain_logistics" and root_cause_type == "distribution_attribution":
-            data_old = causal_analysis.data[causal_analysis.data.week == "w1"]
-            data_new = causal_analysis.data[causal_analysis.data.week == "w2"]
-        elif root_cause_type != "feature_relevance":
+        bulk: bool = bool(args.get("bulk", False))
+        logger.info(f"from args : root_cause_type={root_cause_type}, bulk={bulk}")
+
+        approximation = Approximation.from_level(TOOL_APPROXIMATION_LEVEL)
+        week_over_week = data_name == "supply_chain_logistics" and root_cause_type == "distribution_attribution"
+        if root_cause_type != "feature_relevance" and not week_over_week:
             data_path = select_target_path("openname")
             logger.info(f"data_path selected : {data_path}")
-            data_new = pd.read_csv(data_path)
-
-        if root_cause_type == "anomaly_attributon":
-            _, interpretation = causal_analysis.get_anomaly_attribution(anomalous_data=data_new, bootstrap=True)
+            if not (bulk and root_cause_type == "anomaly_attributon"):
+                data_new = await tool_executor.run(pd.read_csv, data_path)
+
+        if root_cause_type == "anomaly_attributon" and bulk:
+            _, _, interpretation = await tool_executor.run(run_from_cache, data_name, "get_bulk_anomaly_attribution", data_path=data_path, in_worker=True)
+        elif root_cause_type == "anomaly_attributon":
+            _, interpretation = await tool_executor.run(
+                run_from_cache,
+                data_name,
+                "get_anomaly_attribution",
+                anomalous_data=data_new,
+                bootstrap=True,
+                approximation=approximation,
+                in_worker=True,
+            )
+        elif week_over_week:
+            # the data is partitioned by week once, and every pair of consecutive weeks is attributed
+            _, _, interpretation = await tool_executor.run(
+                run_from_cache, data_name, "get_distribution_drift", partition_column="week", approximation=approximation, in_worker=True
+            )
         elif root_cause_type == "distribution_attribution":
-            _, interpretation = causal_analysis.get_distribution_change_attribution(data_new=data_new, data_old=data_old, bootstrap=True)
+            _, interpretation = await tool_executor.run(
+                run_from_cache,
+                data_name,
+                "get_distribution_change_attribution",
+                data_new=data_new,
+                bootstrap=True,
+                approximation=approximation,
+                in_worker=True,
+            )
         elif root_cause_type == "feature_relevance":
-            _, _, interpretation = causal_analysis.get_feature_relevance()
+            # served from the result cache of the tool server once computed
+            causal_analysis = await tool_executor.run(CausalAnalysis.from_cache, data_name)
+            _, _, interpretation = await tool_executor.run(causal_analysis.get_feature_relevance)
         else:
             raise ValueError("invalid root_cause_type")
 
@@ -132,6 +170,7 @@ class WhatIfAnswerer(CodedTool):
     Implementations are expected to clean up after themselves.
     """
 
+    @instrument_tool
     async def async_invoke(self, args: Dict[str, Any], sly_data: Dict[str, Any]) -> Any:
         """
         Called when the coded tool is invoked asynchronously by the agent hierarchy.
@@ -161,15 +200,26 @@ class WhatIfAnswerer(CodedTool):
         intervention_str: str = args.get("intervention_str")
         logger.info(f"from args : what_if_question_type={what_if_question_type}, intervention_str={intervention_str}")
 
-        causal_analysis = CausalAnalysis(data_name, model_from_file=True)
-
         if what_if_question_type == "intervention":
-            df = causal_analysis.generate_interventional_samples(intervention_str=intervention_str)
+            df = await tool_executor.run(run_from_cache, data_name, "generate_interventional_samples", intervention_str=intervention_str, in_worker=True)
         elif what_if_question_type == "counterfactual":
             data_path = select_target_path("openname")
             logger.info(f"data_path selected : {data_path}")
-            data_new = pd.read_csv(data_path)
-            df = causal_analysis.generate_counterfactual_samples(intervention_str=intervention_str, observed_data=data_new)
+            data_new = await tool_executor.run(pd.read_csv, data_path)
+            # the noise of the observed rows is inferred once and cached by the instance of the tool server
+            causal_analysis = await tool_executor.run(CausalAnalysis.from_cache, data_name)
+            scenarios = [elem.strip() for elem in intervention_str.split(";") if elem.strip()]
+            if len(scenarios) > 1:
+                # alternative interventions on the same rows : the noise is inferred once for all of them
+                df, _, interpretation = await tool_executor.run(
+                    causal_analysis.generate_batch_counterfactual_samples, scenarios, observed_data=data_new
+                )
+                df = df.reset_index()
+                logger.info(interpretation)
+            else:
+                df = await tool_executor.run(
+                    causal_analysis.generate_counterfactual_samples, intervention_str=intervention_str, observed_data=data_new
+                )
         else:
             raise ValueError("invalid what_if_question_type")
 
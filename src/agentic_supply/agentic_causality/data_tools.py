@@ -5,6 +5,7 @@ from neuro_san.interfaces.coded_tool import CodedTool
 from agentic_supply.data_assistant.data_downloading import download_data
 from agentic_supply.utilities.config import DATA_NAMES
 from agentic_supply.utilities.log_utils import set_logging, get_logger
+from agentic_supply.utilities.instrumentation import instrument_tool
 
 
 set_logging()
@@ -21,6 +22,7 @@ class DataStorer(CodedTool):
     Implementations are expected to clean up after themselves.
     """
 
+    @instrument_tool
     async def async_invoke(self, args: Dict[str, Any], sly_data: Dict[str, Any]) -> Any:
         """
         Called when the coded tool is invoked asynchronously by the agent hierarchy.
@@ -60,6 +62,7 @@ class DataDownloader(CodedTool):
     Implementations are expected to clean up after themselves.
     """
 
+    @instrument_tool
     async def async_invoke(self, args: Dict[str, Any], sly_data: Dict[str, Any]) -> Any:
         """
         Called when the coded tool is invoked asynchronously by the agent hierarchy.
@@ -4,6 +4,8 @@ from neuro_san.interfaces.coded_tool import CodedTool
 
 from agentic_supply.inventory_assistant.stock_monitoring import get_sites_db, get_products_db
 from agentic_supply.utilities.config import PRODUCT_NAMES
+from agentic_supply.utilities.execution import tool_executor
+from agentic_supply.utilities.instrumentation import instrument_tool
 
 
 class InventoryMonitor(CodedTool):
@@ -16,6 +18,7 @@ class InventoryMonitor(CodedTool):
     Implementations are expected to clean up after themselves.
     """
 
+    @instrument_tool
     async def async_invoke(self, args: Dict[str, Any], sly_data: Dict[str, Any]) -> Any:
         """
         Called when the coded tool is invoked asynchronously by the agent hierarchy.
@@ -41,11 +44,11 @@ class InventoryMonitor(CodedTool):
 
         product_name = args.get("product_name")
         site_name = args.get("site_name")
-        sites_db = get_sites_db()
+        sites_db = await tool_executor.run(get_sites_db)
         sites = [sites_db.get_site(site_name)] if site_name is not None else sites_db.get_sites(product_name)
         replenishment_description_list = []
         for site in sites:
-            replenishment_needed = site.is_replenishment_needed(product_name)
+            replenishment_needed = await tool_executor.run(site.is_replenishment_needed, product_name)
             replenishment_description_list.append(
                 f"product : {product_name}, site : {site.name}, replenishment need : {replenishment_needed}"
             )
@@ -63,6 +66,7 @@ class ProductsQuerier(CodedTool):
     Implementations are expected to clean up after themselves.
     """
 
+    @instrument_tool
     async def async_invoke(self, args: Dict[str, Any], sly_data: Dict[str, Any]) -> Any:
         """
         Called when the coded tool is invoked asynchronously by the agent hierarchy.
@@ -85,7 +89,7 @@ class ProductsQuerier(CodedTool):
                 adding the data is not invoke()-ed more than once.
         :return: A return value that goes into the chat stream.
         """
-        products_db = get_products_db()
+        products_db = await tool_executor.run(get_products_db)
         return products_db.model_dump_json()
 
 
@@ -99,6 +103,7 @@ class SitesQuerier(CodedTool):
     Implementations are expected to clean up after themselves.
     """
 
+    @instrument_tool
     async def async_invoke(self, args: Dict[str, Any], sly_data: Dict[str, Any]) -> Any:
         """
         Called when the coded tool is invoked asynchronously by the agent hierarchy.
@@ -121,5 +126,5 @@ class SitesQuerier(CodedTool):
                 adding the data is not invoke()-ed more than once.
         :return: A return value that goes into the chat stream.
         """
-        sites_db = get_sites_db()
+        sites_db = await tool_executor.run(get_sites_db)
         return sites_db.model_dump_json()
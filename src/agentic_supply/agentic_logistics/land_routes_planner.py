@@ -3,6 +3,8 @@ from neuro_san.interfaces.coded_tool import CodedTool
 
 
 from agentic_supply.carrier_assistant.transit_querying import get_land_routes_db
+from agentic_supply.utilities.execution import tool_executor
+from agentic_supply.utilities.instrumentation import instrument_tool
 
 
 class LandRoutesPlanner(CodedTool):
@@ -15,6 +17,7 @@ class LandRoutesPlanner(CodedTool):
     Implementations are expected to clean up after themselves.
     """
 
+    @instrument_tool
     async def async_invoke(self, args: Dict[str, Any], sly_data: Dict[str, Any]) -> Any:
         """
         Called when the coded tool is invoked asynchronously by the agent hierarchy.
@@ -41,6 +44,6 @@ class LandRoutesPlanner(CodedTool):
         origin = args.get("origin_location")
         destination = args.get("destination_location")
         transport_mode = args.get("transport_mode")
-        land_routes_db = get_land_routes_db()
+        land_routes_db = await tool_executor.run(get_land_routes_db)
         routes = land_routes_db.get_routes(origin, destination, transport_mode)
         return str(routes)
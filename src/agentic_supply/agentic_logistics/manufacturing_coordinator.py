@@ -4,6 +4,8 @@ from neuro_san.interfaces.coded_tool import CodedTool
 
 from agentic_supply.manufacturing_assistant.scheduling_notifying import get_order_db, Order
 from agentic_supply.utilities.config import PRODUCT_NAMES
+from agentic_supply.utilities.execution import tool_executor
+from agentic_supply.utilities.instrumentation import instrument_tool
 
 
 class ManufacturingScheduler(CodedTool):
@@ -16,6 +18,7 @@ class ManufacturingScheduler(CodedTool):
     Implementations are expected to clean up after themselves.
     """
 
+    @instrument_tool
     async def async_invoke(self, args: Dict[str, Any], sly_data: Dict[str, Any]) -> Any:
         """
         Called when the coded tool is invoked asynchronously by the agent hierarchy.
@@ -66,6 +69,7 @@ class ManufacturingCompletionVerifier(CodedTool):
     Implementations are expected to clean up after themselves.
     """
 
+    @instrument_tool
     async def async_invoke(self, args: Dict[str, Any], sly_data: Dict[str, Any]) -> Any:
         """
         Called when the coded tool is invoked asynchronously by the agent hierarchy.
@@ -90,7 +94,7 @@ class ManufacturingCompletionVerifier(CodedTool):
         """
 
         order_id = args.get("order_id")
-        order_db = get_order_db()
+        order_db = await tool_executor.run(get_order_db)
         order = order_db.get_order(order_id)
         status, remaining_time = order.verify_completion_status()
         return f"The order of {order.product_name} in {order.site_name} ({order_id}) is {status} {'' if status == 'complete' else f'({remaining_time} seconds left)'}"
@@ -3,6 +3,8 @@ from neuro_san.interfaces.coded_tool import CodedTool
 
 
 from agentic_supply.carrier_assistant.transit_querying import get_ocean_routes_db
+from agentic_supply.utilities.execution import tool_executor
+from agentic_supply.utilities.instrumentation import instrument_tool
 
 
 class OceanRoutesPlanner(CodedTool):
@@ -15,6 +17,7 @@ class OceanRoutesPlanner(CodedTool):
     Implementations are expected to clean up after themselves.
     """
 
+    @instrument_tool
     async def async_invoke(self, args: Dict[str, Any], sly_data: Dict[str, Any]) -> Any:
         """
         Called when the coded tool is invoked asynchronously by the agent hierarchy.
@@ -40,6 +43,6 @@ class OceanRoutesPlanner(CodedTool):
 
         origin = args.get("start_port")  # origin is causing an issue, the tool is passed other data than the clearly prompted data
         destination = args.get("destination_port")
-        ocean_routes_db = get_ocean_routes_db()
+        ocean_routes_db = await tool_executor.run(get_ocean_routes_db)
         routes = ocean_routes_db.get_routes(origin, destination)
         return str(routes)
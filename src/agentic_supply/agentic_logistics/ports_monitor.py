@@ -3,6 +3,8 @@ from neuro_san.interfaces.coded_tool import CodedTool
 
 
 from agentic_supply.carrier_assistant.transit_querying import get_ports_db
+from agentic_supply.utilities.execution import tool_executor
+from agentic_supply.utilities.instrumentation import instrument_tool
 
 
 class PortsMonitor(CodedTool):
@@ -15,6 +17,7 @@ class PortsMonitor(CodedTool):
     Implementations are expected to clean up after themselves.
     """
 
+    @instrument_tool
     async def async_invoke(self, args: Dict[str, Any], sly_data: Dict[str, Any]) -> Any:
         """
         Called when the coded tool is invoked asynchronously by the agent hierarchy.
@@ -37,7 +40,7 @@ class PortsMonitor(CodedTool):
                 adding the data is not invoke()-ed more than once.
         :return: A return value that goes into the chat stream.
         """
-        ports_db = get_ports_db()
+        ports_db = await tool_executor.run(get_ports_db)
         handling_time_threshold = 3
         report_list = []
         for port in ports_db.ports:
@@ -59,6 +62,7 @@ class PortsQuerier(CodedTool):
     Implementations are expected to clean up after themselves.
     """
 
+    @instrument_tool
     async def async_invoke(self, args: Dict[str, Any], sly_data: Dict[str, Any]) -> Any:
         """
         Called when the coded tool is invoked asynchronously by the agent hierarchy.
@@ -81,5 +85,5 @@ class PortsQuerier(CodedTool):
                 adding the data is not invoke()-ed more than once.
         :return: A return value that goes into the chat stream.
         """
-        ports_db = get_ports_db()
+        ports_db = await tool_executor.run(get_ports_db)
         return ports_db.model_dump_json()
@@ -5,6 +5,8 @@ from neuro_san.interfaces.coded_tool import CodedTool
 from agentic_supply.carrier_assistant.shipment_routing import get_shipments_db, Shipment, ShipmentRoute
 from agentic_supply.carrier_assistant.transit_querying import get_land_routes_db, get_ocean_routes_db
 from agentic_supply.utilities.config import PRODUCT_NAMES
+from agentic_supply.utilities.execution import tool_executor
+from agentic_supply.utilities.instrumentation import instrument_tool
 
 
 class ShipmentPlanner(CodedTool):
@@ -17,6 +19,7 @@ class ShipmentPlanner(CodedTool):
     Implementations are expected to clean up after themselves.
     """
 
+    @instrument_tool
     async def async_invoke(self, args: Dict[str, Any], sly_data: Dict[str, Any]) -> Any:
         """
         Called when the coded tool is invoked asynchronously by the agent hierarchy.
@@ -43,8 +46,8 @@ class ShipmentPlanner(CodedTool):
         land_routes_ids: str = args.get("land_routes_ids")
         ocean_routes_ids: str = args.get("ocean_routes_ids")
 
-        land_routes_db = get_land_routes_db()
-        ocean_routes_db = get_ocean_routes_db()
+        land_routes_db = await tool_executor.run(get_land_routes_db)
+        ocean_routes_db = await tool_executor.run(get_ocean_routes_db)
         land_routes = [land_routes_db.get_route(id=elem.strip()) for elem in land_routes_ids.split(",")]
         ocean_routes = [ocean_routes_db.get_route(id=elem.strip()) for elem in ocean_routes_ids.split(",")]
 
@@ -65,6 +68,7 @@ class ShipmentQuerier(CodedTool):
     Implementations are expected to clean up after themselves.
     """
 
+    @instrument_tool
     async def async_invoke(self, args: Dict[str, Any], sly_data: Dict[str, Any]) -> Any:
         """
         Called when the coded tool is invoked asynchronously by the agent hierarchy.
@@ -87,5 +91,5 @@ class ShipmentQuerier(CodedTool):
                 adding the data is not invoke()-ed more than once.
         :return: A return value that goes into the chat stream.
         """
-        shipments_db = get_shipments_db()
+        shipments_db = await tool_executor.run(get_shipments_db)
         return shipments_db.model_dump_json()
@@ -0,0 +1,311 @@
+"""
+Benchmark of the CausalAnalysis operations across data sizes and graph sizes.
+
+Every case is a graph form with its data : the packaged data of a DATA_TO_GRAPH_FORM dataset, or synthetic data drawn
+from a linear Gaussian model over the graph form of a dataset, scaled to a given number of rows.
+For each operation, the wall time, the peak resident memory of the process and the throughput (rows per second) are
+recorded in a JSON report, and compared against a stored baseline : an operation regresses when it is slower or uses more
+memory than its baseline by more than the tolerance. The process exits with a non-zero code on any regression or error.
+Peak memory only covers the benchmark process, not the worker processes of the parallel operations.
+The mechanism selection, evaluation and result caches are disabled by default, so that a rerun measures the work
+rather than cache hits.
+
+Examples :
+    python -m agentic_supply.benchmarks.causal_analysis --datasets mini_data online_shop_data
+    python -m agentic_supply.benchmarks.causal_analysis --synthetic microservices_latencies --sizes 1000 10000 --operations fit get_arrow_strength
+    python -m agentic_supply.benchmarks.causal_analysis --datasets mini_data --save-baseline
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+from agentic_supply.utilities.config import (
+    BENCHMARK_DIR,
+    BENCHMARK_MIN_RSS_DELTA_MB,
+    BENCHMARK_MIN_WALL_TIME_DELTA_S,
+    BENCHMARK_REGRESSION_TOLERANCE,
+    BENCHMARK_SIZES,
+    DATA_TO_TARGET,
+    RANDOM_SEED,
+)
+from agentic_supply.utilities.instrumentation import get_rss_mb
+from agentic_supply.utilities.log_utils import set_logging, get_logger
+
+
+set_logging()
+logger = get_logger(__name__)
+
+
+OPERATIONS = [
+    "fit",
+    "evaluate",
+    "generate_data",
+    "generate_interventional_samples",
+    "generate_counterfactual_samples",
+    "get_average_causal_effect",
+    "get_arrow_strength",
+    "get_intrinsic_causal_influence",
+    "get_anomaly_attribution",
+    "get_distribution_change_attribution",
+    "get_feature_relevance",
+]
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, "causal_analysis_baseline.json")
+
+
+class PeakMemorySampler:
+    """
+    Samples the resident memory of the process in a background thread, while the block runs.
+
+    Examples :
+    >>> with PeakMemorySampler() as sampler:
+    ...     causal_analysis.fit()
+    >>> sampler.peak_mb, sampler.start_mb
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.start_mb = 0.0
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak_mb = max(self.peak_mb, get_rss_mb())
+
+    def __enter__(self) -> "PeakMemorySampler":
+        self.start_mb = self.peak_mb = get_rss_mb()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, get_rss_mb())
+
+
+def generate_synthetic_data(form: List[Tuple], num_rows: int, seed: Optional[int] = RANDOM_SEED) -> pd.DataFrame:
+    """
+    Linear Gaussian data over the graph form : each node is a weighted sum of its parents plus a standard Gaussian noise.
+    Examples :
+    >>> data = generate_synthetic_data([("X", "Y"), ("Y", "Z")], 10**6)
+    """
+    import networkx as nx
+
+    graph = nx.DiGraph(form)
+    rng = np.random.default_rng(seed)
+    columns: Dict[str, np.ndarray] = {}
+    for node in nx.topological_sort(graph):
+        values = rng.standard_normal(num_rows)
+        for parent in graph.predecessors(node):
+            values += rng.uniform(0.5, 2.0) * columns[parent] / np.sqrt(graph.in_degree(node))
+        columns[node] = values
+    return pd.DataFrame(columns)
+
+
+def _get_root(causal_analysis) -> str:
+    import networkx as nx
+
+    return next(node for node in nx.topological_sort(causal_analysis.model.graph) if causal_analysis.model.graph.in_degree(node) == 0)
+
+
+def get_operations(causal_analysis, task_rows: int) -> Dict[str, Tuple[Callable, int]]:
+    """
+    Each operation as a call without arguments, with the number of rows it processes (for the throughput).
+    """
+    data = causal_analysis.data
+    root = _get_root(causal_analysis)
+    task_data = data.sample(min(task_rows, len(data)), random_state=RANDOM_SEED)
+    shifted_data = task_data.copy()
+    shifted_data[root] = shifted_data[root] + shifted_data[root].std()
+    return {
+        "fit": (causal_analysis.fit, len(data)),
+        "evaluate": (causal_analysis.evaluate, len(data)),
+        "generate_data": (lambda: causal_analysis.generate_data(num_samples=task_rows), task_rows),
+        "generate_interventional_samples": (
+            lambda: causal_analysis.generate_interventional_samples(intervention_str=f"{root} : x + 0.5", num_samples=task_rows),
+            task_rows,
+        ),
+        "generate_counterfactual_samples": (
+            lambda: causal_analysis.generate_counterfactual_samples(intervention_str=f"{root} : x + 0.5", observed_data=task_data),
+            len(task_data),
+        ),
+        "get_average_causal_effect": (
+            lambda: causal_analysis.get_average_causal_effect(interventions_alternative=f"{root} : 1", interventions_reference=f"{root} : 0"),
+            len(data),
+        ),
+        "get_arrow_strength": (causal_analysis.get_arrow_strength, len(data)),
+        "get_intrinsic_causal_influence": (causal_analysis.get_intrinsic_causal_influence, len(data)),
+        "get_anomaly_attribution": (lambda: causal_analysis.get_anomaly_attribution(task_data.head(10)), 10),
+        "get_distribution_change_attribution": (
+            lambda: causal_analysis.get_distribution_change_attribution(data_new=shifted_data, data_old=task_data),
+            2 * len(task_data),
+        ),
+        "get_feature_relevance": (causal_analysis.get_feature_relevance, len(data)),
+    }
+
+
+def run_case(
+    data_name: str,
+    num_rows: Optional[int] = None,
+    operations: Optional[List[str]] = None,
+    task_rows: int = 1000,
+    approximation: Optional[str] = None,
+    use_cache: bool = False,
+) -> Dict[str, Dict]:
+    """
+    Benchmarks the operations on the packaged data of data_name, or on synthetic data over its graph form when num_rows is given.
+    The model is fitted first when fit is not benchmarked, since the other operations need a fitted model.
+    Examples :
+    >>> results = run_case("mini_data", operations=["fit", "get_arrow_strength"])
+    >>> results = run_case("microservices_latencies", num_rows=10**5, operations=["fit"])
+    """
+    from agentic_supply.causality_assistant.approximation import Approximation
+    from agentic_supply.causality_assistant.causal_analysis import CausalAnalysis
+    from agentic_supply.causality_assistant.causal_graph import CausalGraph
+
+    operations = operations or OPERATIONS
+    causal_graph = CausalGraph(data_name)
+    causal_analysis = CausalAnalysis(data_name, causal_graph)
+    causal_analysis.use_cache = use_cache
+    if num_rows is not None:
+        causal_analysis.data = generate_synthetic_data(causal_graph.form, num_rows)
+    if approximation is not None:
+        causal_analysis.approximation = Approximation.from_level(approximation)
+    if "fit" not in operations:
+        causal_analysis.fit()
+    calls = get_operations(causal_analysis, task_rows)
+
+    results = {}
+    for operation in operations:
+        call, operation_rows = calls[operation]
+        logger.info(f"Benchmarking {operation} on {data_name} ({len(causal_analysis.data)} rows)")
+        error = None
+        with PeakMemorySampler() as sampler:
+            start = time.perf_counter()
+            try:
+                call()
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                logger.warning(f"{operation} failed on {data_name} : {error}")
+            wall_time = time.perf_counter() - start
+        results[operation] = dict(
+            wall_time=wall_time,
+            peak_rss_mb=sampler.peak_mb,
+            rss_increase_mb=sampler.peak_mb - sampler.start_mb,
+            rows=operation_rows,
+            throughput=operation_rows / wall_time if wall_time > 0 else None,
+            error=error,
+        )
+    return results
+
+
+def get_case_name(data_name: str, num_rows: Optional[int] = None) -> str:
+    return data_name if num_rows is None else f"synthetic_{data_name}_{num_rows}"
+
+
+def run_benchmark(
+    datasets: List[str],
+    synthetic: List[str],
+    sizes: List[int] = BENCHMARK_SIZES,
+    operations: Optional[List[str]] = None,
+    task_rows: int = 1000,
+    approximation: Optional[str] = None,
+    use_cache: bool = False,
+) -> Dict:
+    cases = [(data_name, None) for data_name in datasets] + [(data_name, num_rows) for data_name in synthetic for num_rows in sizes]
+    report = dict(
+        created_at=datetime.now(timezone.utc).isoformat(),
+        platform=dict(python=platform.python_version(), machine=platform.machine(), cpu_count=os.cpu_count()),
+        approximation=approximation,
+        use_cache=use_cache,
+        cases={},
+    )
+    for data_name, num_rows in cases:
+        if not DATA_TO_TARGET.get(data_name):
+            logger.warning(f"Skipping {data_name}, which has no target")
+            continue
+        report["cases"][get_case_name(data_name, num_rows)] = run_case(data_name, num_rows, operations, task_rows, approximation, use_cache)
+    return report
+
+
+def compare_to_baseline(report: Dict, baseline: Dict, tolerance: float = BENCHMARK_REGRESSION_TOLERANCE) -> List[str]:
+    """
+    Regressions of the report against the baseline, for the operations measured in both.
+    Small absolute differences are ignored, as they are dominated by noise.
+    """
+    regressions = []
+    for case, results in report["cases"].items():
+        for operation, result in results.items():
+            reference = baseline.get("cases", {}).get(case, {}).get(operation)
+            if reference is None or reference.get("error") or result["error"]:
+                continue
+            time_delta = result["wall_time"] - reference["wall_time"]
+            if result["wall_time"] > reference["wall_time"] * (1 + tolerance) and time_delta > BENCHMARK_MIN_WALL_TIME_DELTA_S:
+                regressions.append(f"{case} {operation} : wall time {result['wall_time']:.3f}s vs {reference['wall_time']:.3f}s in the baseline")
+            rss_delta = result["rss_increase_mb"] - reference["rss_increase_mb"]
+            if result["rss_increase_mb"] > reference["rss_increase_mb"] * (1 + tolerance) and rss_delta > BENCHMARK_MIN_RSS_DELTA_MB:
+                regressions.append(
+                    f"{case} {operation} : memory increase {result['rss_increase_mb']:.1f}MB vs {reference['rss_increase_mb']:.1f}MB in the baseline"
+                )
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--datasets", nargs="*", default=None, help="Datasets benchmarked on their packaged data, all by default")
+    parser.add_argument("--synthetic", nargs="*", default=[], help="Datasets whose graph form is benchmarked on synthetic data")
+    parser.add_argument("--sizes", nargs="*", type=int, default=BENCHMARK_SIZES, help="Numbers of rows of the synthetic data")
+    parser.add_argument("--operations", nargs="*", default=None, choices=OPERATIONS)
+    parser.add_argument("--task-rows", type=int, default=1000, help="Rows drawn or used by the sampling and attribution operations")
+    parser.add_argument("--approximation", default=None, help="Approximation level of the Shapley-based operations")
+    parser.add_argument("--use-cache", action="store_true", help="Benchmark with the mechanism selection, evaluation and result caches")
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=BENCHMARK_REGRESSION_TOLERANCE)
+    args = parser.parse_args()
+
+    from agentic_supply.causality_assistant.causal_graph import DATA_TO_GRAPH_FORM
+
+    datasets = args.datasets if args.datasets is not None else list(DATA_TO_GRAPH_FORM)
+    report = run_benchmark(datasets, args.synthetic, args.sizes, args.operations, args.task_rows, args.approximation, args.use_cache)
+    output = args.output or os.path.join(BENCHMARK_DIR, f"causal_analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=4)
+
+    errors = []
+    for case, results in report["cases"].items():
+        for operation, result in results.items():
+            throughput = f"{result['throughput']:.0f} rows/s" if result["throughput"] is not None else "-"
+            status = "FAIL" if result["error"] else "OK"
+            print(f"{status:4} {case} {operation} : {result['wall_time']:.3f}s, peak {result['peak_rss_mb']:.0f}MB, {throughput}")
+            if result["error"]:
+                errors.append(f"{case} {operation} : {result['error']}")
+    print(f"Report saved at {output}")
+
+    regressions = []
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=4)
+        print(f"Baseline saved at {args.baseline}")
+    elif os.path.isfile(args.baseline):
+        with open(args.baseline, "r") as f:
+            regressions = compare_to_baseline(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+    else:
+        print(f"No baseline at {args.baseline}, run with --save-baseline to store one")
+    sys.exit(0 if not regressions and not errors else 1)
@@ -0,0 +1,79 @@
+"""
+Import-time benchmark of the CodedTool modules.
+
+neuro-san imports every CodedTool module of the served networks at startup, so each module is imported in a fresh
+interpreter with `python -X importtime`, and its cumulative import time is checked against its budget.
+The process exits with a non-zero code when any module exceeds its budget.
+
+Examples :
+    python -m agentic_supply.benchmarks.import_time
+    python -m agentic_supply.benchmarks.import_time --budget 1.5 --repeat 5
+"""
+
+import argparse
+import re
+import subprocess
+import sys
+from importlib.resources import files
+from typing import Dict, List, Optional
+
+import agentic_supply
+from agentic_supply.utilities.config import IMPORT_TIME_BUDGET_S, IMPORT_TIME_BUDGETS_S
+
+
+TOOL_PACKAGES = ["agentic_causality", "agentic_logistics"]
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S+)\s*$")
+
+
+def get_tool_modules() -> List[str]:
+    modules = []
+    for package in TOOL_PACKAGES:
+        for resource in sorted(files(agentic_supply).joinpath(package).iterdir(), key=lambda elem: elem.name):
+            if resource.name.endswith(".py") and resource.name != "__init__.py":
+                modules.append(f"agentic_supply.{package}.{resource.name[:-3]}")
+    return modules
+
+
+def measure_import_time(module: str) -> float:
+    """
+    Cumulative import time of the module in seconds, measured in a fresh interpreter.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise ImportError(f"Could not import {module} :\n{result.stderr.strip().splitlines()[-1]}")
+    for line in reversed(result.stderr.splitlines()):
+        match = IMPORTTIME_LINE.match(line)
+        if match and match.group(3) == module:
+            return int(match.group(2)) / 1e6
+    raise ValueError(f"No import time found for {module}")
+
+
+def check_import_times(modules: Optional[List[str]] = None, budget: Optional[float] = None, repeat: int = 3) -> Dict[str, Dict]:
+    """
+    Examples :
+    >>> report = check_import_times(["agentic_supply.agentic_causality.data_tools"])
+    """
+    report = {}
+    for module in modules or get_tool_modules():
+        module_budget = budget if budget is not None else IMPORT_TIME_BUDGETS_S.get(module, IMPORT_TIME_BUDGET_S)
+        try:
+            # the best of several runs, to be robust to a cold file system cache
+            import_time = min(measure_import_time(module) for _ in range(repeat))
+            report[module] = dict(import_time=import_time, budget=module_budget, passed=import_time <= module_budget, error=None)
+        except (ImportError, ValueError) as e:
+            report[module] = dict(import_time=None, budget=module_budget, passed=False, error=str(e))
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modules", nargs="*", default=None)
+    parser.add_argument("--budget", type=float, default=None, help="Budget in seconds, overriding the configured budgets")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    report = check_import_times(args.modules, args.budget, args.repeat)
+    for module, result in report.items():
+        status = "OK" if result["passed"] else "FAIL"
+        measured = f"{result['import_time']:.3f}s" if result["import_time"] is not None else result["error"]
+        print(f"{status:4} {module} : {measured} (budget {result['budget']:.3f}s)")
+    sys.exit(0 if all(result["passed"] for result in report.values()) else 1)
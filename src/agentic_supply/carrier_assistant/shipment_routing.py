@@ -11,6 +11,7 @@ import time
 
 from agentic_supply import data
 from agentic_supply.utilities.log_utils import set_logging, get_logger
+from agentic_supply.utilities.instrumentation import instrument
 from agentic_supply.utilities.config import PRODUCT_NAMES, DESTINATIONS, ARTIFACTS_DIR
 from agentic_supply.carrier_assistant.transit_querying import LandRoute, OceanRoute
 
@@ -53,6 +54,7 @@ class ShipmentsDB(BaseModel):
     def get_shipment(self, id: str) -> Shipment:
         return next((elem for elem in self.shipments if elem.id == id))
 
+    @instrument("json_db_write")
     def save(self):
         with open(SHIPMENT_DB_PATH, "w") as f:
             f.write(self.model_dump_json(indent=4))
@@ -62,6 +64,7 @@ class ShipmentsDB(BaseModel):
         self.save()
 
 
+@instrument("json_db_read")
 def get_shipments_db():
     with open(SHIPMENT_DB_PATH, "r") as f:
         json_data = f.read()
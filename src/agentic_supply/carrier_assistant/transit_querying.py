@@ -8,6 +8,7 @@ from importlib.resources import files
 
 from agentic_supply import data
 from agentic_supply.utilities.log_utils import set_logging, get_logger
+from agentic_supply.utilities.instrumentation import instrument
 
 
 set_logging()
@@ -30,6 +31,7 @@ class PortsDB(BaseModel):
         return next((elem for elem in self.ports if elem.name == name))
 
 
+@instrument("json_db_read")
 def get_ports_db():
     json_data = files(data).joinpath("ports.json").read_text()
     return PortsDB.model_validate_json(json_data)
@@ -65,6 +67,7 @@ class OceanRoutesDB(BaseModel):
         return next((elem for elem in self.ocean_routes if elem.id == id))
 
 
+@instrument("json_db_read")
 def get_ocean_routes_db():
     json_data = files(data).joinpath("ocean_routes.json").read_text()
     return OceanRoutesDB.model_validate_json(json_data)
@@ -98,6 +101,7 @@ class LandRoutesDB(BaseModel):
         return next((elem for elem in self.land_routes if elem.id == id))
 
 
+@instrument("json_db_read")
 def get_land_routes_db():
     json_data = files(data).joinpath("land_routes.json").read_text()
     return LandRoutesDB.model_validate_json(json_data)
@@ -0,0 +1,116 @@
+"""
+Speed / accuracy settings of the Shapley-based causal tasks (intrinsic causal influence, anomaly attribution, distribution change).
+
+Their cost grows with the number of ancestors of the target : the exact Shapley values need all the subsets of ancestors,
+and each subset is evaluated with Monte Carlo samples. An approximation level picks the Shapley estimator and the sample budgets :
+- "auto" : dowhy's defaults (exact Shapley values up to 5 nodes, permutation sampling above)
+- "exact" : exact Shapley values
+- "permutation" : Shapley values from num_permutations random orderings of the nodes
+- "early_stopping" : permutation sampling stopped when the values change less than min_percentage_change_threshold
+
+Except for "auto", the estimation is split in two independent halves of the budget, whose spread gives an error estimate
+without extra cost when the sample budgets are set (the task's default number of samples is used by both halves otherwise).
+The CodedTools answer with TOOL_APPROXIMATION_LEVEL ("permutation" by default), the other callers with APPROXIMATION_LEVEL.
+
+References :
+    https://www.pywhy.org/dowhy/v0.13/user_guide/causal_tasks/quantify_causal_influence/icc.html
+"""
+
+from typing import Callable, Dict, Literal, Optional, Tuple, TYPE_CHECKING
+import numpy as np
+from pydantic import BaseModel, Field
+
+from agentic_supply.utilities.config import APPROXIMATION_LEVEL, RANDOM_SEED
+from agentic_supply.utilities.random_utils import seeded_random_state
+
+if TYPE_CHECKING:
+    from dowhy.gcm.shapley import ShapleyConfig
+
+
+APPROXIMATION_LEVELS = Literal["auto", "exact", "permutation", "early_stopping"]
+
+
+class Approximation(BaseModel):
+    """
+    Examples :
+    >>> approximation = Approximation.from_level("permutation", num_permutations=6)
+    >>> causal_analysis.approximation = approximation
+    >>> node_contributions, _, interpretation = causal_analysis.get_intrinsic_causal_influence()
+    """
+
+    level: APPROXIMATION_LEVELS = Field(default="auto")
+    num_permutations: int = Field(default=25, ge=2, description="Number of node orderings sampled for the Shapley values")
+    min_percentage_change_threshold: float = Field(default=0.05, description="Relative change stopping the early stopping estimator")
+    num_samples: Optional[int] = Field(default=None, ge=2, description="Monte Carlo samples per evaluation, the task's default if None")
+    num_training_samples: Optional[int] = Field(default=None, ge=2, description="Samples to train the intrinsic influence model on, the default if None")
+
+    @classmethod
+    def from_level(cls, level: APPROXIMATION_LEVELS = APPROXIMATION_LEVEL, **budgets) -> "Approximation":
+        return cls(level=level, **{**APPROXIMATION_PRESETS[level], **budgets})
+
+    def get_shapley_config(self) -> Optional["ShapleyConfig"]:
+        from dowhy.gcm.shapley import ShapleyConfig, ShapleyApproximationMethods
+
+        if self.level == "auto":
+            return None
+        method = {
+            "exact": ShapleyApproximationMethods.EXACT,
+            "permutation": ShapleyApproximationMethods.PERMUTATION,
+            "early_stopping": ShapleyApproximationMethods.EARLY_STOPPING,
+        }[self.level]
+        return ShapleyConfig(
+            approximation_method=method,
+            num_permutations=self.num_permutations,
+            min_percentage_change_threshold=self.min_percentage_change_threshold,
+        )
+
+    def get_half(self) -> "Approximation":
+        """
+        The same settings with half of the budgets, for one of the two halves of the split-half estimate.
+        """
+        return self.model_copy(
+            update=dict(
+                num_permutations=max(2, self.num_permutations // 2),
+                num_samples=max(2, self.num_samples // 2) if self.num_samples is not None else None,
+                num_training_samples=max(2, self.num_training_samples // 2) if self.num_training_samples is not None else None,
+            )
+        )
+
+    def estimate(self, estimation_func: Callable[["Approximation"], Dict], seed: Optional[int] = RANDOM_SEED) -> Tuple[Dict, Optional[Dict]]:
+        """
+        Runs estimation_func with these settings, and returns the estimated scores per node and their estimated errors
+        (None for "auto"). The error of a node is half the difference between the two half-budget estimates,
+        a rough estimate of the standard error of their mean.
+        """
+        if self.level == "auto":
+            return estimation_func(self), None
+        half = self.get_half()
+        estimates = []
+        for child in np.random.SeedSequence(seed).spawn(2):
+            with seeded_random_state(int(child.generate_state(1)[0] & np.iinfo(np.int32).max)):
+                estimates.append({node: float(np.mean(value)) for node, value in estimation_func(half).items()})
+        scores = {node: (estimates[0][node] + estimates[1][node]) / 2 for node in estimates[0]}
+        errors = {node: abs(estimates[0][node] - estimates[1][node]) / 2 for node in estimates[0]}
+        return scores, errors
+
+    def describe(self, scores: Dict, errors: Optional[Dict]) -> str:
+        if errors is None:
+            return f"Approximation level : {self.level} (no error estimate)."
+        max_error = max(errors.values(), default=0.0)
+        max_score = max((abs(score) for score in scores.values()), default=0.0)
+        relative_error = f" ({max_error / max_score * 100:.1f} % of the largest score)" if max_score > 0 else ""
+        permutations = "" if self.level == "exact" else f"{self.num_permutations} permutations and "
+        return (
+            f"Approximation level : {self.level}, with {permutations}"
+            f"{self.num_samples if self.num_samples is not None else 'the default number of'} samples. "
+            f"Estimated error per node (split-half) : { {node: round(error, 6) for node, error in errors.items()} }, "
+            f"at most {max_error:.4g}{relative_error}."
+        )
+
+
+APPROXIMATION_PRESETS: Dict[str, Dict] = {
+    "auto": dict(),
+    "exact": dict(),
+    "permutation": dict(num_permutations=10, num_samples=500, num_training_samples=10000),
+    "early_stopping": dict(num_permutations=10, min_percentage_change_threshold=0.05, num_samples=500, num_training_samples=10000),
+}
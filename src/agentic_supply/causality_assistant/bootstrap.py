@@ -0,0 +1,107 @@
+"""
+Parallel bootstrap engine for the confidence intervals of causal queries.
+
+Mirrors gcm.confidence_intervals, but derives one deterministic seed per resample from a single root seed,
+and spreads the resamples over a process pool. Since every resample only depends on its own seed,
+the results of the parallel path are identical to those of the serial path for a given seed.
+
+References :
+    https://www.pywhy.org/dowhy/v0.13/user_guide/modeling_gcm/estimating_confidence_intervals.html
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+import numpy as np
+
+from agentic_supply.utilities.config import BOOTSTRAP_NUM_WORKERS, BOOTSTRAP_NUM_RESAMPLES, RANDOM_SEED
+from agentic_supply.utilities.log_utils import set_logging, get_logger
+from agentic_supply.utilities.parallel import configure_pool_worker, get_num_workers
+from agentic_supply.utilities.random_utils import seeded_random_state
+
+
+set_logging()
+logger = get_logger(__name__)
+
+
+def _estimate_with_seed(estimation_func: Callable[[], Any], seed: int, in_worker: bool = False) -> Any:
+    if in_worker:
+        configure_pool_worker()
+    with seeded_random_state(seed):
+        return estimation_func()
+
+
+def _estimate_percentile_bounds(samples: np.ndarray, confidence_level: float) -> np.ndarray:
+    return np.array([np.percentile(samples, (1 - confidence_level) * 100), np.percentile(samples, confidence_level * 100)])
+
+
+class BootstrapExecutor:
+    """
+    Runs bootstrap resamples of an estimation function, serially or across a process pool.
+
+    Examples :
+    >>> from dowhy import gcm
+    >>> executor = BootstrapExecutor(num_workers=4, num_bootstrap_resamples=10, seed=0)
+    >>> median, intervals = executor.confidence_intervals(gcm.fit_and_compute(gcm.arrow_strength, model, data, target_node="Z"))
+    """
+
+    def __init__(
+        self,
+        num_workers: int = BOOTSTRAP_NUM_WORKERS,
+        num_bootstrap_resamples: int = BOOTSTRAP_NUM_RESAMPLES,
+        seed: Optional[int] = RANDOM_SEED,
+        confidence_level: float = 0.95,
+    ):
+        if num_bootstrap_resamples < 1:
+            raise ValueError(f"num_bootstrap_resamples should be greater than 0, got {num_bootstrap_resamples}")
+        self.num_workers = max(1, num_workers)
+        self.num_bootstrap_resamples = num_bootstrap_resamples
+        self.seed = seed
+        self.confidence_level = confidence_level
+
+    def get_seeds(self, num_bootstrap_resamples: Optional[int] = None) -> List[int]:
+        """
+        One independent seed per resample, spawned from the root seed (fresh entropy when the root seed is None).
+        """
+        num_bootstrap_resamples = num_bootstrap_resamples or self.num_bootstrap_resamples
+        seed_sequence = np.random.SeedSequence(self.seed)
+        return [int(child.generate_state(1)[0] & np.iinfo(np.int32).max) for child in seed_sequence.spawn(num_bootstrap_resamples)]
+
+    def run(self, estimation_func: Callable[[], Any], num_bootstrap_resamples: Optional[int] = None) -> List[Any]:
+        """
+        Returns the raw results of every resample, in resample order.
+        The estimation function is shipped to the workers with cloudpickle (via joblib), so closures are supported.
+        """
+        from joblib import Parallel, delayed
+
+        seeds = self.get_seeds(num_bootstrap_resamples)
+        num_workers = min(get_num_workers(self.num_workers), len(seeds))
+        logger.info(f"Running {len(seeds)} bootstrap resamples on {num_workers} worker(s) with root seed {self.seed}")
+        if num_workers == 1:
+            return [_estimate_with_seed(estimation_func, seed) for seed in seeds]
+        return Parallel(n_jobs=num_workers, backend="loky")(
+            delayed(_estimate_with_seed)(estimation_func, seed, in_worker=True) for seed in seeds
+        )
+
+    def confidence_intervals(
+        self, estimation_func: Callable[[], Union[np.ndarray, Dict[Any, float]]], num_bootstrap_resamples: Optional[int] = None
+    ) -> Tuple[Union[np.ndarray, Dict[Any, np.ndarray]], Union[np.ndarray, Dict[Any, np.ndarray]]]:
+        """
+        Same outputs as gcm.confidence_intervals : the geometric median of the results and the percentile bounds per variable.
+        """
+        from dowhy.gcm.confidence_intervals import estimate_geometric_median
+        from dowhy.gcm.util.general import shape_into_2d
+
+        all_results = self.run(estimation_func, num_bootstrap_resamples)
+        if isinstance(all_results[0], dict):
+            results_per_key: Dict[Any, List[float]] = {}
+            for result in all_results:
+                for key, value in result.items():
+                    results_per_key.setdefault(key, []).append(value)
+            summary = estimate_geometric_median(np.column_stack(list(results_per_key.values())))
+            return {key: summary[i] for i, key in enumerate(results_per_key)}, {
+                key: _estimate_percentile_bounds(np.array(values).squeeze(), self.confidence_level)
+                for key, values in results_per_key.items()
+            }
+        all_results = shape_into_2d(np.array(all_results))
+        return estimate_geometric_median(all_results), np.array(
+            [_estimate_percentile_bounds(all_results[:, i], self.confidence_level) for i in range(all_results.shape[1])]
+        )
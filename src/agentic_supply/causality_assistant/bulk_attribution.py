@@ -0,0 +1,139 @@
+"""
+Bulk anomaly attribution over whole files.
+
+The anomalous file is streamed in chunks, every row is attributed in a worker pool, and the per-row attributions
+are appended to a CSV as soon as their chunk is done. Only a bounded number of chunks is in flight at any time,
+so peak memory does not depend on the file size.
+
+References :
+    https://www.pywhy.org/dowhy/v0.13/user_guide/causal_tasks/root_causing_and_explaining/anomaly_attribution.html
+"""
+
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Deque, Dict, Optional
+import numpy as np
+import pandas as pd
+
+from agentic_supply.utilities.config import (
+    BOOTSTRAP_NUM_WORKERS,
+    BULK_ATTRIBUTION_CHUNK_SIZE,
+    RANDOM_SEED,
+    TOOL_WORKER_START_METHOD,
+)
+from agentic_supply.utilities.log_utils import set_logging, get_logger
+from agentic_supply.utilities.parallel import configure_pool_worker, get_num_workers
+from agentic_supply.utilities.random_utils import seeded_random_state
+
+
+set_logging()
+logger = get_logger(__name__)
+
+
+_WORKER_STATE: Dict[str, Any] = {}
+
+
+def _init_worker(model: Any, target: str, in_worker: bool = True):
+    if in_worker:
+        configure_pool_worker()
+    _WORKER_STATE["model"] = model
+    _WORKER_STATE["target"] = target
+
+
+def _attribute_chunk(chunk: pd.DataFrame, seed: int) -> pd.DataFrame:
+    from dowhy import gcm
+
+    with seeded_random_state(seed):
+        attributions = gcm.attribute_anomalies(_WORKER_STATE["model"], _WORKER_STATE["target"], anomaly_samples=chunk)
+    return pd.DataFrame(attributions, index=chunk.index)
+
+
+class BulkAttributionAggregate:
+    """
+    Running aggregate of per-row attributions : sums, absolute sums and the number of rows where each node is the top root cause.
+    """
+
+    def __init__(self):
+        self.num_rows = 0
+        self.sums: Optional[pd.Series] = None
+        self.abs_sums: Optional[pd.Series] = None
+        self.top_counts: Optional[pd.Series] = None
+
+    def update(self, attributions: pd.DataFrame):
+        top_counts = attributions.idxmax(axis=1).value_counts().reindex(attributions.columns, fill_value=0)
+        if self.sums is None:
+            self.sums, self.abs_sums, self.top_counts = attributions.sum(), attributions.abs().sum(), top_counts
+        else:
+            self.sums += attributions.sum()
+            self.abs_sums += attributions.abs().sum()
+            self.top_counts += top_counts
+        self.num_rows += len(attributions)
+
+    def get_ranking(self) -> pd.DataFrame:
+        if self.num_rows == 0:
+            raise ValueError("No rows were attributed, the anomalous data is empty !")
+        ranking = pd.DataFrame(
+            {
+                "mean_attribution": self.sums / self.num_rows,
+                "mean_absolute_attribution": self.abs_sums / self.num_rows,
+                "top_root_cause_rows": self.top_counts,
+            }
+        )
+        ranking["top_root_cause_pct"] = ranking["top_root_cause_rows"] / self.num_rows * 100
+        return ranking.sort_values("mean_attribution", ascending=False)
+
+
+def attribute_anomalies_in_chunks(
+    model: Any,
+    target: str,
+    data_path: str,
+    output_path: str,
+    chunksize: int = BULK_ATTRIBUTION_CHUNK_SIZE,
+    num_workers: int = BOOTSTRAP_NUM_WORKERS,
+    seed: Optional[int] = RANDOM_SEED,
+) -> pd.DataFrame:
+    """
+    Attributes every row of the anomalous file at data_path, writes the per-row attributions to output_path,
+    and returns the ranking of root-cause nodes aggregated over all rows.
+    Each chunk gets its own seed spawned from the root seed, so the results do not depend on num_workers.
+    Examples :
+    >>> ranking = attribute_anomalies_in_chunks(causal_analysis.model, "Website", "./src/agentic_supply/data/microservices_latencies_outlier_data.csv", "./logs/attributions.csv")
+    """
+    nodes = list(model.graph.nodes)
+    num_workers = get_num_workers(num_workers)
+    seed_sequence = np.random.SeedSequence(seed)
+    aggregate = BulkAttributionAggregate()
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    if os.path.exists(output_path):
+        os.remove(output_path)
+
+    def write(attributions: pd.DataFrame):
+        attributions.to_csv(output_path, mode="a", header=not os.path.exists(output_path), index_label="row")
+        aggregate.update(attributions)
+
+    chunks = pd.read_csv(data_path, usecols=nodes, chunksize=chunksize)
+    logger.info(f"Attributing anomalies of {data_path} in chunks of {chunksize} rows on {num_workers} worker(s)")
+    if num_workers == 1:
+        _init_worker(model, target, in_worker=False)
+        for chunk in chunks:
+            write(_attribute_chunk(chunk, int(seed_sequence.spawn(1)[0].generate_state(1)[0])))
+    else:
+        # keep at most two chunks per worker in flight, and write them back in file order
+        pending: Deque[Future] = deque()
+        # never forked from the threaded tool server : the workers are started by the forkserver (or spawned)
+        with ProcessPoolExecutor(
+            max_workers=num_workers,
+            mp_context=multiprocessing.get_context(TOOL_WORKER_START_METHOD),
+            initializer=_init_worker,
+            initargs=(model, target),
+        ) as executor:
+            for chunk in chunks:
+                pending.append(executor.submit(_attribute_chunk, chunk, int(seed_sequence.spawn(1)[0].generate_state(1)[0])))
+                if len(pending) >= 2 * num_workers:
+                    write(pending.popleft().result())
+            while pending:
+                write(pending.popleft().result())
+    logger.info(f"Attributed {aggregate.num_rows} rows, per-row attributions saved at {output_path}")
+    return aggregate.get_ranking()
@@ -25,23 +25,45 @@ References :
     https://www.pywhy.org/dowhy/v0.13/example_notebooks/gcm_online_shop.html#Step-3:-Answer-causal-questions
 """
 
-from dowhy import gcm  # this takes a while, but used everywhere
+import hashlib
+import time
 import pandas as pd
-from typing import Tuple, Optional, Any, Dict, Union, List
+from typing import Tuple, Optional, Any, Callable, Dict, Union, List
 import numpy as np
 
 
-from agentic_supply.utilities.config import DATA_NAMES, DATA_TO_TARGET
-from agentic_supply import data
-from agentic_supply.utilities.data_utils import get_data, save_object, visualise_graph
+from agentic_supply.utilities.config import DATA_NAMES, DATA_TO_TARGET, ARTIFACTS_DIR, BULK_ATTRIBUTION_CHUNK_SIZE, PRUNE_TO_TARGET_ANCESTORS, COMPACT_DATA, DOSE_RESPONSE_NUM_SAMPLES, MECHANISM_ASSIGNMENT_QUALITY, EVALUATION_NUM_WORKERS, INCREMENTAL_FIT_SIGNIFICANCE_LEVEL
+from agentic_supply.utilities.data_utils import get_data, get_data_fingerprint
 from agentic_supply.causality_assistant.causal_graph import CausalGraph
+from agentic_supply.causality_assistant.model_cache import model_cache, get_form_hash
+from agentic_supply.causality_assistant.model_store import model_store
+from agentic_supply.causality_assistant.bootstrap import BootstrapExecutor
+from agentic_supply.causality_assistant.bulk_attribution import attribute_anomalies_in_chunks
+from agentic_supply.causality_assistant.drift_report import attribute_distribution_drift
+from agentic_supply.causality_assistant.model_evaluation import evaluation_store, evaluate_causal_model, get_model_hash
+from agentic_supply.causality_assistant.result_cache import result_cache
+from agentic_supply.causality_assistant.mechanism_selection import QUALITY_PRESETS, MechanismSelectionCache, mechanism_selection_cache
+from agentic_supply.causality_assistant.counterfactuals import NoiseCache, batch_counterfactual_samples, get_scenario_summary
+from agentic_supply.causality_assistant.streaming import StreamingAnomalyScorer
+from agentic_supply.causality_assistant.dose_response import SWEEP_MODES, get_default_reference, sweep_dose_response
+from agentic_supply.causality_assistant.intervention_parsing import parse_interventions
+from agentic_supply.causality_assistant.approximation import Approximation
+from agentic_supply.utilities.rendering import RenderedPlot, draw_bar, draw_curve, draw_lines, renderer
 from agentic_supply.utilities.log_utils import set_logging, get_logger
+from agentic_supply.utilities.instrumentation import instrument
+from agentic_supply.utilities.lazy_import import lazy_import
 
 
+gcm = lazy_import("dowhy.gcm")  # this takes a while, so it is only imported on first use
+
 set_logging()
 logger = get_logger(__name__)
 
 
+NODE_FINGERPRINT = "data_fingerprint"  # graph node attributes, stored alongside dowhy's own attributes so they are pickled with the model
+NODE_NUM_ROWS = "data_num_rows"
+
+
 class CausalAnalysis:
     """
     Causal analysis for supported data
@@ -52,28 +74,101 @@ class CausalAnalysis:
     >>> causal_analysis = CausalAnalysis(data_name, model_from_file=True)
     >>> causal_graph = CausalGraph(data_name)
     >>> causal_analysis = CausalAnalysis(data_name, causal_graph)
+    >>> causal_analysis = CausalAnalysis.from_cache(data_name)
+    >>> causal_analysis = CausalAnalysis(data_name, causal_graph, prune=False) # model over the full graph
     """
 
-    def __init__(self, data_name: DATA_NAMES, causal_graph: Optional[CausalGraph] = None, model_from_file: bool = False):
+    def __init__(
+        self,
+        data_name: DATA_NAMES,
+        causal_graph: Optional[CausalGraph] = None,
+        model_from_file: bool = False,
+        prune: bool = PRUNE_TO_TARGET_ANCESTORS,
+    ):
+        """
+        With prune, the model only covers the target and its ancestors : every causal task is about the target,
+        and the nodes which are not ancestors of the target cannot influence it, so they are neither fitted nor sampled.
+        """
         self.data_name: DATA_NAMES = data_name
-        self.causal_graph: CausalGraph = causal_graph if causal_graph is not None else CausalGraph(data_name)
         self.target = DATA_TO_TARGET[self.data_name]
-        self.data = get_data(self.data_name)
+        self.causal_graph: CausalGraph = self._get_causal_graph(data_name, causal_graph, prune)
+        # categorical and downcast columns : the mechanisms are fitted on the compact arrays
+        self.data = get_data(self.data_name, compact=COMPACT_DATA)
         self.fit_report: Optional[str] = None
+        self.fit_duration: Optional[float] = None
         self.evaluation_report: Optional[str] = None
+        self.refit_nodes: List[str] = []
+        self.bootstrap_executor = BootstrapExecutor()
+        self.noise_cache = NoiseCache()
+        self._model_hash: Optional[str] = None
+        # the mechanism selections, evaluations and task results are cached across sessions : disabled e.g. by benchmarks
+        self.use_cache: bool = True
+        self.approximation: Approximation = Approximation.from_level()
         if model_from_file:
             self.model = self._load_model_from_file()
         else:
             self.model = gcm.InvertibleStructuralCausalModel(self.causal_graph.graph)  # StructuralCausalModel
         logger.info(f"Causal model instanciated for {self.data_name} with causal graph of form : {self.causal_graph.form}")
 
+    @staticmethod
+    def _get_causal_graph(data_name: DATA_NAMES, causal_graph: Optional[CausalGraph], prune: bool) -> CausalGraph:
+        causal_graph = causal_graph if causal_graph is not None else CausalGraph(data_name)
+        target = DATA_TO_TARGET[data_name]
+        # datasets without a target (or whose target is not in the graph) keep the full graph
+        if prune and target in causal_graph.graph:
+            return causal_graph.prune(target)
+        return causal_graph
+
+    @classmethod
+    def from_cache(cls, data_name: DATA_NAMES, causal_graph: Optional[CausalGraph] = None, prune: bool = PRUNE_TO_TARGET_ANCESTORS) -> "CausalAnalysis":
+        """
+        Returns the causal analysis with its model loaded from file, shared through the process-wide model cache.
+        The returned instance is shared between callers : do not refit it without saving the model.
+        Examples :
+        >>> causal_analysis = CausalAnalysis.from_cache("microservices_latencies")
+        """
+        causal_graph = cls._get_causal_graph(data_name, causal_graph, prune)
+        key = (data_name, get_form_hash(causal_graph.form), get_data_fingerprint(data_name))
+        return model_cache.get_or_load(
+            key,
+            loader=lambda: cls(data_name, causal_graph=causal_graph, model_from_file=True, prune=prune),
+            sizer=lambda causal_analysis: causal_analysis._estimate_size(),
+        )
+
     def save_model(self):
         """
         Examples :
         >>> causal_analysis.save_model()
         >>> causal_analysis.fit().save_model()
         """
-        save_object(self.model, filebasename=f"{self.data_name}_model")
+        model_store.save(self.model, self.data_name, self.causal_graph.form, fit_duration=self.fit_duration)
+        model_cache.invalidate(self.data_name)
+
+    def _estimate_size(self) -> int:
+        """
+        Estimated memory footprint in bytes : the data in memory plus the pickled model size as a proxy for the model.
+        """
+        import os
+
+        data_size = int(self.data.memory_usage(deep=True).sum())
+        model_file = model_store.get_model_path(self.data_name)
+        model_size = os.path.getsize(model_file) if os.path.isfile(model_file) else 0
+        return data_size + model_size
+
+    @property
+    def model_hash(self) -> str:
+        """
+        Content hash of the model, computed once per fit : the key of its cached evaluations and task results.
+        """
+        if self._model_hash is None:
+            self._model_hash = get_model_hash(self.model)
+        return self._model_hash
+
+    def _get_cached_result(self, method: str, compute: Callable[[], Any], **arguments) -> Any:
+        # seeded and shared between sessions : the same question on the same model returns the same numbers
+        # without a seed, the result cache runs compute and caches nothing
+        seed = self.bootstrap_executor.seed if self.use_cache else None
+        return result_cache.get_or_compute(self.model_hash, method, dict(target=self.target, **arguments), seed, compute)
 
     @staticmethod
     def _convert_to_percentage(value_dictionary: dict) -> Dict:
@@ -90,21 +185,7 @@ class CausalAnalysis:
         >>> lambda_fn = causal_analysis._str_to_lambda("X : 5") # atomic
         >>> lambda_fn = causal_analysis._str_to_lambda("X : x + 1, Y : 0") # multiple
         """
-        import sympy as sp
-        import dis
-        from io import StringIO
-
-        expression_str_split = expression_str.split(",")
-        node_to_intervention_dict = {}
-        for expression in expression_str_split:
-            node, intervention_str = tuple([elem.strip() for elem in expression.split(":")])
-            intervention_parsed = sp.sympify(intervention_str)
-            lambda_fn = sp.lambdify(sp.symbols("x"), intervention_parsed)
-            node_to_intervention_dict[node] = lambda_fn
-            with StringIO() as out:
-                dis.dis(lambda_fn, file=out)
-                logger.info(f"Parsed {intervention_str} on {node} to {intervention_parsed}, see disassembling :\n{out.getvalue()}")
-        return node_to_intervention_dict
+        return parse_interventions(expression_str)
 
     @staticmethod
     def _get_most_impactful_node(impact: dict) -> str:
@@ -112,31 +193,123 @@ class CausalAnalysis:
         return max(avg_impact, key=avg_impact.get)
 
     # Model fitting and evaluation
-    def fit(self) -> "CausalAnalysis":
+    @instrument("fit")
+    def fit(self, incremental: bool = False, quality: QUALITY_PRESETS = MECHANISM_ASSIGNMENT_QUALITY) -> "CausalAnalysis":
         """
+        The causal mechanisms are selected with the quality preset ("good", "better" or "best"), and the selection of
+        each node is cached by its parents and the fingerprint of their columns : refitting on the same columns reuses it.
+        In incremental mode, the nodes keep their assigned causal mechanisms (no new model selection), and only the
+        nodes whose mechanism no longer fits their data are refitted :
+        - when rows were appended to the data the node was fitted on (e.g. a new week), the appended rows are tested
+          against the fitted mechanism, and the node is only refitted if their distribution changed ;
+        - when the fitted rows themselves changed, the node is refitted.
+        The refitted nodes are recorded in refit_nodes.
         Examples :
-        >>> causal_analysis.fit()
+        >>> causal_analysis.fit(quality="better")
         >>> print(causal_analysis.fit_report)
+        >>> causal_analysis.data = pd.concat([causal_analysis.data, new_week_data], ignore_index=True)
+        >>> causal_analysis.fit(incremental=True).refit_nodes
         """
-        logger.info(f"Fitting the model for {self.data_name} with causal graph of form : {self.causal_graph.form}")
-        summary_auto_assignment = gcm.auto.assign_causal_mechanisms(self.model, self.data)
-        gcm.fit(self.model, self.data)
-        self.fit_report = str(summary_auto_assignment)
+        from dowhy.gcm.causal_models import CAUSAL_MECHANISM
+        from dowhy.gcm.fitting_sampling import fit_causal_model_of_target
+
+        start = time.perf_counter()
+        self.noise_cache.clear()  # the noise inferred by the previous mechanisms
+        self._model_hash = None
+        node_fingerprints = {node: self._get_node_fingerprint(node) for node in self.model.graph.nodes}
+        selection_cache = mechanism_selection_cache if self.use_cache else MechanismSelectionCache(directory=None)
+        if not incremental:
+            logger.info(f"Fitting the model for {self.data_name} with causal graph of form : {self.causal_graph.form}")
+            assignment_report = selection_cache.assign(self.model, self.data, node_fingerprints, quality)
+            gcm.fit(self.model, self.data)
+            self.fit_report = str(assignment_report)
+            self.refit_nodes = list(self.model.graph.nodes)
+        else:
+            unassigned_nodes = [node for node in self.model.graph.nodes if CAUSAL_MECHANISM not in self.model.graph.nodes[node]]
+            if unassigned_nodes:
+                # only the nodes without a mechanism are assigned one, the existing assignments are validated and kept
+                self.fit_report = str(selection_cache.assign(self.model, self.data, node_fingerprints, quality, nodes=unassigned_nodes))
+            self.refit_nodes = [
+                node
+                for node in self.model.graph.nodes
+                if node in unassigned_nodes or (
+                    self.model.graph.nodes[node].get(NODE_FINGERPRINT) != node_fingerprints[node] and self._has_node_changed(node)
+                )
+            ]
+            logger.info(f"Incrementally refitting {len(self.refit_nodes)} of {self.model.graph.number_of_nodes()} nodes : {self.refit_nodes}")
+            for node in self.refit_nodes:
+                fit_causal_model_of_target(self.model, node, self.data)
+        for node, fingerprint in node_fingerprints.items():
+            self.model.graph.nodes[node][NODE_FINGERPRINT] = fingerprint
+            self.model.graph.nodes[node][NODE_NUM_ROWS] = len(self.data)
+        self.fit_duration = time.perf_counter() - start
         return self
 
-    def evaluate(self) -> "CausalAnalysis":
+    def _get_node_fingerprint(self, node: str, num_rows: Optional[int] = None) -> str:
+        """
+        Hash of the data a node's mechanism is fitted on, i.e. the node's column and its parents' columns,
+        over the first num_rows rows (all of them if None).
+        """
+        from dowhy.graph import get_ordered_predecessors
+
+        columns = [node] + get_ordered_predecessors(self.model.graph, node)
+        hashes = pd.util.hash_pandas_object(self.data[columns].iloc[:num_rows], index=False).to_numpy()
+        return hashlib.sha256(hashes.tobytes()).hexdigest()
+
+    def _has_node_changed(self, node: str, significance_level: float = INCREMENTAL_FIT_SIGNIFICANCE_LEVEL) -> bool:
+        """
+        Whether the fitted mechanism of a node no longer describes its data.
+        When the data only grew by appended rows, the residuals of the appended rows (the values themselves for a root
+        node) are tested against those of the fitted rows : the node changed if they differ at the significance level.
+        Otherwise, i.e. when the fitted rows changed or the mechanism is not invertible, the node is considered changed.
         """
+        from scipy.stats import chi2_contingency, ks_2samp
+        from dowhy.gcm.causal_mechanisms import InvertibleFunctionalCausalModel
+        from dowhy.graph import get_ordered_predecessors, is_root_node
+
+        attributes = self.model.graph.nodes[node]
+        num_rows = attributes.get(NODE_NUM_ROWS)
+        if num_rows is None or not 0 < num_rows < len(self.data) or self._get_node_fingerprint(node, num_rows) != attributes.get(NODE_FINGERPRINT):
+            return True
+        if is_root_node(self.model.graph, node):
+            fitted, appended = self.data[node].iloc[:num_rows], self.data[node].iloc[num_rows:]
+            if fitted.dtype.kind not in "biuf":
+                counts = pd.crosstab(np.repeat([0, 1], [len(fitted), len(appended)]), pd.concat([fitted, appended], ignore_index=True).to_numpy())
+                return counts.shape[1] > 1 and chi2_contingency(counts.to_numpy())[1] < significance_level
+            return ks_2samp(fitted.to_numpy(), appended.to_numpy()).pvalue < significance_level
+        mechanism = self.model.causal_mechanism(node)
+        if not isinstance(mechanism, InvertibleFunctionalCausalModel):
+            return True
+        parents = get_ordered_predecessors(self.model.graph, node)
+        try:
+            residuals = np.asarray(mechanism.estimate_noise(self.data[node].to_numpy(), self.data[parents].to_numpy())).reshape(-1)
+        except ValueError:
+            # e.g. a discrete additive noise model, with non-discrete appended values
+            return True
+        return ks_2samp(residuals[:num_rows], residuals[num_rows:]).pvalue < significance_level
+
+    def evaluate(self, max_num_samples: Optional[int] = None, n_jobs: int = EVALUATION_NUM_WORKERS, use_cache: Optional[bool] = None) -> "CausalAnalysis":
+        """
+        The mechanisms of the nodes are evaluated by n_jobs parallel workers, on all the rows or on max_num_samples
+        sampled rows, the report stating how representative they are.
+        With use_cache (the instance's use_cache by default), the report is persisted under ARTIFACTS_DIR, keyed by the
+        hashes of the model and the data : evaluating the same model on the same data again returns it instantly.
         Examples :
         >>> causal_analysis.evaluate()
+        >>> causal_analysis.evaluate(max_num_samples=2000, n_jobs=4)
         >>> print(causal_analysis.evaluation_report)
         """
         logger.info(f"Evaluating the fitted model for {self.data_name} with causal graph of form : {self.causal_graph.form}")
-        evaluation = gcm.evaluate_causal_model(self.model, self.data, evaluate_causal_structure=False)
-        self.evaluation_report = str(evaluation)
+        if use_cache if use_cache is not None else self.use_cache:
+            record = evaluation_store.get_or_evaluate(self.model, self.data, max_num_samples, n_jobs, model_sha256=self.model_hash)
+        else:
+            record = evaluate_causal_model(self.model, self.data, max_num_samples, n_jobs, model_sha256=self.model_hash)
+        self.evaluation_report = str(record)
         return self
 
     # Causal tasks
     ## Asking and answering What-If questions
+    @instrument("sampling")
     def generate_data(self, num_samples=100) -> pd.DataFrame:
         """
         Examples :
@@ -145,12 +318,14 @@ class CausalAnalysis:
         logger.info(f"Generating data for {num_samples} samples")
         return gcm.draw_samples(self.model, num_samples)
 
+    @instrument("sampling")
     def generate_interventional_samples(
         self,
         intervention_str: str = "X : x + 0.5",
         num_samples: int = 5,
         observed_data: Optional[pd.DataFrame] = None,
         bootstrap_mean: bool = False,
+        num_bootstrap_resamples: Optional[int] = None,
     ) -> Union[pd.DataFrame, Tuple[Dict, Dict]]:
         """
         Question : What will happen to the variable Z if I intervene on Y ? (= future)
@@ -178,7 +353,7 @@ class CausalAnalysis:
             return data
 
         logger.info(f"Generating Interventional samples mean for {self.data_name} with {intervention_str}")
-        median_mean, uncertainty_mean = gcm.confidence_intervals(
+        median_mean, uncertainty_mean = self.bootstrap_executor.confidence_intervals(
             lambda: gcm.fit_and_compute(
                 gcm.interventional_samples,
                 self.model,
@@ -188,7 +363,7 @@ class CausalAnalysis:
             )()
             .mean()
             .to_dict(),
-            num_bootstrap_resamples=10,
+            num_bootstrap_resamples=num_bootstrap_resamples,
         )
         prior_mean = observed_data[self.target].mean()
         self._plot(
@@ -201,6 +376,7 @@ class CausalAnalysis:
         )
         return median_mean, uncertainty_mean
 
+    @instrument("sampling")
     def generate_counterfactual_samples(
         self,
         intervention_str: str = "X : x + 0.5",
@@ -211,15 +387,51 @@ class CausalAnalysis:
         Question : I observed a certain outcome z for a variable Z where variable X was set to a value x :
         what would have happened to the value of Z, had I intervened on X to assign it a different value x' ? (= alternative past)
         Either pass observed_data to generate counterfactuals from, or pass noise_data.
+        The noise inferred from observed_data is cached, so that other interventions on the same rows skip the abduction.
         Examples :
         >>> data = causal_analysis.generate_counterfactual_samples(observed_data=causal_analysis.data.iloc[[0]], intervention_str="X : 5")
         >>> causal_analysis.data.iloc[[0]].to_csv("./src/agentic_supply/data/counterfactual_example_data.csv", index=False)
         """
+        if observed_data is not None and noise_data is not None:
+            raise ValueError("Either observed_data or noise_data can be given, not both")
         num_samples = len(observed_data) if observed_data is not None else len(noise_data)
         logger.info(f"Generating {num_samples} counterfactual samples, with '{intervention_str}'")
-        return gcm.counterfactual_samples(
-            self.model, self._str_to_lambda(intervention_str), observed_data=observed_data, noise_data=noise_data
+        if observed_data is not None:
+            noise_data = self.noise_cache.get_or_compute(self.model, observed_data)
+        return gcm.counterfactual_samples(self.model, self._str_to_lambda(intervention_str), noise_data=noise_data)
+
+    @instrument("sampling")
+    def generate_batch_counterfactual_samples(
+        self,
+        intervention_strs: Union[List[str], Dict[str, str]],
+        observed_data: pd.DataFrame,
+        include_factual: bool = True,
+    ) -> Tuple[pd.DataFrame, pd.DataFrame, str]:
+        """
+        Question : For the same observed rows, what would have happened under each of these alternative interventions ?
+        The noise of the rows is inferred once (and cached), then all the scenarios are propagated in one vectorised pass.
+        Scenarios are named by their intervention string, or by the keys of a dict of intervention strings.
+        Returns the samples indexed by (scenario, row), the mean of the target per scenario, and the interpretation.
+        Examples :
+        >>> samples, summary, interpretation = causal_analysis.generate_batch_counterfactual_samples(["X : 0", "X : 5", "X : x * 2"], observed_data=causal_analysis.data.iloc[:10])
+        >>> samples, summary, interpretation = causal_analysis.generate_batch_counterfactual_samples({"no treatment": "Treatment : 0", "treatment": "Treatment : 1"}, observed_data)
+        >>> samples.loc["X : 0"]
+        """
+        intervention_strs = intervention_strs if isinstance(intervention_strs, dict) else {elem: elem for elem in intervention_strs}
+        logger.info(f"Generating counterfactual samples of {len(observed_data)} rows for {len(intervention_strs)} scenarios")
+        noise_data = self.noise_cache.get_or_compute(self.model, observed_data)
+        samples = batch_counterfactual_samples(
+            self.model,
+            noise_data,
+            {scenario: self._str_to_lambda(intervention_str) for scenario, intervention_str in intervention_strs.items()},
+            include_factual=include_factual,
         )
+        summary = get_scenario_summary(samples, self.target)
+        interpretation = f"""Counterfactual mean of {self.target} per scenario, for the {len(observed_data)} observed rows : {summary.round(6).to_dict(orient="index")}.
+        Each scenario answers : what would {self.target} have been for these same rows, had the intervention been applied ?"""
+        if include_factual:
+            interpretation += f"\n        The mean change is measured against the factual scenario, i.e. the rows as observed."
+        return samples, summary, interpretation
 
     ## Estimating causal effects
     def get_average_causal_effect(
@@ -234,11 +446,17 @@ class CausalAnalysis:
         logger.info(
             f"Calculating average causal effect from the difference between alternative '{interventions_alternative}' and reference '{interventions_reference}'"
         )
-        ace = gcm.average_causal_effect(
-            self.model,
-            self.target,
-            interventions_alternative=self._str_to_lambda(interventions_alternative),
-            interventions_reference=self._str_to_lambda(interventions_reference),
+        ace = self._get_cached_result(
+            "average_causal_effect",
+            lambda: gcm.average_causal_effect(
+                self.model,
+                self.target,
+                interventions_alternative=self._str_to_lambda(interventions_alternative),
+                interventions_reference=self._str_to_lambda(interventions_reference),
+                observed_data=self.data,
+            ),
+            interventions_alternative=interventions_alternative,
+            interventions_reference=interventions_reference,
             observed_data=self.data,
         )
         interpretation = f"""The target quantity of {self.target} differs on average by {ace} units,
@@ -246,6 +464,54 @@ class CausalAnalysis:
         """
         return ace, interpretation
 
+    def get_dose_response(
+        self,
+        node: str,
+        grid: List[float],
+        mode: SWEEP_MODES = "value",
+        reference: Optional[float] = None,
+        num_samples: int = DOSE_RESPONSE_NUM_SAMPLES,
+        confidence_level: float = 0.95,
+    ) -> Tuple[pd.DataFrame, str]:
+        """
+        Question : How does the target respond to a range of values (or shifts) of a node ?
+        All the grid points share the same sampled noise, so the curve costs one sampling pass, and the average causal
+        effects against the reference point are those of get_average_causal_effect, with much narrower bands.
+        Examples :
+        >>> curve, interpretation = causal_analysis.get_dose_response("X", grid=[0, 1, 2, 3])
+        >>> curve, interpretation = causal_analysis.get_dose_response("Caching Service", grid=[-1, -0.5, 0, 0.5], mode="shift")
+        """
+        logger.info(f"Calculating the dose-response curve of {self.target} over {len(grid)} {mode} interventions on {node}")
+        reference = float(reference) if reference is not None else get_default_reference(grid, mode)
+        curve = sweep_dose_response(
+            self.model,
+            self.target,
+            node,
+            grid,
+            mode=mode,
+            reference=reference,
+            num_samples=num_samples,
+            confidence_level=confidence_level,
+            seed=self.bootstrap_executor.seed,
+        )
+        plot = renderer.render(
+            f"dose_response_{self.data_name}",
+            f"Dose-response of {self.target} to {node} for {self.data_name}",
+            draw_curve,
+            wait=False,
+            x=curve.index.tolist(),
+            y=curve[f"mean {self.target}"].tolist(),
+            lower=curve["mean_lower"].tolist(),
+            upper=curve["mean_upper"].tolist(),
+            xlabel=curve.index.name,
+            ylabel=f"Average {self.target}",
+        )
+        interpretation = f"""Average {self.target} per {mode} of {node} : {curve[f"mean {self.target}"].round(6).to_dict()}.
+        Average causal effects against the intervention at {reference} : {curve["effect"].round(6).to_dict()}, with {confidence_level:.0%} confidence bands {curve[["effect_lower", "effect_upper"]].round(6).to_dict(orient="split")["data"]}.
+        All the points were computed from the same {num_samples} noise samples, so the differences between them are only due to the intervention.
+        Plot : {plot.html_path}"""
+        return curve, interpretation
+
     ## Quantify causal influence
     def get_arrow_strength(self) -> Tuple[Dict, Dict, str]:
         """
@@ -254,7 +520,7 @@ class CausalAnalysis:
         >>> node_contributions, node_contributions_pct, interpretation = causal_analysis.get_arrow_strength()
         """
         logger.info(f"Calculating arrow strength of parent nodes to {self.target}")
-        node_contributions = gcm.arrow_strength(self.model, self.target)
+        node_contributions = self._get_cached_result("arrow_strength", lambda: gcm.arrow_strength(self.model, self.target))
         node_contributions_pct = self._convert_to_percentage(node_contributions)
         most_impactful_node = self._get_most_impactful_node(node_contributions)
         interpretation = f"""Arrow strength (direct effect) scores : {node_contributions} (percentages : {node_contributions_pct}). 
@@ -263,17 +529,31 @@ class CausalAnalysis:
         """
         return node_contributions, node_contributions_pct, interpretation
 
-    def get_intrinsic_causal_influence(self) -> Tuple[Dict, Dict, str]:
+    def get_intrinsic_causal_influence(self, approximation: Optional[Approximation] = None) -> Tuple[Dict, Dict, str]:
         """
         Question : How strong is the causal influence of an upstream node to a target node that is not inherited from the parents of the upstream node ?
         Examples :
         >>> node_contributions, node_contributions_pct, interpretation = causal_analysis.get_intrinsic_causal_influence()
+        >>> node_contributions, node_contributions_pct, interpretation = causal_analysis.get_intrinsic_causal_influence(Approximation.from_level("early_stopping"))
         """
-        logger.info(f"Calculating intrinsic causal influence of parent nodes to {self.target}")
-        node_contributions = gcm.intrinsic_causal_influence(self.model, self.target)
-        self._plot(
+        approximation = approximation if approximation is not None else self.approximation
+        logger.info(f"Calculating intrinsic causal influence of parent nodes to {self.target} with approximation level {approximation.level}")
+
+        def estimate(approximation_: Approximation) -> Dict:
+            budgets = {}
+            if approximation_.num_samples is not None:
+                budgets.update(num_samples_baseline=approximation_.num_samples, num_samples_randomization=max(2, approximation_.num_samples // 4))
+            if approximation_.num_training_samples is not None:
+                budgets.update(num_training_samples=approximation_.num_training_samples)
+            return gcm.intrinsic_causal_influence(self.model, self.target, shapley_config=approximation_.get_shapley_config(), **budgets)
+
+        node_contributions, errors = self._get_cached_result(
+            "intrinsic_causal_influence", lambda: approximation.estimate(estimate, seed=self.bootstrap_executor.seed), approximation=approximation
+        )
+        plot = self._plot(
             basename="intrinsic_causal_influence",
             data=node_contributions,
+            uncertainties=self._get_error_bounds(node_contributions, errors),
             ylabel="Variance attribution in %",
             title=f"Intrinsic causal influence plot for {self.data_name}",
         )
@@ -283,11 +563,25 @@ class CausalAnalysis:
         interpretation = f"""Intrinsic causal influence scores : {node_contributions} (percentages : {node_contributions_pct}).
         The scores indicate how much variance each node is contributing to {self.target} — without inheriting the variance from its parents in the causal graph (hence, intrinsic to the node itself).
         The most impactful node {most_impactful_node} contributes {node_contributions_pct[most_impactful_node]} % of the variance in {self.target}.
+        {approximation.describe(node_contributions, errors)}
+        Plot : {plot.html_path}
         """
         return node_contributions, node_contributions_pct, interpretation
 
+    @staticmethod
+    def _get_error_bounds(scores: Dict, errors: Optional[Dict]) -> Optional[Dict]:
+        if errors is None:
+            return None
+        return {node: np.array([scores[node] - errors[node], scores[node] + errors[node]]) for node in scores}
+
     ## Root cause analysis
-    def get_anomaly_attribution(self, anomalous_data: pd.DataFrame, bootstrap: bool = False) -> Tuple[Dict, str]:
+    def get_anomaly_attribution(
+        self,
+        anomalous_data: pd.DataFrame,
+        bootstrap: bool = False,
+        num_bootstrap_resamples: Optional[int] = None,
+        approximation: Optional[Approximation] = None,
+    ) -> Tuple[Dict, str]:
         """
         Question : How much did each of the upstream nodes and the target node contribute to the observed anomaly ?
         Examples :
@@ -296,28 +590,42 @@ class CausalAnalysis:
         >>> anomalous_data["Z"] = 3 * anomalous_data["Y"]
         >>> aa, interpretation = causal_analysis.get_anomaly_attribution(anomalous_data)
         >>> aa, interpretation = causal_analysis.get_anomaly_attribution(anomalous_data, bootstrap=True)
+        >>> aa, interpretation = causal_analysis.get_anomaly_attribution(anomalous_data, approximation=Approximation.from_level("permutation"))
         >>> anomalous_data.to_csv("./src/agentic_supply/data/anomalous_example_data.csv", index=False)
         """
         logger.info(
             f"Calculating anomaly attribution from anomalous_data with {len(anomalous_data)} samples {'using the bootstrap method' if bootstrap else ''}"
         )
-        confidence_intervals = None
+        approximation = approximation if approximation is not None else self.approximation
+        budgets = dict(shapley_config=approximation.get_shapley_config())
+        if approximation.num_samples is not None:
+            budgets.update(num_distribution_samples=approximation.num_samples)
+        confidence_intervals, errors = None, None
         if bootstrap:
-            (node_contributions, confidence_intervals) = gcm.confidence_intervals(
+            (node_contributions, confidence_intervals) = self.bootstrap_executor.confidence_intervals(
                 gcm.fit_and_compute(
                     gcm.attribute_anomalies,
                     self.model,
                     bootstrap_training_data=self.data,
                     target_node=self.target,
                     anomaly_samples=anomalous_data,
+                    **budgets,
                 ),
-                num_bootstrap_resamples=10,
+                num_bootstrap_resamples=num_bootstrap_resamples,
             )
         else:
-            node_contributions = gcm.attribute_anomalies(self.model, self.target, anomaly_samples=anomalous_data)
-            node_contributions = {k: v[0] for k, v in node_contributions.items()}
+
+            def estimate(approximation_: Approximation) -> Dict:
+                num_samples = {} if approximation_.num_samples is None else dict(num_distribution_samples=approximation_.num_samples)
+                node_contributions = gcm.attribute_anomalies(
+                    self.model, self.target, anomaly_samples=anomalous_data, shapley_config=approximation_.get_shapley_config(), **num_samples
+                )
+                return {k: v[0] for k, v in node_contributions.items()}
+
+            node_contributions, errors = approximation.estimate(estimate, seed=self.bootstrap_executor.seed)
+            confidence_intervals = self._get_error_bounds(node_contributions, errors)
         node_contributions = {k: float(v) for k, v in node_contributions.items()}
-        self._plot(
+        plot = self._plot(
             basename="anomaly_attribution",
             data=node_contributions,
             uncertainties=confidence_intervals,
@@ -329,10 +637,66 @@ class CausalAnalysis:
         The node {most_impactful_node} has the highest likelihood of causing the anomaly seen in your given data.
         A positive attribution score means that the corresponding node contributed to the observed anomaly, which is in our case the drop in Profit. 
         A negative score of a node indicates that the observed value for the node is actually reducing the likelihood of the anomaly"""
+        if not bootstrap:
+            interpretation += f"\n        {approximation.describe(node_contributions, errors)}"
+        interpretation += f"\n        Plot : {plot.html_path}"
         return node_contributions, interpretation
 
+    def get_bulk_anomaly_attribution(
+        self, data_path: str, chunksize: int = BULK_ATTRIBUTION_CHUNK_SIZE, num_workers: Optional[int] = None
+    ) -> Tuple[pd.DataFrame, str, str]:
+        """
+        Question : Over all the anomalous rows of a (large) file, which nodes are most often the root cause of the anomalies ?
+        The file is streamed in chunks attributed in a worker pool, so that memory stays bounded whatever the file size.
+        Returns the ranking of root-cause nodes, the path of the per-row attributions, and the interpretation.
+        Examples :
+        >>> ranking, attributions_path, interpretation = causal_analysis.get_bulk_anomaly_attribution("./src/agentic_supply/data/microservices_latencies_outlier_data.csv")
+        """
+        import os
+
+        num_workers = num_workers if num_workers is not None else self.bootstrap_executor.num_workers
+        output_path = os.path.join(ARTIFACTS_DIR, f"anomaly_attribution_rows_{self.data_name}.csv")
+        ranking = attribute_anomalies_in_chunks(
+            self.model,
+            self.target,
+            data_path,
+            output_path,
+            chunksize=chunksize,
+            num_workers=num_workers,
+            seed=self.bootstrap_executor.seed,
+        )
+        plot = self._plot(
+            basename="bulk_anomaly_attribution",
+            data=ranking["mean_attribution"].to_dict(),
+            ylabel="Mean anomaly attribution score",
+            title=f"Bulk anomaly attribution plot for {self.data_name}",
+        )
+        most_impactful_node = ranking.index[0]
+        interpretation = f"""Mean anomaly attribution scores over all rows : {ranking["mean_attribution"].to_dict()}.
+        Percentage of rows for which each node is the top root cause : {ranking["top_root_cause_pct"].to_dict()}.
+        The node {most_impactful_node} has the highest average likelihood of causing the anomalies seen in your given data.
+        The attributions of every row were saved at {output_path}.
+        Plot : {plot.html_path}"""
+        return ranking, output_path, interpretation
+
+    def get_anomaly_scorer(self, threshold: Optional[float] = None, **kwargs) -> StreamingAnomalyScorer:
+        """
+        Scorer of streamed rows against the noise of the training data, running the anomaly attribution on alerts.
+        Examples :
+        >>> scorer = causal_analysis.get_anomaly_scorer()
+        >>> for alert in scorer.process(tail_csv("./logs/latencies.csv", follow=True)):
+        ...     print(alert.root_cause)
+        """
+        logger.info(f"Fitting the streaming anomaly scorer of {self.target} on {len(self.data)} rows")
+        return StreamingAnomalyScorer.from_model(self.model, self.target, self.data, threshold=threshold, seed=self.bootstrap_executor.seed, **kwargs)
+
     def get_distribution_change_attribution(
-        self, data_new: pd.DataFrame, data_old: Optional[pd.DataFrame] = None, bootstrap: bool = False
+        self,
+        data_new: pd.DataFrame,
+        data_old: Optional[pd.DataFrame] = None,
+        bootstrap: bool = False,
+        num_bootstrap_resamples: Optional[int] = None,
+        approximation: Optional[Approximation] = None,
     ) -> Tuple[Dict, str]:
         """
         Question : What mechanism in my system changed between two sets of data ? Or in other words, which node in my data behaves differently ?
@@ -343,31 +707,46 @@ class CausalAnalysis:
         >>> data_new["Z"] = 3 * data_new["Y"] + np.random.normal(loc=0, scale=1, size=100)
         >>> dca, interpretation = causal_analysis.get_distribution_change_attribution(data_new)
         >>> dca, interpretation = causal_analysis.get_distribution_change_attribution(data_new, bootstrap=True)
+        >>> dca, interpretation = causal_analysis.get_distribution_change_attribution(data_new, approximation=Approximation.from_level("early_stopping"))
         >>> data_new.to_csv("./src/agentic_supply/data/distribution_change_example_data.csv", index=False)
         """
         logger.info(
             f"Calculating distribution change attribution from data_new with {len(data_new)} samples {'using the bootstrap method' if bootstrap else ''}"
         )
-        confidence_intervals = None
+        approximation = approximation if approximation is not None else self.approximation
+        confidence_intervals, errors = None, None
         if data_old is None:
             data_old = self.data
         if bootstrap:
-            node_contributions, confidence_intervals = gcm.confidence_intervals(
+            node_contributions, confidence_intervals = self.bootstrap_executor.confidence_intervals(
                 gcm.bootstrap_sampling(
                     gcm.distribution_change,
                     self.model,
                     data_old,
                     data_new,
                     self.target,
-                    num_samples=500,
+                    num_samples=approximation.num_samples or 500,
+                    shapley_config=approximation.get_shapley_config(),
                     # difference_estimation_func=lambda x1, x2: np.mean(x2) - np.mean(x1),
                 ),
-                num_bootstrap_resamples=5,
+                num_bootstrap_resamples=num_bootstrap_resamples,
             )
         else:
-            node_contributions = gcm.distribution_change(self.model, self.data, data_new, self.target, num_samples=500)
+
+            def estimate(approximation_: Approximation) -> Dict:
+                return gcm.distribution_change(
+                    self.model,
+                    data_old,
+                    data_new,
+                    self.target,
+                    num_samples=approximation_.num_samples or 500,
+                    shapley_config=approximation_.get_shapley_config(),
+                )
+
+            node_contributions, errors = approximation.estimate(estimate, seed=self.bootstrap_executor.seed)
+            confidence_intervals = self._get_error_bounds(node_contributions, errors)
         node_contributions = {k: float(v) for k, v in node_contributions.items()}
-        self._plot(
+        plot = self._plot(
             basename="distribution_change_attribution",
             data=node_contributions,
             uncertainties=confidence_intervals,
@@ -378,8 +757,64 @@ class CausalAnalysis:
         interpretation = f"""Distribution change likelihood scores : {node_contributions}
         The node {most_impactful_node} has the highest likelihood of causing the distribution change seen in your given data.
         A negative value indicates that a node contributes to a decrease and a positive value to an increase of the mean."""
+        if not bootstrap:
+            interpretation += f"\n        {approximation.describe(node_contributions, errors)}"
+        interpretation += f"\n        Plot : {plot.html_path}"
         return node_contributions, interpretation
 
+    def get_distribution_drift(
+        self,
+        partition_column: str = "week",
+        pairs: Optional[List[Tuple[str, str]]] = None,
+        approximation: Optional[Approximation] = None,
+        num_workers: Optional[int] = None,
+    ) -> Tuple[pd.DataFrame, pd.DataFrame, str]:
+        """
+        Question : Which nodes drove the changes of my system from one week to the next ?
+        The data is partitioned by partition_column once and the mechanisms are fitted once per partition,
+        then the distribution change attributions of every pair (each pair of consecutive partitions by default) run in parallel.
+        Returns the time series of the per-node contributions, the mechanism changes per pair, and the interpretation.
+        Examples :
+        >>> causal_analysis = CausalAnalysis.from_cache("supply_chain_logistics")
+        >>> contributions, changes, interpretation = causal_analysis.get_distribution_drift()
+        >>> contributions, changes, interpretation = causal_analysis.get_distribution_drift(pairs=[("w1", "w2")])
+        """
+        approximation = approximation if approximation is not None else self.approximation
+        num_workers = num_workers if num_workers is not None else self.bootstrap_executor.num_workers
+        logger.info(f"Calculating the distribution drift of {self.target} across the values of {partition_column}")
+        contributions, changes = attribute_distribution_drift(
+            self.model,
+            self.target,
+            self.data,
+            partition_column=partition_column,
+            pairs=pairs,
+            num_samples=approximation.num_samples or 500,
+            shapley_config=approximation.get_shapley_config(),
+            num_workers=num_workers,
+            seed=self.bootstrap_executor.seed,
+        )
+        plot = renderer.render(
+            f"distribution_drift_{self.data_name}",
+            f"Distribution drift plot for {self.data_name}",
+            draw_lines,
+            wait=False,
+            series=contributions.to_dict(),
+            xlabel=contributions.index.name,
+            ylabel="Distribution change attribution score",
+        )
+        pair_summaries = []
+        for pair, pair_contributions in contributions.iterrows():
+            changed_nodes = [node for node, changed in changes.loc[pair].items() if changed]
+            pair_summaries.append(
+                f"{pair} : {self._get_most_impactful_node(pair_contributions.to_dict())} contributed most, "
+                f"changed mechanisms : {changed_nodes if changed_nodes else 'none'}"
+            )
+        interpretation = f"""Distribution change likelihood scores per {contributions.index.name} : {contributions.round(6).to_dict(orient="index")}
+        {" ; ".join(pair_summaries)}.
+        A negative value indicates that a node contributes to a decrease and a positive value to an increase of the mean of {self.target}.
+        Plot : {plot.html_path}"""
+        return contributions, changes, interpretation
+
     def get_feature_relevance(self) -> Tuple[Dict, np.ndarray, str]:
         """
         Question : How relevant is a feature for my target ?
@@ -387,20 +822,15 @@ class CausalAnalysis:
         >>> parent_relevance, noise_relevance, interpretation = causal_analysis.get_feature_relevance()
         """
         logger.info(f"Calculating feature relevance for {self.target}")
-        parent_relevance, noise_relevance = gcm.parent_relevance(self.model, target_node=self.target)
+        parent_relevance, noise_relevance = self._get_cached_result("feature_relevance", lambda: gcm.parent_relevance(self.model, target_node=self.target))
         most_impactful_node = self._get_most_impactful_node(parent_relevance)
         interpretation = f"""Feature relevance scores : {parent_relevance} ; Noise relevance score : {noise_relevance}.
         The relation {most_impactful_node} has the highest relevance to the target {self.target} (highest contribution to the variance of {self.target})."""
         return parent_relevance, noise_relevance, interpretation
 
-    def _load_model_from_file(self) -> gcm.InvertibleStructuralCausalModel:
-        import pickle
-        from importlib.resources import open_binary
-
-        model_filepath = f"{self.data_name}_model.pkl"
-        logger.info(f"Loading model from {model_filepath}")
-        with open_binary(data, model_filepath) as f:
-            return pickle.load(f)
+    def _load_model_from_file(self) -> "gcm.InvertibleStructuralCausalModel":
+        # refuses models fitted on another graph than the current one
+        return model_store.load(self.data_name, self.causal_graph.form)
 
     def _plot(
         self,
@@ -408,12 +838,20 @@ class CausalAnalysis:
         data: Dict,
         ylabel: str,
         title: str,
-        in_memory: bool = True,
         uncertainties: Optional[Dict] = None,
         xticks: Optional[List[str]] = None,
-    ):
-        from dowhy.utils import bar_plot
+    ) -> RenderedPlot:
+        # rendered in the background : the paths are returned right away
+        return renderer.render(
+            f"{basename}_{self.data_name}", title, draw_bar, wait=False, values=data, uncertainties=uncertainties, ylabel=ylabel, xticks=xticks
+        )
+
 
-        image_basename = f"{basename}_{self.data_name}"
-        bar_plot(data, uncertainties=uncertainties, ylabel=ylabel, xticks=xticks, display_plot=False)
-        visualise_graph(image_basename, title, in_memory=in_memory)
+def run_from_cache(data_name: DATA_NAMES, method: str, *args, **kwargs) -> Any:
+    """
+    Calls a method of the cached causal analysis of data_name : a picklable call for the tool workers, which run it on
+    their own cached model instead of receiving the pickled model and data.
+    Examples :
+    >>> _, _, interpretation = await tool_executor.run(run_from_cache, "mini_data", "get_intrinsic_causal_influence", in_worker=True)
+    """
+    return getattr(CausalAnalysis.from_cache(data_name), method)(*args, **kwargs)
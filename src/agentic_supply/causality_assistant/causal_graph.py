@@ -5,17 +5,18 @@ References :
     https://github.com/cognizant-ai-lab/neuro-san/blob/main/docs/agent_hocon_reference.md#class
 """
 
-import os
 import networkx as nx  # from dowhy.utils import plot
 import uuid
+from functools import cached_property
 
-from typing import Dict, List, Tuple, Optional
-from dowhy.gcm.falsify import falsify_graph, EvaluationResult
+from typing import Dict, FrozenSet, List, Tuple, Optional, TYPE_CHECKING
 
-from agentic_supply.utilities.config import DATA_NAMES, ARTIFACTS_DIR
-from agentic_supply.utilities.data_utils import get_data, visualise_graph
+from agentic_supply.utilities.config import DATA_NAMES
+from agentic_supply.utilities.rendering import RenderedPlot, draw_graph, draw_refutation, renderer
 from agentic_supply.utilities.log_utils import set_logging, get_logger
 
+if TYPE_CHECKING:
+    from dowhy.gcm.falsify import EvaluationResult
 
 set_logging()
 logger = get_logger(__name__)
@@ -82,11 +83,14 @@ DATA_TO_GRAPH_FORM: Dict[DATA_NAMES, List[Tuple]] = {
 
 class CausalGraph:
     """
-    Causal graph for supported data
+    Causal graph for supported data.
+    The graph is not modified after construction : its topological order and the ancestors of its nodes are computed once
+    and cached, and a new CausalGraph is built for another form.
 
     Examples :
     >>> from agentic_supply.causality_assistant.causal_graph import CausalGraph
     >>> causal_graph = CausalGraph("example_data") # online_shop_data
+    >>> pruned_graph = causal_graph.prune("Z")
     """
 
     def __init__(self, data_name: DATA_NAMES, form: Optional[List[Tuple]] = None):
@@ -94,35 +98,90 @@ class CausalGraph:
         self.form: List[Tuple] = form if form is not None else DATA_TO_GRAPH_FORM[data_name]
         self.graph = nx.DiGraph(self.form)
         self.id: str = uuid.uuid4().hex
-        self.refutation: Optional[EvaluationResult] = None
+        self.refutation: Optional["EvaluationResult"] = None
         self.refutation_report: Optional[str] = None
+        self.refutation_plot: Optional[RenderedPlot] = None
+        self._pruned_graphs: Dict[str, "CausalGraph"] = {}
         logger.info(f"Causal graph instanciated for {self.data_name} with form : {self.form}")
 
-    def visualise(self) -> "CausalGraph":
+    @cached_property
+    def topological_order(self) -> List[str]:
+        return list(nx.topological_sort(self.graph))
+
+    @cached_property
+    def ancestors(self) -> Dict[str, FrozenSet[str]]:
+        """
+        Ancestors of every node, built in a single pass over the topological order from the ancestors of the parents.
+        Examples :
+        >>> causal_graph.ancestors["Z"]
+        frozenset({'X', 'Y'})
+        """
+        ancestors: Dict[str, FrozenSet[str]] = {}
+        for node in self.topological_order:
+            parents = set(self.graph.predecessors(node))
+            ancestors[node] = frozenset(parents.union(*(ancestors[parent] for parent in parents)))
+        return ancestors
+
+    def get_ancestral_form(self, target: str) -> List[Tuple]:
+        """
+        The edges of the form between the target and its ancestors, in the order of the form.
+        The parents of an ancestor are ancestors themselves, so these are the edges into the ancestor closure.
+        """
+        if target not in self.graph:
+            raise ValueError(f"The target {target} is not a node of the causal graph of {self.data_name}")
+        closure = self.ancestors[target] | {target}
+        return [edge for edge in self.form if edge[1] in closure]
+
+    def prune(self, target: str) -> "CausalGraph":
         """
+        The causal graph restricted to the target and its ancestors : the other nodes have no influence on the target,
+        so the causal tasks about the target only need to fit and sample this subgraph.
+        The graph itself is returned when every node is an ancestor of the target.
         Examples :
-        >>> causal_graph.visualise()
+        >>> pruned_graph = CausalGraph("microservices_latencies").prune("Website")
         """
-        image_basename = f"causal_graph_{self.id}"
-        nx.draw_networkx(self.graph)
-        visualise_graph(image_basename, f"Causal Graph for {self.data_name}")
-        return self
+        if target not in self._pruned_graphs:
+            form = self.get_ancestral_form(target)
+            if len(form) == len(self.form):
+                self._pruned_graphs[target] = self
+            else:
+                pruned_graph = CausalGraph(self.data_name, form=form)
+                pruned_graph.graph.add_node(target)  # a root target has no edge left
+                logger.info(f"Causal graph pruned from {self.graph.number_of_nodes()} to {pruned_graph.graph.number_of_nodes()} nodes, the ancestors of {target}")
+                self._pruned_graphs[target] = pruned_graph
+        return self._pruned_graphs[target]
+
+    def visualise(self, wait: bool = True) -> RenderedPlot:
+        """
+        Examples :
+        >>> plot = causal_graph.visualise()
+        >>> open_in_browser(plot)
+        """
+        return renderer.render(f"causal_graph_{self.data_name}", f"Causal Graph for {self.data_name}", draw_graph, wait=wait, edges=self.form)
 
     def refutate(self) -> str:
         """
         Examples :
         >>> causal_graph.refutate()
         """
-        image_basename = f"causal_graph_refutation_{self.id}"
-        png_path = os.path.join(ARTIFACTS_DIR, image_basename + ".png")
-        data = get_data(self.data_name)
-        self.refutation = falsify_graph(
-            self.graph,
-            data,
-            show_progress_bar=True,
-            plot_histogram=True,
-            plot_kwargs={"savepath": png_path, "display": False},
-        )
-        visualise_graph(image_basename, f"Causal Graph refutation report for {self.data_name}", in_memory=False)
+        from agentic_supply.causality_assistant.graph_refutation import GraphRefutator, get_violations
+
+        # CI tests already run on the same data, e.g. for a previous version of the graph, are served from cache
+        refutator = GraphRefutator(self.data_name)
+        self.refutation = refutator.refute(self.graph)
+        if self.refutation.can_evaluate:
+            self.refutation_plot = renderer.render(
+                f"causal_graph_refutation_{self.data_name}",
+                f"Causal Graph refutation report for {self.data_name}",
+                draw_refutation,
+                wait=False,
+                violations=get_violations(self.refutation),
+            )
         self.refutation_report = f"Graph is falsifiable: {self.refutation.falsifiable}, Graph is falsified: {self.refutation.falsified}\n\n{repr(self.refutation)}"
+        self.refutation_report += (
+            f"\n\n{refutator.stats['num_permutations_evaluated']}/{refutator.stats['num_permutations']} permutations evaluated, "
+            f"{refutator.stats['num_tests_run']} CI tests run (the others were cached)"
+        )
+        if self.refutation_plot is not None:
+            self.refutation_report += f"\n\nRefutation plot : {self.refutation_plot.html_path}"
         return self.refutation_report
@@ -0,0 +1,158 @@
+"""
+Counterfactuals of many interventions for the same observed rows.
+
+A counterfactual is computed in three steps : abduction (inferring the noise of every node from the observed rows),
+action (applying the intervention) and prediction (propagating it downstream with the inferred noise).
+gcm.counterfactual_samples runs the three steps for a single intervention, so comparing N alternative interventions
+infers the same noise N times and evaluates every mechanism N times.
+Here, the noise is inferred once and cached by the hash of the observed rows, then the N scenarios are stacked and
+propagated together : every mechanism is evaluated once over the N stacked copies of the rows, and each intervention
+is applied to its own copy.
+
+Examples :
+>>> from agentic_supply.causality_assistant.counterfactuals import NoiseCache, batch_counterfactual_samples
+>>> noise_cache = NoiseCache()
+>>> noise_data = noise_cache.get_or_compute(causal_analysis.model, observed_data)
+>>> samples = batch_counterfactual_samples(causal_analysis.model, noise_data, {"X : 0": parse_interventions("X : 0"), "X : x + 1": parse_interventions("X : x + 1")})
+>>> samples.loc["X : 0"]
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Collection, Dict, Optional
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+from agentic_supply.utilities.config import NOISE_CACHE_MAX_ENTRIES
+from agentic_supply.utilities.log_utils import set_logging, get_logger
+
+
+set_logging()
+logger = get_logger(__name__)
+
+
+FACTUAL_SCENARIO = "factual"
+
+
+def get_observed_data_hash(observed_data: pd.DataFrame, nodes: list) -> str:
+    """
+    Content hash of the node columns of the observed rows, their row labels included.
+    """
+    hashes = pd.util.hash_pandas_object(observed_data[nodes], index=True).to_numpy()
+    return hashlib.sha256("\n".join(map(str, nodes)).encode("utf-8") + hashes.tobytes()).hexdigest()
+
+
+class NoiseCache:
+    """
+    LRU cache of the noise inferred from observed rows, for one fitted model : clear it when the model is refitted.
+
+    Examples :
+    >>> noise_cache = NoiseCache(max_entries=16)
+    >>> noise_data = noise_cache.get_or_compute(causal_analysis.model, observed_data)
+    >>> noise_cache.clear()
+    """
+
+    def __init__(self, max_entries: int = NOISE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, pd.DataFrame]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_or_compute(self, model: Any, observed_data: pd.DataFrame) -> pd.DataFrame:
+        from dowhy.gcm._noise import compute_noise_from_data
+
+        key = get_observed_data_hash(observed_data, list(model.graph.nodes))
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        logger.info(f"Inferring the noise of {len(observed_data)} observed rows")
+        noise_data = compute_noise_from_data(model, observed_data)
+        noise_data.index = observed_data.index
+        with self._lock:
+            self._entries[key] = noise_data
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return noise_data
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _get_parent_values(values: Dict[str, np.ndarray], parents: list) -> np.ndarray:
+    # same 2d array as dowhy builds from a dataframe of the parents, object dtype when the parents have mixed types
+    return pd.DataFrame({parent: values[parent] for parent in parents}, copy=False).to_numpy()
+
+
+def batch_counterfactual_samples(
+    model: Any,
+    noise_data: pd.DataFrame,
+    scenarios: Dict[str, Dict[str, Callable[[np.ndarray], np.ndarray]]],
+    include_factual: bool = True,
+    nodes: Optional[Collection[str]] = None,
+) -> pd.DataFrame:
+    """
+    Counterfactual samples of every scenario (a dict of interventions keyed by node) for the rows of noise_data,
+    in a single topological pass over the stacked scenarios.
+    Returns one frame indexed by (scenario, row), the rows being labelled like noise_data. With include_factual,
+    the "factual" scenario without intervention reconstructs the observed rows, to compare the scenarios against.
+    When nodes is given, only those nodes are propagated, e.g. a target and its ancestors : it must contain the parents of its nodes.
+    """
+    from dowhy.gcm.causal_models import validate_causal_dag
+    from dowhy.graph import get_ordered_predecessors, is_root_node, validate_node_in_graph
+
+    validate_causal_dag(model.graph)
+    scenarios = {FACTUAL_SCENARIO: {}, **scenarios} if include_factual else dict(scenarios)
+    if not scenarios:
+        raise ValueError("At least one scenario should be given")
+    for interventions in scenarios.values():
+        for node in interventions:
+            validate_node_in_graph(model.graph, node)
+
+    num_rows, num_scenarios = len(noise_data), len(scenarios)
+    slices = {scenario: slice(i * num_rows, (i + 1) * num_rows) for i, scenario in enumerate(scenarios)}
+    values: Dict[str, np.ndarray] = {}
+    for node in nx.topological_sort(model.graph):
+        if nodes is not None and node not in nodes:
+            continue
+        noise = np.tile(noise_data[node].to_numpy(), num_scenarios)
+        if is_root_node(model.graph, node):
+            node_values = noise
+        else:
+            parent_values = _get_parent_values(values, get_ordered_predecessors(model.graph, node))
+            node_values = np.asarray(model.causal_mechanism(node).evaluate(parent_values, noise)).reshape(-1)
+        for scenario, interventions in scenarios.items():
+            if node in interventions:
+                # the interventions are vectorised : applied to the whole copy of the rows of their scenario at once
+                if node_values.dtype.kind not in "fcO":
+                    node_values = node_values.astype(float)
+                intervened_values = np.broadcast_to(interventions[node](node_values[slices[scenario]]), (num_rows,))
+                node_values[slices[scenario]] = intervened_values
+        values[node] = node_values
+
+    index = pd.MultiIndex.from_product([list(scenarios), noise_data.index], names=["scenario", noise_data.index.name or "row"])
+    return pd.DataFrame(values, index=index, copy=False)
+
+
+def get_scenario_summary(samples: pd.DataFrame, target: str, reference: Optional[str] = FACTUAL_SCENARIO) -> pd.DataFrame:
+    """
+    Mean of the target per scenario, and its mean difference to the reference scenario when it is in the samples.
+    Examples :
+    >>> summary = get_scenario_summary(samples, "Vision")
+    """
+    summary = samples[target].groupby(level="scenario", sort=False).mean().to_frame(f"mean {target}")
+    if reference is not None and reference in summary.index:
+        reference_values = samples.loc[reference, target].to_numpy()
+        summary[f"mean change of {target}"] = [
+            float(np.mean(samples.loc[scenario, target].to_numpy() - reference_values)) for scenario in summary.index
+        ]
+    return summary
@@ -0,0 +1,115 @@
+"""
+Dose-response curves of a target over a grid of interventions on one node.
+
+gcm.average_causal_effect samples the model from scratch for each pair of interventions, so a curve of N points costs
+N independent sampling passes, and the noise of the independent draws shows up in the differences between the points.
+Here, the noise of the target and its ancestors is drawn once, and every grid point is propagated from the same noise
+(common random numbers) in a single batched pass : the cost is one sampling pass plus the evaluation of the mechanisms
+over the stacked grid points, and the effects between points are computed on paired samples, so their bands are much
+narrower than those of independent draws.
+The bands are normal confidence intervals of the Monte Carlo means, i.e. they account for the sampling of the fitted
+model, not for the uncertainty of the fit itself (see BootstrapExecutor for that).
+
+Examples :
+>>> from agentic_supply.causality_assistant.dose_response import sweep_dose_response
+>>> curve = sweep_dose_response(causal_analysis.model, "Website", "Caching Service", grid=[0.0, 0.5, 1.0, 1.5], mode="value")
+>>> curve = sweep_dose_response(causal_analysis.model, "Website", "Caching Service", grid=[-1.0, 0.0, 1.0], mode="shift")
+"""
+
+from typing import Any, Dict, List, Literal, Optional
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+from agentic_supply.causality_assistant.counterfactuals import batch_counterfactual_samples
+from agentic_supply.causality_assistant.intervention_parsing import parse_interventions
+from agentic_supply.utilities.config import DOSE_RESPONSE_NUM_SAMPLES, RANDOM_SEED
+from agentic_supply.utilities.log_utils import set_logging, get_logger
+from agentic_supply.utilities.random_utils import seeded_random_state
+
+
+set_logging()
+logger = get_logger(__name__)
+
+
+SWEEP_MODES = Literal["value", "shift"]
+
+
+def get_grid_intervention_strs(node: str, grid: List[float], mode: SWEEP_MODES = "value") -> Dict[float, str]:
+    """
+    Examples :
+    >>> get_grid_intervention_strs("X", [0.0, 1.0], mode="shift")
+    {0.0: 'X : x + 0.0', 1.0: 'X : x + 1.0'}
+    """
+    if mode == "value":
+        return {float(value): f"{node} : {float(value)}" for value in grid}
+    if mode == "shift":
+        return {float(value): f"{node} : x + {float(value)}" for value in grid}
+    raise ValueError(f"Unknown sweep mode {mode}, expected 'value' or 'shift'")
+
+
+def get_default_reference(grid: List[float], mode: SWEEP_MODES = "value") -> float:
+    # no shift when it is on the grid, the first grid point otherwise
+    return 0.0 if mode == "shift" and 0.0 in grid else float(grid[0])
+
+
+def sweep_dose_response(
+    model: Any,
+    target: str,
+    node: str,
+    grid: List[float],
+    mode: SWEEP_MODES = "value",
+    reference: Optional[float] = None,
+    num_samples: int = DOSE_RESPONSE_NUM_SAMPLES,
+    confidence_level: float = 0.95,
+    seed: Optional[int] = RANDOM_SEED,
+) -> pd.DataFrame:
+    """
+    Mean of the target at each grid point (atomic interventions node := value, or shifts node := x + value), and its
+    average causal effect against the reference grid point, with their confidence bands.
+    Returns one row per grid point, indexed by the grid values.
+    """
+    from scipy.stats import norm
+    from dowhy.gcm._noise import noise_samples_of_ancestors
+
+    if not grid:
+        raise ValueError("The grid should have at least one value")
+    ancestors = nx.ancestors(model.graph, target)
+    if node not in ancestors:
+        raise ValueError(f"{node} is not an ancestor of {target} : intervening on it has no effect on {target}")
+    grid = [float(value) for value in grid]
+    reference = float(reference) if reference is not None else get_default_reference(grid, mode)
+    intervention_strs = get_grid_intervention_strs(node, sorted(set(grid) | {reference}), mode)
+
+    logger.info(f"Sweeping {len(intervention_strs)} interventions of {mode} on {node} over {num_samples} common noise samples")
+    with seeded_random_state(seed):
+        # one sampling pass : the noise of the target and its ancestors, shared by all the grid points
+        _, noise_data = noise_samples_of_ancestors(model, target, num_samples)
+        samples = batch_counterfactual_samples(
+            model,
+            noise_data,
+            {value: parse_interventions(intervention_str) for value, intervention_str in intervention_strs.items()},
+            include_factual=False,
+            nodes=ancestors | {target},
+        )
+    # one row of target values per grid point, the columns being the common noise samples
+    values = samples[target].to_numpy(dtype=float).reshape(len(intervention_strs), num_samples)
+    differences = values - values[list(intervention_strs).index(reference)]
+
+    z = norm.ppf(0.5 + confidence_level / 2)
+    means, effects = values.mean(axis=1), differences.mean(axis=1)
+    mean_errors = z * values.std(axis=1, ddof=1) / np.sqrt(num_samples) if num_samples > 1 else np.zeros(len(means))
+    effect_errors = z * differences.std(axis=1, ddof=1) / np.sqrt(num_samples) if num_samples > 1 else np.zeros(len(effects))
+    curve = pd.DataFrame(
+        {
+            "intervention": list(intervention_strs.values()),
+            f"mean {target}": means,
+            "mean_lower": means - mean_errors,
+            "mean_upper": means + mean_errors,
+            "effect": effects,
+            "effect_lower": effects - effect_errors,
+            "effect_upper": effects + effect_errors,
+        },
+        index=pd.Index(list(intervention_strs), name=f"{node} {mode}"),
+    )
+    return curve.loc[sorted(set(grid))]
@@ -0,0 +1,180 @@
+"""
+Week-over-week drift report : distribution change attributions for many pairs of data partitions at once.
+
+gcm.distribution_change refits the mechanisms of both sides from scratch for every pair it is called on.
+Here the data is partitioned once (e.g. by week), the mechanisms of the causal model are cloned and fitted once
+per partition, and every requested pair (by default each pair of consecutive partitions) only runs the mechanism
+change tests and the Shapley estimation, on a process pool.
+As in gcm.distribution_change, a node whose mechanism did not significantly change keeps the same mechanism on
+both sides of a pair (the one of the old partition), so that it is not blamed for estimation noise.
+
+References :
+    https://www.pywhy.org/dowhy/v0.13/user_guide/causal_tasks/root_causing_and_explaining/distribution_change.html
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+from agentic_supply.utilities.config import BOOTSTRAP_NUM_WORKERS, RANDOM_SEED
+from agentic_supply.utilities.log_utils import set_logging, get_logger
+from agentic_supply.utilities.parallel import configure_pool_worker, get_num_workers
+from agentic_supply.utilities.random_utils import seeded_random_state
+
+
+set_logging()
+logger = get_logger(__name__)
+
+
+def get_pair_label(pair: Tuple[str, str]) -> str:
+    return f"{pair[0]}->{pair[1]}"
+
+
+def get_consecutive_pairs(partitions: List[str]) -> List[Tuple[str, str]]:
+    """
+    Examples :
+    >>> get_consecutive_pairs(["w1", "w2", "w3"])
+    [('w1', 'w2'), ('w2', 'w3')]
+    """
+    return list(zip(partitions[:-1], partitions[1:]))
+
+
+def get_natural_key(value: Any) -> Tuple:
+    """
+    Sort key comparing the digit runs of a label as numbers.
+    Examples :
+    >>> sorted(["w10", "w2", "w1"], key=get_natural_key)
+    ['w1', 'w2', 'w10']
+    """
+    return tuple((0, int(part), "") if part.isdigit() else (1, 0, part) for part in re.split(r"(\d+)", str(value)) if part)
+
+
+def partition_data(data: pd.DataFrame, nodes: List[str], partition_column: str) -> Dict[str, pd.DataFrame]:
+    """
+    Splits the node columns of data by the values of partition_column, in a single pass over the frame.
+    The partitions are ordered by the categories of a categorical column, by value for a numeric column,
+    and in natural order otherwise ("w2" before "w10"), so that consecutive partitions are consecutive periods.
+    """
+    if partition_column not in data.columns:
+        raise ValueError(f"The data has no partition column {partition_column}, available columns : {list(data.columns)}")
+    column = data[partition_column]
+    ordered = isinstance(column.dtype, pd.CategoricalDtype) or column.dtype.kind in "biuf"
+    partitions = [(value, partition[nodes]) for value, partition in data.groupby(partition_column, sort=ordered, observed=True)]
+    if not ordered:
+        partitions.sort(key=lambda item: get_natural_key(item[0]))
+    return {str(value): partition for value, partition in partitions}
+
+
+def fit_partition_models(model: Any, target: str, partitions: Dict[str, pd.DataFrame]) -> Dict[str, Any]:
+    """
+    One copy of the model per partition, restricted to the ancestors of the target, with the mechanisms of the model
+    cloned (unfitted) and fitted on that partition only.
+    """
+    from dowhy import gcm
+    from dowhy.gcm.causal_models import clone_causal_models
+    from dowhy.graph import node_connected_subgraph_view
+
+    graph = node_connected_subgraph_view(model.graph, target)
+    partition_models = {}
+    for name, partition in partitions.items():
+        logger.info(f"Fitting the mechanisms on partition {name} ({len(partition)} rows)")
+        partition_model = gcm.ProbabilisticCausalModel(graph.copy())
+        clone_causal_models(graph, partition_model.graph)
+        gcm.fit(partition_model, partition)
+        partition_models[name] = partition_model
+    return partition_models
+
+
+def _get_pair_model(model_old: Any, model_new: Any, changed: Dict[str, bool]) -> Any:
+    # the fitted attributes of the new partition for the changed nodes, those of the old one otherwise
+    from dowhy import gcm
+
+    pair_model = gcm.ProbabilisticCausalModel(model_new.graph.copy())
+    for node in pair_model.graph.nodes:
+        source = model_new if changed[node] else model_old
+        pair_model.graph.nodes[node].update(source.graph.nodes[node])
+    return pair_model
+
+
+def _attribute_pair(
+    model_old: Any,
+    model_new: Any,
+    data_old: pd.DataFrame,
+    data_new: pd.DataFrame,
+    target: str,
+    num_samples: int,
+    shapley_config: Any,
+    significance_level: float,
+    seed: int,
+    in_worker: bool = False,
+) -> Tuple[Dict[str, float], Dict[str, bool]]:
+    from dowhy import gcm
+    from dowhy.gcm.distribution_change import _check_significant_mechanism_change
+    from dowhy.gcm.independence_test import kernel_based
+
+    if in_worker:
+        configure_pool_worker()
+    with seeded_random_state(seed):
+        changed = _check_significant_mechanism_change(
+            model_old.graph, data_old, data_new, kernel_based, kernel_based, significance_level, "fdr_bh"
+        )
+        changed = {node: bool(value) for node, value in changed.items()}
+        contributions = gcm.distribution_change_of_graphs(
+            model_old, _get_pair_model(model_old, model_new, changed), target, num_samples=num_samples, shapley_config=shapley_config
+        )
+    return {node: float(value) for node, value in contributions.items()}, changed
+
+
+def attribute_distribution_drift(
+    model: Any,
+    target: str,
+    data: pd.DataFrame,
+    partition_column: str = "week",
+    pairs: Optional[List[Tuple[str, str]]] = None,
+    num_samples: int = 500,
+    shapley_config: Any = None,
+    significance_level: float = 0.05,
+    num_workers: int = BOOTSTRAP_NUM_WORKERS,
+    seed: Optional[int] = RANDOM_SEED,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Returns the time series of the distribution change attributions (one row per pair, one column per node)
+    and the matching table of mechanism changes (True when the mechanism of a node changed significantly).
+    Each pair gets its own seed spawned from the root seed, so the results do not depend on num_workers.
+    Examples :
+    >>> data = get_data("supply_chain_logistics")
+    >>> contributions, changes = attribute_distribution_drift(causal_analysis.model, "received", data, partition_column="week")
+    >>> contributions, changes = attribute_distribution_drift(causal_analysis.model, "received", data, pairs=[("w1", "w2")])
+    """
+    from dowhy.graph import node_connected_subgraph_view
+
+    nodes = list(node_connected_subgraph_view(model.graph, target).nodes)
+    partitions = partition_data(data, nodes, partition_column)
+    pairs = [(str(old), str(new)) for old, new in pairs] if pairs is not None else get_consecutive_pairs(list(partitions))
+    if not pairs:
+        raise ValueError(f"At least two values of {partition_column} are needed for a drift report, got {list(partitions)}")
+    unknown = sorted({name for pair in pairs for name in pair} - set(partitions))
+    if unknown:
+        raise ValueError(f"Unknown values of {partition_column} : {unknown}, available values : {list(partitions)}")
+
+    used = sorted({name for pair in pairs for name in pair}, key=list(partitions).index)
+    partition_models = fit_partition_models(model, target, {name: partitions[name] for name in used})
+    seeds = [int(child.generate_state(1)[0] & np.iinfo(np.int32).max) for child in np.random.SeedSequence(seed).spawn(len(pairs))]
+    arguments = [
+        (partition_models[old], partition_models[new], partitions[old], partitions[new], target, num_samples, shapley_config, significance_level, pair_seed)
+        for (old, new), pair_seed in zip(pairs, seeds)
+    ]
+    num_workers = min(get_num_workers(num_workers), len(pairs))
+    logger.info(f"Attributing the distribution changes of {len(pairs)} pair(s) of {partition_column} on {num_workers} worker(s)")
+    if num_workers == 1:
+        results = [_attribute_pair(*pair_arguments) for pair_arguments in arguments]
+    else:
+        from joblib import Parallel, delayed
+
+        results = Parallel(n_jobs=num_workers, backend="loky")(delayed(_attribute_pair)(*pair_arguments, in_worker=True) for pair_arguments in arguments)
+
+    index = pd.Index([get_pair_label(pair) for pair in pairs], name=f"{partition_column}_pair")
+    contributions = pd.DataFrame([result[0] for result in results], index=index)[nodes]
+    changes = pd.DataFrame([result[1] for result in results], index=index)[nodes]
+    return contributions, changes
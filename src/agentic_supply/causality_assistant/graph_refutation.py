@@ -0,0 +1,312 @@
+"""
+Graph refutation engine with cached and parallel conditional independence (CI) tests.
+
+Same permutation-based test as gcm.falsify.falsify_graph : the local Markov conditions (LMC) violated by the given graph
+are compared to those violated by random node permutations of it. Here :
+- each CI test result is cached by (variables, conditioning set, data fingerprint), in memory and on disk,
+  so that refuting an edited graph only runs the tests the edit introduced ;
+- the missing tests of a batch of permutations run across a process pool ;
+- permutations stop being evaluated as soon as the falsification decision can no longer change.
+Every test is seeded from its own key, so the results do not depend on the cache state, the number of workers or the order of the tests.
+
+References :
+    https://www.pywhy.org/dowhy/v0.13/user_guide/modeling_causal_relations/refuting_causal_graph/refute_causal_structure.html
+    https://arxiv.org/abs/2305.09565
+"""
+
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+from agentic_supply.utilities.config import DATA_NAMES, CI_TEST_NUM_WORKERS, CI_TEST_CACHE_DIR, RANDOM_SEED
+from agentic_supply.utilities.data_utils import get_data, get_data_columns, get_data_fingerprint
+from agentic_supply.utilities.file_utils import atomic_write_json
+from agentic_supply.utilities.log_utils import set_logging, get_logger
+from agentic_supply.utilities.parallel import configure_pool_worker, get_num_workers
+from agentic_supply.utilities.random_utils import seeded_random_state
+
+if TYPE_CHECKING:
+    from dowhy.gcm.falsify import EvaluationResult
+
+set_logging()
+logger = get_logger(__name__)
+
+
+CI_TEST_NAME = "kernel_based"
+Triple = Tuple[str, str, Tuple[str, ...]]
+
+
+def get_test_key(x: str, y: str, z: Tuple[str, ...]) -> str:
+    """
+    Independence tests are symmetric in x and y, and the conditioning set is unordered.
+    Examples :
+    >>> get_test_key("X", "Z", ("Y",)) == get_test_key("Z", "X", ("Y",))
+    """
+    return json.dumps([sorted([str(x), str(y)]), sorted(str(elem) for elem in z), CI_TEST_NAME])
+
+
+def _get_test_seed(key: str, seed: int) -> int:
+    key_entropy = int(hashlib.sha256(key.encode("utf-8")).hexdigest()[:16], 16)
+    return int(np.random.SeedSequence([seed, key_entropy]).generate_state(1)[0] & np.iinfo(np.int32).max)
+
+
+def _compute_p_value(x: np.ndarray, y: np.ndarray, z: Optional[np.ndarray], seed: int, in_worker: bool = False) -> float:
+    from dowhy.gcm.independence_test import kernel_based
+
+    if in_worker:
+        configure_pool_worker()
+    with seeded_random_state(seed):
+        return float(kernel_based(x, y, z))
+
+
+class CITestCache:
+    """
+    p-values of CI tests per data fingerprint, kept in memory and persisted as one JSON file per fingerprint.
+
+    Examples :
+    >>> cache = CITestCache("./logs/ci_test_cache")
+    >>> cache.get(fingerprint, get_test_key("X", "Z", ("Y",)))
+    """
+
+    def __init__(self, directory: Optional[str] = CI_TEST_CACHE_DIR):
+        self.directory = directory
+        self._p_values: Dict[str, Dict[str, Optional[float]]] = {}
+        self._lock = threading.RLock()
+
+    def _get_path(self, fingerprint: str) -> str:
+        return os.path.join(self.directory, f"{fingerprint}.json")
+
+    def _get_p_values(self, fingerprint: str) -> Dict[str, Optional[float]]:
+        with self._lock:
+            if fingerprint not in self._p_values:
+                p_values = {}
+                if self.directory is not None and os.path.isfile(self._get_path(fingerprint)):
+                    with open(self._get_path(fingerprint), "r") as f:
+                        p_values = json.load(f)
+                self._p_values[fingerprint] = p_values
+            return self._p_values[fingerprint]
+
+    def __contains__(self, item: Tuple[str, str]) -> bool:
+        fingerprint, key = item
+        return key in self._get_p_values(fingerprint)
+
+    def get(self, fingerprint: str, key: str) -> Optional[float]:
+        return self._get_p_values(fingerprint).get(key)
+
+    def put(self, fingerprint: str, key: str, p_value: Optional[float]):
+        with self._lock:
+            self._get_p_values(fingerprint)[key] = p_value
+
+    def save(self, fingerprint: str):
+        if self.directory is None:
+            return
+        with self._lock:
+            atomic_write_json(self._get_path(fingerprint), self._get_p_values(fingerprint))
+
+    def clear(self):
+        with self._lock:
+            self._p_values.clear()
+
+
+ci_test_cache = CITestCache()
+
+
+def get_parental_triples(graph: nx.DiGraph) -> List[Triple]:
+    """
+    The LMC tests implied by the graph : each node is independent of each of its non-descendants given its parents.
+    """
+    from dowhy.graph import get_ordered_predecessors
+
+    triples = []
+    for node in graph.nodes:
+        parents = tuple(get_ordered_predecessors(graph, node))
+        excluded = nx.descendants(graph, node) | {node} | set(parents)
+        triples.extend((node, non_desc, parents) for non_desc in graph.nodes if non_desc not in excluded)
+    return triples
+
+
+def get_violations(evaluation: "EvaluationResult") -> Dict[str, Dict[str, Any]]:
+    """
+    The plotted part of an evaluation result, per falsification method, for agentic_supply.utilities.rendering.draw_refutation.
+    """
+    from dowhy.gcm.falsify import FALSIFY_METHODS, FalsifyConst
+
+    return {
+        FALSIFY_METHODS[method]: {
+            "permuted": [float(f_violations) for f_violations in method_summary[FalsifyConst.F_PERM_VIOLATIONS]],
+            "given": float(method_summary[FalsifyConst.F_GIVEN_VIOLATIONS]),
+            "p_value": float(method_summary[FalsifyConst.P_VALUE]),
+        }
+        for method, method_summary in evaluation.summary.items()
+        if method != FalsifyConst.MEC
+    }
+
+
+class GraphRefutator:
+    """
+    Examples :
+    >>> from agentic_supply.causality_assistant.causal_graph import CausalGraph
+    >>> refutator = GraphRefutator("mini_data")
+    >>> evaluation = refutator.refute(CausalGraph("mini_data").graph)
+    >>> refutator.stats
+    """
+
+    def __init__(
+        self,
+        data_name: DATA_NAMES,
+        significance_level: float = 0.05,
+        significance_ci: float = 0.05,
+        n_permutations: Optional[int] = None,
+        num_workers: int = CI_TEST_NUM_WORKERS,
+        early_stopping: bool = True,
+        seed: int = RANDOM_SEED,
+        cache: CITestCache = ci_test_cache,
+    ):
+        self.data_name: DATA_NAMES = data_name
+        self.significance_level = significance_level
+        self.significance_ci = significance_ci
+        # as in falsify_graph, 1 / significance_level permutations are enough to falsify at that level
+        self.n_permutations = n_permutations if n_permutations is not None else int(1 / significance_level)
+        self.num_workers = max(1, num_workers)
+        self.early_stopping = early_stopping
+        self.seed = seed
+        self.cache = cache
+        self.data: Optional[pd.DataFrame] = None
+        self.fingerprint: Optional[str] = None
+        self.stats: Dict[str, int] = {}
+
+    def _load_data(self, graph: nx.DiGraph):
+        # only the columns of the graph's nodes are tested
+        fingerprint = get_data_fingerprint(self.data_name)
+        columns = [column for column in get_data_columns(self.data_name) if column in graph.nodes]
+        if fingerprint != self.fingerprint or list(self.data.columns) != columns:
+            self.data, self.fingerprint = get_data(self.data_name, columns=columns), fingerprint
+
+    def _get_permutations(self, graph: nx.DiGraph) -> List[nx.DiGraph]:
+        rng = np.random.default_rng(self.seed)
+        nodes = list(graph.nodes)
+        return [nx.relabel_nodes(graph, dict(zip(nodes, rng.permutation(nodes))), copy=True) for _ in range(self.n_permutations)]
+
+    def _run_tests(self, triples: List[Triple]):
+        """
+        Runs the tests of the triples missing from the cache, in parallel, and caches their p-values.
+        """
+        from joblib import Parallel, delayed
+
+        to_test: Dict[str, Triple] = {}
+        for x, y, z in triples:
+            key = get_test_key(x, y, z)
+            if key in to_test or (self.fingerprint, key) in self.cache:
+                continue
+            if not {x, y, *z}.issubset(self.data.columns):
+                logger.warning(f"Couldn't find data for the test {x} _|_ {y} | {list(z)}, skipping it")
+                self.cache.put(self.fingerprint, key, None)
+                continue
+            to_test[key] = (x, y, z)
+        self.stats["num_tests_run"] += len(to_test)
+        if not to_test:
+            return
+        arguments = [
+            (self.data[x].values, self.data[y].values, self.data[list(z)].values if z else None, _get_test_seed(key, self.seed))
+            for key, (x, y, z) in to_test.items()
+        ]
+        num_workers = min(get_num_workers(self.num_workers), len(arguments))
+        logger.info(f"Running {len(arguments)} CI tests on {num_workers} worker(s)")
+        if num_workers == 1:
+            p_values = [_compute_p_value(*args) for args in arguments]
+        else:
+            p_values = Parallel(n_jobs=num_workers, backend="loky")(delayed(_compute_p_value)(*args, in_worker=True) for args in arguments)
+        for key, p_value in zip(to_test, p_values):
+            self.cache.put(self.fingerprint, key, p_value)
+
+    def _validate_lmc(self, graph: nx.DiGraph) -> Dict[Any, Any]:
+        from dowhy.gcm.falsify import FalsifyConst
+
+        triples = get_parental_triples(graph)
+        self._run_tests(triples)
+        summary = {FalsifyConst.N_VIOLATIONS: 0, FalsifyConst.N_TESTS: 0, FalsifyConst.P_VALUES: {}}
+        for x, y, z in triples:
+            p_value = self.cache.get(self.fingerprint, get_test_key(x, y, z))
+            if p_value is None:
+                continue
+            violated = p_value <= self.significance_ci
+            summary[FalsifyConst.N_TESTS] += 1
+            summary[FalsifyConst.N_VIOLATIONS] += int(violated)
+            summary[FalsifyConst.P_VALUES][(x, y)] = (p_value, violated)
+        return summary
+
+    def _is_decided(self, num_better: int, num_evaluated: int) -> bool:
+        """
+        The LMC p-value is the fraction of permutations with at most as many violations as the given graph,
+        the graph being falsified when it exceeds the significance level.
+        Also when the graph is not falsifiable : the LMC p-value is still reported and plotted, so it should be
+        on the right side of the significance level.
+        """
+        if not self.early_stopping or num_evaluated == 0:
+            return False
+        threshold = self.significance_level * self.n_permutations
+        num_remaining = self.n_permutations - num_evaluated
+        return num_better > threshold or num_better + num_remaining <= threshold
+
+    def refute(self, graph: nx.DiGraph) -> "EvaluationResult":
+        """
+        Same output as gcm.falsify.falsify_graph, with the LMC statistics of the permuted graphs computed
+        only on the permutations evaluated before the decision was reached.
+        """
+        from dowhy.gcm.falsify import EvaluationResult, FalsifyConst, validate_tpa
+
+        self._load_data(graph)
+        self.stats = dict(num_tests_run=0, num_permutations=self.n_permutations, num_permutations_evaluated=0)
+        permutations = self._get_permutations(graph)
+        given_lmc = self._validate_lmc(graph)
+
+        # the permutations lying in the Markov equivalence class of the given graph only need graphical checks
+        tpa_summaries = [validate_tpa(permuted_graph, causal_graph_reference=graph) for permuted_graph in permutations]
+        tpa_f_violations = [summary[FalsifyConst.N_VIOLATIONS] / max(1, summary[FalsifyConst.N_TESTS]) for summary in tpa_summaries]
+        tpa_p_value = sum(f_violations <= 0 for f_violations in tpa_f_violations) / len(permutations)
+
+        given_f_violations = given_lmc[FalsifyConst.N_VIOLATIONS] / max(1, given_lmc[FalsifyConst.N_TESTS])
+        lmc_perm_violations, lmc_f_violations, num_better = [], [], 0
+        for start in range(0, len(permutations), self.num_workers):
+            batch = permutations[start : start + self.num_workers]
+            # the tests of the whole batch are run together, the decision is still taken permutation by permutation
+            self._run_tests([triple for permuted_graph in batch for triple in get_parental_triples(permuted_graph)])
+            for permuted_graph in batch:
+                if self._is_decided(num_better, len(lmc_f_violations)):
+                    break
+                summary = self._validate_lmc(permuted_graph)
+                lmc_perm_violations.append(summary[FalsifyConst.N_VIOLATIONS])
+                lmc_f_violations.append(summary[FalsifyConst.N_VIOLATIONS] / max(1, summary[FalsifyConst.N_TESTS]))
+                num_better += lmc_f_violations[-1] <= given_f_violations
+            if self._is_decided(num_better, len(lmc_f_violations)):
+                break
+        self.cache.save(self.fingerprint)
+        self.stats["num_permutations_evaluated"] = len(lmc_f_violations)
+        logger.info(f"Graph refutation for {self.data_name} : {self.stats}")
+
+        summary = {
+            FalsifyConst.VALIDATE_LMC: {
+                FalsifyConst.PERM_VIOLATIONS: lmc_perm_violations,
+                FalsifyConst.GIVEN_VIOLATIONS: given_lmc[FalsifyConst.N_VIOLATIONS],
+                FalsifyConst.N_TESTS: given_lmc[FalsifyConst.N_TESTS],
+                FalsifyConst.F_PERM_VIOLATIONS: lmc_f_violations,
+                FalsifyConst.F_GIVEN_VIOLATIONS: given_f_violations,
+                FalsifyConst.P_VALUE: num_better / max(1, len(lmc_f_violations)),
+                FalsifyConst.LOCAL_VIOLATION_INSIGHT: given_lmc[FalsifyConst.P_VALUES],
+            },
+            FalsifyConst.VALIDATE_TPA: {
+                FalsifyConst.PERM_VIOLATIONS: [summary[FalsifyConst.N_VIOLATIONS] for summary in tpa_summaries],
+                FalsifyConst.GIVEN_VIOLATIONS: 0,
+                FalsifyConst.N_TESTS: len(get_parental_triples(graph)),
+                FalsifyConst.F_PERM_VIOLATIONS: tpa_f_violations,
+                FalsifyConst.F_GIVEN_VIOLATIONS: 0.0,
+                FalsifyConst.P_VALUE: tpa_p_value,
+            },
+            FalsifyConst.MEC: [permuted_graph for permuted_graph, f in zip(permutations, tpa_f_violations) if f <= 0],
+        }
+        return EvaluationResult(summary=summary, significance_level=self.significance_level, suggestions={})
@@ -0,0 +1,192 @@
+"""
+Safe compiler for the intervention strings given by the user, with the syntax "Node : expr, Node2 : expr".
+
+Each expression is a function of the node's current value x, e.g. "x + 5" (shift), "x * 5" (proportional), "5" (atomic).
+Expressions are parsed with the ast module, checked against a whitelist of operators and functions, and compiled to
+NumPy-vectorised callables, working on scalars as well as arrays. Compiled expressions are cached by their normalised form.
+Numeric constants are evaluated as float64 : Python integers are unbounded, so "9 ** 9 ** 9 ** 9" would never finish,
+while in float64 it overflows to inf right away.
+
+Examples :
+    python -m agentic_supply.causality_assistant.intervention_parsing # checks the parsing of the supported syntax
+"""
+
+import ast
+from functools import lru_cache
+from typing import Callable, Dict, List, Tuple
+import numpy as np
+
+from agentic_supply.utilities.config import INTERVENTION_CACHE_SIZE
+from agentic_supply.utilities.log_utils import set_logging, get_logger
+
+
+set_logging()
+logger = get_logger(__name__)
+
+
+VARIABLE_NAME = "x"
+FUNCTIONS: Dict[str, Callable] = {
+    "abs": np.abs,
+    "exp": np.exp,
+    "log": np.log,
+    "sqrt": np.sqrt,
+    "sin": np.sin,
+    "cos": np.cos,
+    "tan": np.tan,
+    "floor": np.floor,
+    "ceil": np.ceil,
+    "round": np.round,
+    "min": np.minimum,
+    "max": np.maximum,
+}
+CONSTANTS: Dict[str, float] = {"pi": np.pi, "e": np.e}
+ALLOWED_NODES = (
+    ast.Expression,
+    ast.BinOp,
+    ast.UnaryOp,
+    ast.Call,
+    ast.Name,
+    ast.Load,
+    ast.Constant,
+    ast.Add,
+    ast.Sub,
+    ast.Mult,
+    ast.Div,
+    ast.FloorDiv,
+    ast.Mod,
+    ast.Pow,
+    ast.UAdd,
+    ast.USub,
+)
+
+
+def _constant(value: float) -> Callable:
+    def intervention(x):
+        return np.full(np.shape(x), value) if np.ndim(x) else value
+
+    return intervention
+
+
+def _validate(tree: ast.Expression, expression: str):
+    called_names = {id(node.func) for node in ast.walk(tree) if isinstance(node, ast.Call)}
+    for node in ast.walk(tree):
+        if not isinstance(node, ALLOWED_NODES):
+            raise ValueError(f"Unsupported syntax '{type(node).__name__}' in intervention expression '{expression}'")
+        if isinstance(node, ast.Constant) and (isinstance(node.value, bool) or not isinstance(node.value, (int, float))):
+            raise ValueError(f"Unsupported constant {node.value!r} in intervention expression '{expression}'")
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS or node.keywords:
+                raise ValueError(f"Unsupported function call in intervention expression '{expression}', use one of {list(FUNCTIONS)}")
+        elif isinstance(node, ast.Name) and id(node) not in called_names and node.id not in (VARIABLE_NAME, *CONSTANTS):
+            raise ValueError(f"Unknown symbol '{node.id}' in intervention expression '{expression}', only '{VARIABLE_NAME}' is allowed")
+
+
+def _parse_expression(expression: str) -> ast.Expression:
+    # "^" is accepted as the power operator, as sympy did
+    try:
+        tree = ast.parse(expression.strip().replace("^", "**"), mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"Invalid intervention expression '{expression}' : {e.msg}") from e
+    _validate(tree, expression)
+    return tree
+
+
+FLOAT_NAME = "__float64"
+
+
+class _FloatConstants(ast.NodeTransformer):
+    def visit_Constant(self, node: ast.Constant) -> ast.AST:
+        return ast.copy_location(ast.Call(func=ast.Name(id=FLOAT_NAME, ctx=ast.Load()), args=[node], keywords=[]), node)
+
+
+@lru_cache(maxsize=INTERVENTION_CACHE_SIZE)
+def _compile_normalised_expression(normalised_expression: str) -> Callable:
+    tree = ast.fix_missing_locations(_FloatConstants().visit(ast.parse(normalised_expression, mode="eval")))
+    namespace = {"__builtins__": {}, FLOAT_NAME: np.float64, **FUNCTIONS, **CONSTANTS}
+    if not any(isinstance(node, ast.Name) and node.id == VARIABLE_NAME for node in ast.walk(tree)):
+        # atomic intervention : evaluate the constant once
+        with np.errstate(all="ignore"):
+            return _constant(eval(compile(tree, "<intervention>", "eval"), namespace))
+    lambda_tree = ast.Expression(
+        body=ast.Lambda(
+            args=ast.arguments(posonlyargs=[], args=[ast.arg(arg=VARIABLE_NAME)], kwonlyargs=[], kw_defaults=[], defaults=[]),
+            body=tree.body,
+        )
+    )
+    ast.fix_missing_locations(lambda_tree)
+    return eval(compile(lambda_tree, "<intervention>", "eval"), namespace)
+
+
+def compile_expression(expression: str) -> Callable:
+    """
+    Examples :
+    >>> compile_expression("x + 5")(np.array([1.0, 2.0]))
+    >>> compile_expression("max(x, 0) ^ 2")(-1.0)
+    >>> compile_expression("9 ** 9 ** 9 ** 9")(1.0) # inf
+    """
+    return _compile_normalised_expression(ast.unparse(_parse_expression(expression)))
+
+
+def _split_top_level(expression_str: str, separator: str = ",") -> List[str]:
+    """
+    Splits on the separator outside of parentheses, so that commas in function calls such as max(x, 0) are kept.
+    """
+    parts, depth, current = [], 0, []
+    for char in expression_str:
+        depth += (char == "(") - (char == ")")
+        if char == separator and depth == 0:
+            parts.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+    parts.append("".join(current))
+    return parts
+
+
+@lru_cache(maxsize=INTERVENTION_CACHE_SIZE)
+def _parse_interventions(expression_str: str) -> Tuple[Tuple[str, Callable], ...]:
+    node_to_intervention = []
+    for expression in _split_top_level(expression_str):
+        node, separator, intervention_str = (elem.strip() for elem in expression.rpartition(":"))
+        if not separator or not node or not intervention_str:
+            raise ValueError(f"Invalid intervention '{expression.strip()}', expected the syntax 'Node : expression'")
+        node_to_intervention.append((node, compile_expression(intervention_str)))
+        logger.debug(f"Parsed {intervention_str} on {node}")
+    return tuple(node_to_intervention)
+
+
+def parse_interventions(expression_str: str) -> Dict[str, Callable]:
+    """
+    Examples :
+    >>> interventions = parse_interventions("X : x + 5") # shift
+    >>> interventions = parse_interventions("X : x * 5") # proportional
+    >>> interventions = parse_interventions("X : 5") # atomic
+    >>> interventions = parse_interventions("X : x + 1, Y : 0") # multiple
+    """
+    return dict(_parse_interventions(" ".join(expression_str.split())))
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    checks = [
+        ("X : x + 5", {"X": 6.0}),
+        ("X : x * 5", {"X": 5.0}),
+        ("X : 5", {"X": 5.0}),
+        ("X : x + 1, Y : max(x, 0) ^ 2", {"X": 2.0, "Y": 1.0}),
+        ("X : 9 ** 9 ** 9 ** 9", {"X": np.inf}),  # unbounded in Python integers
+        ("X : x ** 9 ** 9 ** 9", {"X": 1.0}),
+        ("X : 10 ** 400 - 10 ** 400", {"X": np.nan}),
+    ]
+    failures = 0
+    for expression_str, expected in checks:
+        start = time.perf_counter()
+        interventions = parse_interventions(expression_str)
+        with np.errstate(all="ignore"):
+            values = {node: float(intervention(1.0)) for node, intervention in interventions.items()}
+        duration = time.perf_counter() - start
+        passed = values.keys() == expected.keys() and all(np.isclose(values[node], expected[node], equal_nan=True) for node in expected) and duration < 1.0
+        failures += not passed
+        print(f"{'OK' if passed else 'FAIL'} {expression_str} -> {values} in {duration:.4f}s")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,176 @@
+"""
+Cached selection of the causal mechanisms, with quality presets.
+
+gcm.auto.assign_causal_mechanisms cross-validates candidate regressors and classifiers for every node on every fit,
+and only the summary string of its choice is kept. Here, the choice of every node is cached, in memory and on disk,
+keyed by the node, its ordered parents, the fingerprint of their columns, the quality preset and the library versions :
+a later fit on the same columns reuses the selected (unfitted) mechanism instead of selecting it again.
+The model selection itself is dowhy's, per node, and is timed.
+
+Examples :
+>>> from agentic_supply.causality_assistant.mechanism_selection import mechanism_selection_cache
+>>> report = mechanism_selection_cache.assign(causal_analysis.model, causal_analysis.data, fingerprints, quality="better")
+>>> print(report)
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+from typing import Any, Dict, List, Literal, Optional, Tuple
+import networkx as nx
+import pandas as pd
+from pydantic import BaseModel, Field
+
+from agentic_supply.utilities.config import MECHANISM_CACHE_DIR, MECHANISM_ASSIGNMENT_QUALITY
+from agentic_supply.causality_assistant.model_store import get_versions
+from agentic_supply.utilities.file_utils import atomic_write_pickle
+from agentic_supply.utilities.log_utils import set_logging, get_logger
+
+
+set_logging()
+logger = get_logger(__name__)
+
+
+QUALITY_PRESETS = Literal["good", "better", "best"]
+
+
+class NodeAssignment(BaseModel):
+    node: str
+    parents: List[str] = Field(default_factory=list)
+    mechanism: str
+    cached: bool = Field(default=False, description="Whether the selection was reused instead of being run")
+    duration: float = Field(description="Duration of the selection in seconds, or of the cache lookup when cached")
+    selection_duration: float = Field(default=0.0, description="Duration of the original selection in seconds")
+    performances: List[Tuple[str, float, str]] = Field(default_factory=list, description="Candidate models, their performance and metric")
+
+
+class MechanismAssignmentReport(BaseModel):
+    quality: str
+    nodes: List[NodeAssignment] = Field(default_factory=list)
+
+    @property
+    def duration(self) -> float:
+        return sum(assignment.duration for assignment in self.nodes)
+
+    def __str__(self) -> str:
+        num_cached = sum(assignment.cached for assignment in self.nodes)
+        lines = [
+            f"Causal mechanisms assigned with the '{self.quality}' quality in {self.duration:.2f}s, "
+            f"{num_cached}/{len(self.nodes)} selections reused from cache :"
+        ]
+        for assignment in self.nodes:
+            origin = f"reused (selected in {assignment.selection_duration:.2f}s)" if assignment.cached else f"selected in {assignment.duration:.2f}s"
+            lines.append(f"- {assignment.node} := {assignment.mechanism}, {origin}")
+            for model, performance, metric in assignment.performances:
+                lines.append(f"    {model} : {metric} {performance}")
+        return "\n".join(lines)
+
+
+def get_quality(quality: QUALITY_PRESETS) -> Any:
+    from dowhy.gcm.auto import AssignmentQuality
+
+    try:
+        return AssignmentQuality[quality.upper()]
+    except KeyError:
+        raise ValueError(f"Unknown assignment quality {quality}, expected one of 'good', 'better' or 'best'") from None
+
+
+def get_selection_key(node: str, parents: List[str], fingerprint: str, quality: QUALITY_PRESETS) -> str:
+    versions = {package: version for package, version in get_versions().items() if package in ("dowhy", "scikit-learn")}
+    payload = json.dumps(dict(node=str(node), parents=[str(parent) for parent in parents], fingerprint=fingerprint, quality=quality, versions=versions))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MechanismSelectionCache:
+    """
+    Examples :
+    >>> cache = MechanismSelectionCache(directory="./logs/mechanism_cache")
+    >>> report = cache.assign(model, data, fingerprints, quality="good", nodes=["Y"])
+    """
+
+    def __init__(self, directory: Optional[str] = MECHANISM_CACHE_DIR):
+        self.directory = directory
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.RLock()
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if key not in self._entries and self.directory is not None and os.path.isfile(self._get_path(key)):
+                try:
+                    with open(self._get_path(key), "rb") as f:
+                        self._entries[key] = pickle.load(f)
+                except (OSError, pickle.UnpicklingError, AttributeError, EOFError) as e:
+                    logger.warning(f"Ignoring the unreadable cached mechanism selection {key} : {e}")
+            return self._entries.get(key)
+
+    def put(self, key: str, entry: Dict[str, Any]):
+        with self._lock:
+            self._entries[key] = entry
+        if self.directory is None:
+            return
+        atomic_write_pickle(self._get_path(key), entry)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def assign(
+        self,
+        model: Any,
+        data: pd.DataFrame,
+        fingerprints: Dict[str, str],
+        quality: QUALITY_PRESETS = MECHANISM_ASSIGNMENT_QUALITY,
+        nodes: Optional[List[str]] = None,
+    ) -> MechanismAssignmentReport:
+        """
+        Assigns an unfitted causal mechanism to the nodes (all of them by default), reusing the cached selections.
+        fingerprints are the hashes of the columns each node's mechanism is selected on, i.e. its own and its parents'.
+        """
+        from dowhy.gcm.auto import assign_causal_mechanism_node
+        from dowhy.graph import get_ordered_predecessors
+
+        assignment_quality = get_quality(quality)
+        nodes = set(model.graph.nodes) if nodes is None else set(nodes)
+        if data[list(nodes)].isna().any().any():
+            raise ValueError("Data contains NaN, the causal mechanisms cannot be selected")
+        report = MechanismAssignmentReport(quality=quality)
+        for node in nx.topological_sort(model.graph):
+            if node not in nodes:
+                continue
+            start = time.perf_counter()
+            parents = get_ordered_predecessors(model.graph, node)
+            key = get_selection_key(node, parents, fingerprints[node], quality)
+            entry = self.get(key)
+            cached = entry is not None
+            if cached:
+                model.set_causal_mechanism(node, entry["mechanism"].clone())
+            else:
+                performances = assign_causal_mechanism_node(model, node, data, assignment_quality)
+                entry = dict(
+                    mechanism=model.causal_mechanism(node).clone(),
+                    performances=[(getattr(candidate, "__name__", str(candidate)), float(performance), str(metric)) for candidate, performance, metric in performances],
+                    duration=time.perf_counter() - start,
+                )
+                self.put(key, entry)
+            duration = time.perf_counter() - start
+            report.nodes.append(
+                NodeAssignment(
+                    node=str(node),
+                    parents=[str(parent) for parent in parents],
+                    mechanism=str(model.causal_mechanism(node)),
+                    cached=cached,
+                    duration=duration,
+                    selection_duration=entry["duration"],
+                    performances=entry["performances"],
+                )
+            )
+        return report
+
+
+mechanism_selection_cache = MechanismSelectionCache()
@@ -0,0 +1,143 @@
+"""
+In-process cache of loaded causal analyses, shared by all the causal CodedTools of a server.
+
+Loading a CausalAnalysis from file reads the data, builds the causal graph and unpickles the fitted model.
+The cache keeps the loaded instances keyed by (data name, graph form, data fingerprint), so that only the first
+causal question of a session pays for disk I/O and deserialisation.
+Entries are evicted least-recently-used first, when either the number of entries or their estimated memory exceeds the caps.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from agentic_supply.utilities.config import DATA_NAMES, MODEL_CACHE_MAX_ENTRIES, MODEL_CACHE_MAX_BYTES
+from agentic_supply.utilities.log_utils import set_logging, get_logger
+
+
+set_logging()
+logger = get_logger(__name__)
+
+
+CacheKey = Tuple[str, str, str]
+
+
+def get_form_hash(form: List[Tuple]) -> str:
+    """
+    Order-independent hash of a graph form, i.e. of its list of edges.
+    Examples :
+    >>> get_form_hash([("X", "Y"), ("Y", "Z")]) == get_form_hash([("Y", "Z"), ("X", "Y")])
+    """
+    edges = sorted(f"{source}->{target}" for source, target in form)
+    return hashlib.sha256("\n".join(edges).encode("utf-8")).hexdigest()
+
+
+class ModelCache:
+    """
+    Thread-safe LRU cache with a cap on the number of entries and on their estimated memory.
+
+    Examples :
+    >>> cache = ModelCache(max_entries=4, max_bytes=512 * 1024**2)
+    >>> causal_analysis = cache.get_or_load(("mini_data", form_hash, fingerprint), loader, sizer)
+    >>> cache.invalidate("mini_data")
+    """
+
+    def __init__(self, max_entries: int = MODEL_CACHE_MAX_ENTRIES, max_bytes: int = MODEL_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[CacheKey, Tuple[Any, int]]" = OrderedDict()
+        # loads in progress, awaited by the concurrent requests for the same key
+        self._loading: Dict[CacheKey, Future] = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(size for _, size in self._entries.values())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: CacheKey) -> bool:
+        return key in self._entries
+
+    def get(self, key: CacheKey) -> Optional[Any]:
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def put(self, key: CacheKey, value: Any, size: int = 0):
+        with self._lock:
+            self._entries[key] = (value, size)
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def get_or_load(self, key: CacheKey, loader: Callable[[], Any], sizer: Callable[[Any], int] = lambda value: 0) -> Any:
+        """
+        Returns the cached value for the key, or loads, caches and returns it.
+        The lock is only held to look up and insert the entries : the loads of different keys run concurrently,
+        and concurrent sessions asking for the same model wait for a single load of it.
+        """
+        with self._lock:
+            value = self.get(key)
+            if value is not None:
+                self.hits += 1
+                logger.info(f"Model cache hit for {key[0]} ({self.hits} hits, {self.misses} misses)")
+                return value
+            future = self._loading.get(key)
+            is_loader = future is None
+            if is_loader:
+                self.misses += 1
+                logger.info(f"Model cache miss for {key[0]}, loading it")
+                future = self._loading[key] = Future()
+            else:
+                self.hits += 1
+                logger.info(f"Model cache hit for {key[0]}, waiting for its load in progress")
+        if not is_loader:
+            return future.result()
+        try:
+            value = loader()
+            size = sizer(value)
+        except BaseException as e:
+            with self._lock:
+                if self._loading.get(key) is future:
+                    del self._loading[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            # an invalidation during the load drops its future : the loaded value is returned, but not cached
+            if self._loading.get(key) is future:
+                del self._loading[key]
+                self.put(key, value, size)
+        future.set_result(value)
+        return value
+
+    def invalidate(self, data_name: Optional[DATA_NAMES] = None):
+        """
+        Drops all the entries for the given data name, or the whole cache if None.
+        """
+        with self._lock:
+            keys = [key for key in self._entries if data_name is None or key[0] == data_name]
+            for key in keys:
+                del self._entries[key]
+            for key in [key for key in self._loading if data_name is None or key[0] == data_name]:
+                del self._loading[key]
+            if keys:
+                logger.info(f"Invalidated {len(keys)} model cache entries for {'ALL' if data_name is None else data_name}")
+
+    def stats(self) -> Dict[str, int]:
+        return dict(entries=len(self), total_bytes=self.total_bytes, hits=self.hits, misses=self.misses)
+
+    def _evict(self):
+        # always keep the most recently used entry, even if it alone exceeds the memory cap
+        while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes):
+            key, (_, size) = self._entries.popitem(last=False)
+            logger.info(f"Evicted {key[0]} from the model cache ({size} bytes)")
+
+
+model_cache = ModelCache()
@@ -0,0 +1,259 @@
+"""
+Parallel, optionally sampled and persisted evaluation of fitted causal models.
+
+gcm.evaluate_causal_model cross-validates the mechanism of every node, tests the invertibility assumptions and compares
+generated and observed distributions, over all the rows, every time it is called (and its own max_num_samples option
+does not subsample the rows). Here :
+- the per-node mechanism metrics are computed by n_jobs parallel workers ;
+- with max_num_samples, the evaluation runs on rows sampled uniformly without replacement, and the report states how
+  representative they are : the Dvoretzky-Kiefer-Wolfowitz bound on the distance between the sampled and the full
+  empirical distributions, holding for all the nodes at once at the given confidence level (union bound), and the
+  observed Kolmogorov-Smirnov distance of every node ;
+- the report is persisted under ARTIFACTS_DIR, one file per model hash, keyed by the hash of the evaluated data and by
+  the sampling settings, so that evaluating the same model on the same data again returns it without any computation.
+  A report which can not be written is only logged : the evaluation runs again next time.
+
+Examples :
+>>> from agentic_supply.causality_assistant.model_evaluation import evaluation_store, evaluate_causal_model
+>>> record = evaluate_causal_model(causal_analysis.model, causal_analysis.data, max_num_samples=2000, n_jobs=4)
+>>> record = evaluation_store.get_or_evaluate(causal_analysis.model, causal_analysis.data, model_sha256=causal_analysis.model_hash)
+>>> print(record.report)
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel, Field
+
+from agentic_supply.utilities.config import EVALUATION_DIR, EVALUATION_NUM_WORKERS, EVALUATION_CONFIDENCE_LEVEL, RANDOM_SEED
+from agentic_supply.utilities.file_utils import atomic_write_json
+from agentic_supply.utilities.log_utils import set_logging, get_logger
+from agentic_supply.utilities.parallel import get_num_workers
+from agentic_supply.utilities.random_utils import seeded_random_state
+
+
+set_logging()
+logger = get_logger(__name__)
+
+
+class EvaluationRecord(BaseModel):
+    key: str
+    model_sha256: str
+    data_sha256: str
+    num_rows: int
+    num_evaluated_rows: int
+    seed: Optional[int] = Field(default=None)
+    confidence_level: float
+    dkw_bound: Optional[float] = Field(default=None, description="Bound on the sup distance between the sampled and full empirical CDFs")
+    ks_distances: Dict[str, float] = Field(default_factory=dict, description="Observed KS distance between the sampled and full rows, per node")
+    report: str
+    duration: float = Field(description="Evaluation duration in seconds")
+    created_at: str
+
+    @property
+    def is_sampled(self) -> bool:
+        return self.num_evaluated_rows < self.num_rows
+
+    def get_sampling_statement(self) -> str:
+        if not self.is_sampled:
+            return f"Evaluated on all the {self.num_rows} rows."
+        worst_node = max(self.ks_distances, key=self.ks_distances.get) if self.ks_distances else None
+        statement = (
+            f"Evaluated on {self.num_evaluated_rows} of the {self.num_rows} rows, sampled uniformly without replacement (seed {self.seed}) : "
+            f"with {self.confidence_level:.0%} confidence for all the nodes at once, the empirical distribution of every node on the sampled rows is within "
+            f"{self.dkw_bound:.3f} (sup distance of the CDFs) of its distribution on all the rows."
+        )
+        if worst_node is not None:
+            statement += f" The largest observed distance is {self.ks_distances[worst_node]:.3f}, for {worst_node}."
+        return statement
+
+    def __str__(self) -> str:
+        return f"{self.get_sampling_statement()}\n\n{self.report}"
+
+
+def get_model_hash(model: Any) -> str:
+    return hashlib.sha256(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)).hexdigest()
+
+
+def get_data_hash(data: pd.DataFrame, nodes: List[str]) -> str:
+    hashes = pd.util.hash_pandas_object(data[nodes], index=False).to_numpy()
+    return hashlib.sha256("\n".join(map(str, nodes)).encode("utf-8") + hashes.tobytes()).hexdigest()
+
+
+def get_evaluation_key(
+    model_sha256: str, data_sha256: str, max_num_samples: Optional[int], seed: Optional[int], confidence_level: Optional[float]
+) -> str:
+    payload = json.dumps(dict(model=model_sha256, data=data_sha256, max_num_samples=max_num_samples, seed=seed, confidence_level=confidence_level))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _get_key_parts(model_sha256: str, data_sha256: str, sampled: bool, max_num_samples: Optional[int], seed: Optional[int], confidence_level: float) -> tuple:
+    # the sampling settings only matter for a sampled evaluation : a full one is the same for any of them
+    if not sampled:
+        return model_sha256, data_sha256, None, None, None
+    return model_sha256, data_sha256, max_num_samples, seed, confidence_level
+
+
+def get_dkw_bound(num_samples: int, confidence_level: float, num_nodes: int = 1) -> float:
+    """
+    Dvoretzky-Kiefer-Wolfowitz : P(sup |F_n - F| > eps) <= 2 exp(-2 n eps^2), for i.i.d. samples of F.
+    Sampling without replacement from a finite population only tightens it.
+    With the union bound over num_nodes columns, the bound holds for all of them at once at the confidence level.
+    Examples :
+    >>> round(get_dkw_bound(2000, 0.95), 4)
+    0.0304
+    >>> round(get_dkw_bound(2000, 0.95, num_nodes=10), 4)
+    0.0387
+    """
+    return float(np.sqrt(np.log(2 * num_nodes / (1 - confidence_level)) / (2 * num_samples)))
+
+
+def get_ks_distance(sampled_values: np.ndarray, values: np.ndarray) -> float:
+    # sup distance between the two empirical CDFs, also valid for the ordered codes of categorical columns
+    points = np.unique(values)
+    sampled_cdf = np.searchsorted(np.sort(sampled_values), points, side="right") / len(sampled_values)
+    cdf = np.searchsorted(np.sort(values), points, side="right") / len(values)
+    return float(np.max(np.abs(sampled_cdf - cdf)))
+
+
+def _get_comparable_values(column: pd.Series) -> np.ndarray:
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.cat.codes.to_numpy()
+    if column.dtype.kind in "biuf":
+        return column.to_numpy()
+    return pd.factorize(column, sort=True)[0]
+
+
+def evaluate_causal_model(
+    model: Any,
+    data: pd.DataFrame,
+    max_num_samples: Optional[int] = None,
+    n_jobs: int = EVALUATION_NUM_WORKERS,
+    confidence_level: float = EVALUATION_CONFIDENCE_LEVEL,
+    seed: Optional[int] = RANDOM_SEED,
+    model_sha256: Optional[str] = None,
+) -> EvaluationRecord:
+    """
+    Evaluates the mechanisms, the invertibility assumptions and the generated distribution of a fitted model,
+    on all the rows or on max_num_samples rows. The graph structure is not evaluated : see the graph refutation.
+    """
+    from dowhy.gcm import evaluate_causal_model as gcm_evaluate_causal_model
+    from dowhy.gcm.model_evaluation import EvaluateCausalModelConfig
+
+    start = time.perf_counter()
+    nodes = list(model.graph.nodes)
+    model_sha256 = model_sha256 if model_sha256 is not None else get_model_hash(model)
+    data_sha256 = get_data_hash(data, nodes)
+    num_rows = len(data)
+    sampled = max_num_samples is not None and max_num_samples < num_rows
+    evaluated_data = data
+    dkw_bound, ks_distances = None, {}
+    if sampled:
+        if max_num_samples < 2:
+            raise ValueError(f"At least 2 rows should be evaluated, got max_num_samples={max_num_samples}")
+        rows = np.sort(np.random.default_rng(seed).choice(num_rows, max_num_samples, replace=False))
+        evaluated_data = data.iloc[rows].reset_index(drop=True)
+        dkw_bound = get_dkw_bound(max_num_samples, confidence_level, num_nodes=len(nodes))
+        ks_distances = {
+            str(node): get_ks_distance(_get_comparable_values(evaluated_data[node]), _get_comparable_values(data[node])) for node in nodes
+        }
+    n_jobs = get_num_workers(n_jobs)
+    logger.info(f"Evaluating the causal model on {len(evaluated_data)} of {num_rows} rows with {n_jobs} workers")
+    with seeded_random_state(seed):
+        evaluation = gcm_evaluate_causal_model(
+            model,
+            evaluated_data,
+            evaluate_causal_structure=False,
+            config=EvaluateCausalModelConfig(n_jobs=n_jobs),
+        )
+    return EvaluationRecord(
+        key=get_evaluation_key(*_get_key_parts(model_sha256, data_sha256, sampled, max_num_samples, seed, confidence_level)),
+        model_sha256=model_sha256,
+        data_sha256=data_sha256,
+        num_rows=num_rows,
+        num_evaluated_rows=len(evaluated_data),
+        seed=seed if sampled else None,
+        confidence_level=confidence_level,
+        dkw_bound=dkw_bound,
+        ks_distances=ks_distances,
+        report=str(evaluation),
+        duration=time.perf_counter() - start,
+        created_at=datetime.now(timezone.utc).isoformat(),
+    )
+
+
+class EvaluationStore:
+    """
+    Evaluation records persisted under ARTIFACTS_DIR, one JSON file per model hash holding its records by key.
+
+    Examples :
+    >>> from agentic_supply.causality_assistant.model_evaluation import evaluation_store
+    >>> record = evaluation_store.get_or_evaluate(causal_analysis.model, causal_analysis.data, max_num_samples=1000)
+    """
+
+    def __init__(self, directory: str = EVALUATION_DIR):
+        self.directory = directory
+        self._lock = threading.RLock()
+
+    def get_evaluations_path(self, model_sha256: str) -> str:
+        return os.path.join(self.directory, f"{model_sha256}.json")
+
+    def load(self, model_sha256: str) -> Dict[str, EvaluationRecord]:
+        path = self.get_evaluations_path(model_sha256)
+        if not os.path.isfile(path):
+            return {}
+        try:
+            with open(path, "r") as f:
+                return {key: EvaluationRecord.model_validate(record) for key, record in json.load(f).items()}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring the unreadable evaluations at {path} : {e}")
+            return {}
+
+    def get(self, model_sha256: str, key: str) -> Optional[EvaluationRecord]:
+        with self._lock:
+            return self.load(model_sha256).get(key)
+
+    def save(self, record: EvaluationRecord):
+        path = self.get_evaluations_path(record.model_sha256)
+        with self._lock:
+            records = self.load(record.model_sha256)
+            records[record.key] = record
+            try:
+                atomic_write_json(path, {key: record.model_dump() for key, record in records.items()}, indent=4)
+            except OSError as e:
+                logger.warning(f"Could not persist the evaluation at {path}, it will run again next time : {e}")
+
+    def get_or_evaluate(
+        self,
+        model: Any,
+        data: pd.DataFrame,
+        max_num_samples: Optional[int] = None,
+        n_jobs: int = EVALUATION_NUM_WORKERS,
+        confidence_level: float = EVALUATION_CONFIDENCE_LEVEL,
+        seed: Optional[int] = RANDOM_SEED,
+        model_sha256: Optional[str] = None,
+    ) -> EvaluationRecord:
+        """
+        model_sha256 is the hash of the model when already known, e.g. CausalAnalysis.model_hash, to avoid pickling it again.
+        """
+        model_sha256 = model_sha256 if model_sha256 is not None else get_model_hash(model)
+        sampled = max_num_samples is not None and max_num_samples < len(data)
+        data_sha256 = get_data_hash(data, list(model.graph.nodes))
+        key = get_evaluation_key(*_get_key_parts(model_sha256, data_sha256, sampled, max_num_samples, seed, confidence_level))
+        record = self.get(model_sha256, key)
+        if record is not None:
+            logger.info(f"Reusing the evaluation of the model from {record.created_at}")
+            return record
+        record = evaluate_causal_model(model, data, max_num_samples, n_jobs, confidence_level, seed, model_sha256=model_sha256)
+        self.save(record)
+        return record
+
+
+evaluation_store = EvaluationStore()
@@ -0,0 +1,202 @@
+"""
+Versioned store of fitted causal models.
+
+Each model is pickled next to a JSON manifest recording what produced it : the hash of the graph form, the fingerprint
+of the data it was fitted on, the assigned causal mechanisms, the fit duration and the library versions.
+Loading checks the manifest against the current graph form and refuses stale models, instead of silently answering
+causal questions with a model fitted on another graph. The pickle hash is only recomputed when the file changed,
+so that repeated validated loads of the same artifact are cheap.
+Models saved before the store existed (pickles without a manifest) are still loaded, after checking their graph edges.
+"""
+
+import hashlib
+import os
+import pickle
+import platform
+from datetime import datetime, timezone
+from importlib.metadata import version, PackageNotFoundError
+from importlib.resources import files, as_file
+from typing import Any, Dict, List, Optional, Tuple
+from pydantic import BaseModel, Field
+
+from agentic_supply import data
+from agentic_supply.utilities.config import DATA_NAMES, DATA_TO_FILE
+from agentic_supply.utilities.data_utils import get_data_fingerprint
+from agentic_supply.causality_assistant.model_cache import get_form_hash
+from agentic_supply.utilities.file_utils import atomic_write
+from agentic_supply.utilities.log_utils import set_logging, get_logger
+from agentic_supply.utilities.instrumentation import instrument
+
+
+set_logging()
+logger = get_logger(__name__)
+
+
+MODEL_SUFFIX = "_model.pkl"
+MANIFEST_SUFFIX = "_model.manifest.json"
+VERSIONED_PACKAGES = ["dowhy", "scikit-learn", "numpy", "pandas", "networkx"]
+
+
+class ModelManifest(BaseModel):
+    data_name: str
+    form_hash: str
+    data_fingerprint: Optional[str] = Field(default=None)
+    mechanisms: Dict[str, str] = Field(default_factory=dict)
+    fit_duration: Optional[float] = Field(default=None, description="Fit duration in seconds")
+    versions: Dict[str, str] = Field(default_factory=dict)
+    model_sha256: str
+    created_at: str
+
+
+def get_versions() -> Dict[str, str]:
+    versions = {"python": platform.python_version()}
+    for package in VERSIONED_PACKAGES:
+        try:
+            versions[package] = version(package)
+        except PackageNotFoundError:
+            continue
+    return versions
+
+
+def get_mechanisms_summary(model: Any) -> Dict[str, str]:
+    """
+    Examples :
+    >>> get_mechanisms_summary(causal_analysis.model)
+    {'X': 'Empirical Distribution', 'Y': 'AdditiveNoiseModel using LinearRegression', ...}
+    """
+    from dowhy.gcm.causal_models import CAUSAL_MECHANISM
+
+    return {str(node): str(attributes[CAUSAL_MECHANISM]) for node, attributes in model.graph.nodes(data=True) if CAUSAL_MECHANISM in attributes}
+
+
+class ModelStore:
+    """
+    Examples :
+    >>> from agentic_supply.causality_assistant.model_store import model_store
+    >>> manifest = model_store.save(causal_analysis.model, "mini_data", causal_graph.form, fit_duration=1.2)
+    >>> model = model_store.load("mini_data", causal_graph.form)
+    >>> model_store.list_models()
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory
+        # sha256 of the pickles already verified, keyed on the file path, size and modification time
+        self._verified: Dict[Tuple[str, int, int], str] = {}
+
+    def _get_path(self, filename: str) -> str:
+        if self.directory is not None:
+            return os.path.join(self.directory, filename)
+        with as_file(files(data).joinpath(filename)) as path:
+            return str(path)
+
+    def get_model_path(self, data_name: DATA_NAMES) -> str:
+        return self._get_path(f"{data_name}{MODEL_SUFFIX}")
+
+    def get_manifest_path(self, data_name: DATA_NAMES) -> str:
+        return self._get_path(f"{data_name}{MANIFEST_SUFFIX}")
+
+    def _get_model_sha256(self, model_path: str) -> str:
+        stat = os.stat(model_path)
+        key = (model_path, stat.st_size, stat.st_mtime_ns)
+        if key not in self._verified:
+            with open(model_path, "rb") as f:
+                self._verified[key] = hashlib.file_digest(f, "sha256").hexdigest()
+        return self._verified[key]
+
+    def save(self, model: Any, data_name: DATA_NAMES, form: List[Tuple], fit_duration: Optional[float] = None) -> ModelManifest:
+        model_path = self.get_model_path(data_name)
+        payload = pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)
+        # the pickle first, the manifest last, each replaced atomically : a reader sees a model matching its manifest,
+        # or a manifest which does not match yet and is refused, never a partial pickle
+        atomic_write(model_path, payload)
+        manifest = ModelManifest(
+            data_name=data_name,
+            form_hash=get_form_hash(form),
+            data_fingerprint=get_data_fingerprint(data_name) if data_name in DATA_TO_FILE else None,
+            mechanisms=get_mechanisms_summary(model),
+            fit_duration=fit_duration,
+            versions=get_versions(),
+            model_sha256=hashlib.sha256(payload).hexdigest(),
+            created_at=datetime.now(timezone.utc).isoformat(),
+        )
+        atomic_write(self.get_manifest_path(data_name), manifest.model_dump_json(indent=4))
+        logger.info(f"Saved model at {model_path} with its manifest")
+        return manifest
+
+    def get_manifest(self, data_name: DATA_NAMES) -> Optional[ModelManifest]:
+        manifest_path = self.get_manifest_path(data_name)
+        if not os.path.isfile(manifest_path):
+            return None
+        with open(manifest_path, "r") as f:
+            return ModelManifest.model_validate_json(f.read())
+
+    def validate(self, manifest: ModelManifest, form: List[Tuple]):
+        """
+        Raises a ValueError when the model was fitted on another graph form or when its pickle was modified,
+        and warns when the data or the library versions changed since the fit.
+        """
+        data_name = manifest.data_name
+        if manifest.form_hash != get_form_hash(form):
+            raise ValueError(f"The saved model for {data_name} was fitted on another causal graph, refit and save it with the current graph !")
+        model_sha256 = self._get_model_sha256(self.get_model_path(data_name))
+        if manifest.model_sha256 != model_sha256:
+            raise ValueError(f"The saved model for {data_name} does not match its manifest, it was modified after being saved !")
+        if manifest.data_fingerprint is not None and data_name in DATA_TO_FILE and manifest.data_fingerprint != get_data_fingerprint(data_name):
+            logger.warning(f"The data for {data_name} changed since the model was fitted, consider refitting it")
+        current_versions = get_versions()
+        for package, saved_version in manifest.versions.items():
+            current_version = current_versions.get(package)
+            if current_version is not None and current_version != saved_version:
+                logger.warning(f"The model for {data_name} was saved with {package} {saved_version}, {current_version} is installed")
+
+    @instrument("model_load")
+    def load(self, data_name: DATA_NAMES, form: List[Tuple]) -> Any:
+        """
+        Examples :
+        >>> model = model_store.load("mini_data", DATA_TO_GRAPH_FORM["mini_data"])
+        """
+        model_path = self.get_model_path(data_name)
+        if not os.path.isfile(model_path):
+            raise ValueError(f"No saved model for {data_name}, fit and save one first !")
+        manifest = self.get_manifest(data_name)
+        if manifest is not None:
+            self.validate(manifest, form)
+        logger.info(f"Loading model from {model_path}")
+        with open(model_path, "rb") as f:
+            model = pickle.load(f)
+        if manifest is None:
+            # legacy pickle : the graph stored in the model is the only thing to check it against
+            if get_form_hash(list(model.graph.edges)) != get_form_hash(form):
+                raise ValueError(f"The saved model for {data_name} was fitted on another causal graph, refit and save it with the current graph !")
+            logger.warning(f"The saved model for {data_name} has no manifest, save it again to record one")
+        return model
+
+    def list_models(self) -> List[ModelManifest]:
+        """
+        Manifests of all the stored models ; models without a manifest are listed with what is known from their file name.
+        """
+        directory = self.directory if self.directory is not None else os.path.dirname(self.get_model_path("mini_data"))
+        manifests = []
+        for filename in sorted(os.listdir(directory)) if os.path.isdir(directory) else []:
+            if not filename.endswith(MODEL_SUFFIX):
+                continue
+            data_name = filename[: -len(MODEL_SUFFIX)]
+            manifest = self.get_manifest(data_name)
+            if manifest is None:
+                model_path = os.path.join(directory, filename)
+                manifest = ModelManifest(
+                    data_name=data_name,
+                    form_hash="",
+                    model_sha256=hashlib.sha256(payload).hexdigest(),
+                    created_at=datetime.fromtimestamp(os.path.getmtime(model_path), timezone.utc).isoformat(),
+                )
+            manifests.append(manifest)
+        return manifests
+
+
+model_store = ModelStore()
+
+
+if __name__ == "__main__":
+    for manifest in model_store.list_models():
+        print(manifest.model_dump_json(indent=4))
@@ -0,0 +1,190 @@
+"""
+Seeded, content-addressed cache of the results of causal tasks.
+
+Arrow strengths, intrinsic influences, feature relevances and average causal effects are Monte Carlo estimates :
+asked twice, they were computed twice, with different random numbers and so slightly different answers.
+Here, a result is keyed by the hash of the model, the task, its normalised arguments (dataframes by the hash of their
+content), the seed and the library versions ; the task runs once with the random seed set, and its pickled result is
+kept in memory and on disk. Asking the same question again, from the same session or from another process sharing the
+cache directory, returns the very same numbers in milliseconds.
+Both tiers are capped in bytes : the least recently used results are evicted first.
+
+Examples :
+>>> from agentic_supply.causality_assistant.result_cache import result_cache
+>>> arrow_strengths = result_cache.get_or_compute(model_hash, "arrow_strength", dict(target="Z"), seed=0, compute=lambda: gcm.arrow_strength(model, "Z"))
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+
+from agentic_supply.utilities.config import RESULT_CACHE_DIR, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_DISK_MAX_BYTES
+from agentic_supply.causality_assistant.model_store import get_versions
+from agentic_supply.utilities.file_utils import atomic_write
+from agentic_supply.utilities.log_utils import set_logging, get_logger
+from agentic_supply.utilities.random_utils import seeded_random_state
+
+
+set_logging()
+logger = get_logger(__name__)
+
+
+def normalize_argument(value: Any) -> Any:
+    """
+    JSON-serialisable and deterministic form of an argument : mappings are sorted, dataframes and arrays are replaced
+    by the hash of their content, pydantic models by their fields.
+    Examples :
+    >>> normalize_argument({"b": 1, "a": (0.5, "x")})
+    {'a': [0.5, 'x'], 'b': 1}
+    """
+    if value is None or isinstance(value, (bool, int, str)):
+        return value
+    if isinstance(value, (float, np.floating)):
+        return float(value)
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, BaseModel):
+        return normalize_argument(value.model_dump())
+    if isinstance(value, dict):
+        return {str(key): normalize_argument(value[key]) for key in sorted(value, key=str)}
+    if isinstance(value, (list, tuple)):
+        return [normalize_argument(elem) for elem in value]
+    if isinstance(value, (set, frozenset)):
+        return sorted((normalize_argument(elem) for elem in value), key=json.dumps)
+    if isinstance(value, pd.DataFrame):
+        hashes = pd.util.hash_pandas_object(value, index=True).to_numpy()
+        columns = "\n".join(map(str, value.columns)).encode("utf-8")
+        return {"dataframe": hashlib.sha256(columns + hashes.tobytes()).hexdigest()}
+    if isinstance(value, np.ndarray):
+        contiguous = np.ascontiguousarray(value)
+        return {"array": hashlib.sha256(str((contiguous.dtype, contiguous.shape)).encode("utf-8") + contiguous.tobytes()).hexdigest()}
+    raise ValueError(f"Cannot normalise the argument {value!r} of type {type(value).__name__} for the result cache")
+
+
+def get_result_key(model_hash: str, method: str, arguments: Dict[str, Any], seed: int) -> str:
+    payload = json.dumps(
+        dict(model=model_hash, method=method, arguments=normalize_argument(arguments), seed=seed, versions=get_versions()), sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Two-tier LRU cache of pickled results : in memory up to max_bytes, on disk up to disk_max_bytes (no disk tier if directory is None).
+
+    Examples :
+    >>> cache = ResultCache(max_bytes=64 * 1024**2, directory="./logs/result_cache", disk_max_bytes=512 * 1024**2)
+    >>> result = cache.get_or_compute(model_hash, "feature_relevance", dict(target="Y"), seed=0, compute=compute)
+    >>> cache.hits, cache.misses
+    """
+
+    def __init__(self, max_bytes: int = RESULT_CACHE_MAX_BYTES, directory: Optional[str] = RESULT_CACHE_DIR, disk_max_bytes: int = RESULT_CACHE_DISK_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.disk_max_bytes = disk_max_bytes
+        # pickled results : every hit unpickles its own copy, so callers can not alter the cached result
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(len(payload) for payload in self._entries.values())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def _get_payload(self, key: str) -> Optional[bytes]:
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        if self.directory is None or not os.path.isfile(self._get_path(key)):
+            return None
+        try:
+            with open(self._get_path(key), "rb") as f:
+                payload = f.read()
+            os.utime(self._get_path(key))  # most recently used, for the disk eviction
+        except OSError as e:
+            logger.warning(f"Ignoring the unreadable cached result {key} : {e}")
+            return None
+        self._put_in_memory(key, payload)
+        return payload
+
+    def _put_in_memory(self, key: str, payload: bytes):
+        self._entries[key] = payload
+        self._entries.move_to_end(key)
+        total_bytes = self.total_bytes
+        while self._entries and total_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            total_bytes -= len(evicted)
+
+    def _put_on_disk(self, key: str, payload: bytes):
+        atomic_write(self._get_path(key), payload)
+        self._evict_from_disk()
+
+    def _evict_from_disk(self):
+        entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith(".pkl")]
+        total_bytes = sum(entry.stat().st_size for entry in entries)
+        for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime_ns):
+            if total_bytes <= self.disk_max_bytes:
+                break
+            total_bytes -= entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue  # already evicted by another process
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        with self._lock:
+            payload = self._get_payload(key)
+        if payload is None:
+            return False, None
+        return True, pickle.loads(payload)
+
+    def put(self, key: str, result: Any):
+        payload = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._put_in_memory(key, payload)
+            if self.directory is not None:
+                self._put_on_disk(key, payload)
+
+    def get_or_compute(self, model_hash: str, method: str, arguments: Dict[str, Any], seed: Optional[int], compute: Callable[[], Any]) -> Any:
+        """
+        Returns the cached result of method for these arguments, or runs compute with the random seed set and caches its result.
+        Without a seed, results are not reproducible : compute runs every time and nothing is cached.
+        """
+        if seed is None:
+            return compute()
+        key = get_result_key(model_hash, method, arguments, seed)
+        found, result = self.get(key)
+        if found:
+            self.hits += 1
+            logger.info(f"Reusing the cached result of {method}")
+            return result
+        self.misses += 1
+        # the global generators are restored afterwards : neither the other threads nor the later draws see this seed
+        with seeded_random_state(seed):
+            result = compute()
+        self.put(key, result)
+        return result
+
+    def clear(self):
+        """
+        Clears the memory tier only : the results on disk stay valid, since they are keyed by the model content.
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+result_cache = ResultCache()
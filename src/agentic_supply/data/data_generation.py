@@ -3,32 +3,62 @@ References :
     https://www.pywhy.org/dowhy/v0.13/example_notebooks/gcm_rca_microservice_architecture.html#Appendix:-Data-generation-process
     https://www.pywhy.org/dowhy/v0.13/example_notebooks/gcm_counterfactual_medical_dry_eyes.html#Appendix:-What-the-tele-app-uses-internally.-Data-generation-of-the-patients'-log
 
+All draws are vectorized and made from numpy.random.Generator objects, never from the global random state.
+Large datasets are generated in chunks across a process pool : chunk i always uses the i-th stream spawned from the root
+seed, so the output only depends on the seed and the chunk size, not on the number of workers.
+The chunks are written incrementally, in order, to CSV or Parquet (Parquet needs pyarrow), so memory stays bounded
+whatever the number of rows.
+
 Examples :
     python -m agentic_supply.data.data_generation --data_name microservices_latencies
     python -m agentic_supply.data.data_generation --data_name medical_case
+    python -m agentic_supply.data.data_generation --data_name microservices_latencies --num_rows 100000000 --output ./logs/latencies.parquet
 """
 
 import argparse
-import pandas as pd
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from importlib.resources import files
+from typing import Callable, Deque, Dict, Optional, Union
 import numpy as np
-from scipy.stats import truncexpon, halfnorm, bernoulli, norm, uniform
-from random import randint
-from importlib.resources import files, as_file
+import pandas as pd
 
 from agentic_supply import data
+from agentic_supply.utilities.config import DATA_GENERATION_CHUNK_SIZE, DATA_GENERATION_NUM_WORKERS, RANDOM_SEED
 
 P_1 = 0.2
 P_2 = 0.15
 
 
-def create_observed_latency_data(unobserved_intrinsic_latencies) -> pd.DataFrame:
+# Vectorized equivalents of the scipy.stats distributions of the original notebooks
+
+def truncexpon(rng: np.random.Generator, size: int, b: float, scale: float) -> np.ndarray:
+    """
+    Same distribution as scipy.stats.truncexpon(b, scale=scale), by inversion of its CDF.
+    """
+    return -scale * np.log1p(-rng.random(size) * -np.expm1(-b))
+
+
+def halfnorm(rng: np.random.Generator, size: int, loc: float, scale: float) -> np.ndarray:
+    """
+    Same distribution as scipy.stats.halfnorm(loc=loc, scale=scale).
+    """
+    return loc + scale * np.abs(rng.standard_normal(size))
+
+
+def bernoulli(rng: np.random.Generator, size: int, p: float) -> np.ndarray:
+    return (rng.random(size) < p).astype(np.int64)
+
+
+def create_observed_latency_data(unobserved_intrinsic_latencies: Dict[str, np.ndarray], rng: np.random.Generator) -> pd.DataFrame:
     observed_latencies = {}
     observed_latencies["Product DB"] = unobserved_intrinsic_latencies["Product DB"]
     observed_latencies["Customer DB"] = unobserved_intrinsic_latencies["Customer DB"]
     observed_latencies["Order DB"] = unobserved_intrinsic_latencies["Order DB"]
     observed_latencies["Shipping Cost Service"] = unobserved_intrinsic_latencies["Shipping Cost Service"]
     observed_latencies["Caching Service"] = (
-        np.random.choice([0, 1], size=(len(observed_latencies["Product DB"]),), p=[0.5, 0.5]) * observed_latencies["Product DB"]
+        rng.integers(0, 2, size=len(observed_latencies["Product DB"])) * observed_latencies["Product DB"]
         + unobserved_intrinsic_latencies["Caching Service"]
     )
     observed_latencies["Product Service"] = (
@@ -53,49 +83,37 @@ def create_observed_latency_data(unobserved_intrinsic_latencies) -> pd.DataFrame
     return pd.DataFrame(observed_latencies)
 
 
-def unobserved_intrinsic_latencies_normal(num_samples):
+def unobserved_intrinsic_latencies_normal(num_samples: int, rng: np.random.Generator) -> Dict[str, np.ndarray]:
     return {
-        "Website": truncexpon.rvs(size=num_samples, b=3, scale=0.2),
-        "www": truncexpon.rvs(size=num_samples, b=2, scale=0.2),
-        "API": halfnorm.rvs(size=num_samples, loc=0.5, scale=0.2),
-        "Auth Service": halfnorm.rvs(size=num_samples, loc=0.1, scale=0.2),
-        "Product Service": halfnorm.rvs(size=num_samples, loc=0.1, scale=0.2),
-        "Order Service": halfnorm.rvs(size=num_samples, loc=0.5, scale=0.2),
-        "Shipping Cost Service": halfnorm.rvs(size=num_samples, loc=0.1, scale=0.2),
-        "Caching Service": halfnorm.rvs(size=num_samples, loc=0.1, scale=0.1),
-        "Order DB": truncexpon.rvs(size=num_samples, b=5, scale=0.2),
-        "Customer DB": truncexpon.rvs(size=num_samples, b=6, scale=0.2),
-        "Product DB": truncexpon.rvs(size=num_samples, b=10, scale=0.2),
+        "Website": truncexpon(rng, num_samples, b=3, scale=0.2),
+        "www": truncexpon(rng, num_samples, b=2, scale=0.2),
+        "API": halfnorm(rng, num_samples, loc=0.5, scale=0.2),
+        "Auth Service": halfnorm(rng, num_samples, loc=0.1, scale=0.2),
+        "Product Service": halfnorm(rng, num_samples, loc=0.1, scale=0.2),
+        "Order Service": halfnorm(rng, num_samples, loc=0.5, scale=0.2),
+        "Shipping Cost Service": halfnorm(rng, num_samples, loc=0.1, scale=0.2),
+        "Caching Service": halfnorm(rng, num_samples, loc=0.1, scale=0.1),
+        "Order DB": truncexpon(rng, num_samples, b=5, scale=0.2),
+        "Customer DB": truncexpon(rng, num_samples, b=6, scale=0.2),
+        "Product DB": truncexpon(rng, num_samples, b=10, scale=0.2),
     }
 
 
-def unobserved_intrinsic_latencies_anomalous(num_samples):
-    return {
-        "Website": truncexpon.rvs(size=num_samples, b=3, scale=0.2),
-        "www": truncexpon.rvs(size=num_samples, b=2, scale=0.2),
-        "API": halfnorm.rvs(size=num_samples, loc=0.5, scale=0.2),
-        "Auth Service": halfnorm.rvs(size=num_samples, loc=0.1, scale=0.2),
-        "Product Service": halfnorm.rvs(size=num_samples, loc=0.1, scale=0.2),
-        "Order Service": halfnorm.rvs(size=num_samples, loc=0.5, scale=0.2),
-        "Shipping Cost Service": halfnorm.rvs(size=num_samples, loc=0.1, scale=0.2),
-        "Caching Service": 2 + halfnorm.rvs(size=num_samples, loc=0.1, scale=0.1),
-        "Order DB": truncexpon.rvs(size=num_samples, b=5, scale=0.2),
-        "Customer DB": truncexpon.rvs(size=num_samples, b=6, scale=0.2),
-        "Product DB": truncexpon.rvs(size=num_samples, b=10, scale=0.2),
-    }
+def unobserved_intrinsic_latencies_anomalous(num_samples: int, rng: np.random.Generator) -> Dict[str, np.ndarray]:
+    unobserved_intrinsic_latencies = unobserved_intrinsic_latencies_normal(num_samples, rng)
+    unobserved_intrinsic_latencies["Caching Service"] += 2
+    return unobserved_intrinsic_latencies
 
 
-def create_unobserved_medical_data():
-    n_unobserved = 10000
-    unobserved_data = {
-        "N_T": np.array([randint(0, 2) for p in range(n_unobserved)]),
-        "N_vision": np.random.uniform(0.4, 0.6, size=(n_unobserved,)),
-        "N_C": bernoulli.rvs(0.01, size=n_unobserved),
+def create_unobserved_medical_data(num_samples: int, rng: np.random.Generator) -> Dict[str, np.ndarray]:
+    return {
+        "N_T": rng.integers(0, 3, size=num_samples),
+        "N_vision": rng.uniform(0.4, 0.6, size=num_samples),
+        "N_C": bernoulli(rng, num_samples, 0.01),
     }
-    return unobserved_data
 
 
-def create_observed_medical_data(unobserved_data):
+def create_observed_medical_data(unobserved_data: Dict[str, np.ndarray]) -> pd.DataFrame:
     observed_medical_data = {}
     observed_medical_data["Condition"] = unobserved_data["N_C"]
     observed_medical_data["Treatment"] = unobserved_data["N_T"]
@@ -125,31 +143,159 @@ def create_observed_medical_data(unobserved_data):
     return pd.DataFrame(observed_medical_data)
 
 
-def generate_specific_patient_data(num_samples=1):
-    original_vision = np.random.uniform(0.4, 0.6, size=num_samples)
+def generate_specific_patient_data(num_samples: int = 1, rng: Optional[np.random.Generator] = None) -> pd.DataFrame:
+    rng = rng if rng is not None else np.random.default_rng(RANDOM_SEED)
     return create_observed_medical_data(
         {
             "N_T": np.full((num_samples,), 2),
-            "N_C": bernoulli.rvs(1, size=num_samples),
-            "N_vision": original_vision,
+            "N_C": np.ones(num_samples, dtype=np.int64),
+            "N_vision": rng.uniform(0.4, 0.6, size=num_samples),
         }
     )
 
 
+def generate_latency_data(num_samples: int, rng: np.random.Generator) -> pd.DataFrame:
+    return create_observed_latency_data(unobserved_intrinsic_latencies_normal(num_samples, rng), rng)
+
+
+def generate_outlier_latency_data(num_samples: int, rng: np.random.Generator) -> pd.DataFrame:
+    return create_observed_latency_data(unobserved_intrinsic_latencies_anomalous(num_samples, rng), rng)
+
+
+def generate_medical_data(num_samples: int, rng: np.random.Generator) -> pd.DataFrame:
+    return create_observed_medical_data(create_unobserved_medical_data(num_samples, rng))
+
+
+GENERATORS: Dict[str, Callable[[int, np.random.Generator], pd.DataFrame]] = {
+    "microservices_latencies": generate_latency_data,
+    "microservices_latencies_outlier": generate_outlier_latency_data,
+    "medical_case": generate_medical_data,
+}
+
+
+def _generate_chunk(generator: Callable[[int, np.random.Generator], pd.DataFrame], num_samples: int, seed_sequence: np.random.SeedSequence, file_format: str) -> Union[bytes, pd.DataFrame]:
+    chunk = generator(num_samples, np.random.default_rng(seed_sequence))
+    if file_format == "csv":
+        # the formatting is the costly part of writing a CSV : done in the workers, the writer only appends bytes
+        return chunk.to_csv(index=False, header=False).encode("utf-8")
+    return chunk
+
+
+class _ChunkWriter:
+    def __init__(self, output_path: str, file_format: str):
+        self.output_path = output_path
+        self.file_format = file_format
+        self.num_rows = 0
+        self._file = None
+        self._parquet_writer = None
+
+    def write(self, chunk: Union[bytes, pd.DataFrame], columns: list, num_rows: int):
+        if self.file_format == "csv":
+            if self._file is None:
+                self._file = open(self.output_path, "wb")
+                self._file.write((",".join(columns) + "\n").encode("utf-8"))
+            self._file.write(chunk)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.output_path, table.schema)
+            self._parquet_writer.write_table(table)
+        self.num_rows += num_rows
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+
+
+def get_file_format(output_path: str) -> str:
+    extension = os.path.splitext(output_path)[1].lower()
+    if extension not in (".csv", ".parquet"):
+        raise ValueError(f"Unsupported output format {extension}, use a .csv or .parquet path")
+    if extension == ".parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError("Writing Parquet files needs pyarrow : pip install pyarrow") from None
+    return extension[1:]
+
+
+def generate_to_file(
+    generator: Union[str, Callable[[int, np.random.Generator], pd.DataFrame]],
+    num_rows: int,
+    output_path: str,
+    chunk_size: int = DATA_GENERATION_CHUNK_SIZE,
+    num_workers: int = DATA_GENERATION_NUM_WORKERS,
+    seed: Optional[int] = RANDOM_SEED,
+) -> int:
+    """
+    Generates num_rows rows in chunks of chunk_size rows on num_workers processes, and writes them in order to output_path.
+    The generator is the name of one of the GENERATORS, or a picklable function of the number of rows and the random generator.
+    Returns the number of rows written.
+    Examples :
+    >>> generate_to_file("microservices_latencies", 10**8, "./logs/microservices_latencies_stress.csv")
+    >>> generate_to_file("medical_case", 10**7, "./logs/medical_case_stress.parquet", num_workers=8)
+    """
+    if isinstance(generator, str):
+        if generator not in GENERATORS:
+            raise ValueError(f"Unknown generator {generator}, available generators : {list(GENERATORS)}")
+        generator = GENERATORS[generator]
+    file_format = get_file_format(output_path)
+    chunk_sizes = [min(chunk_size, num_rows - start) for start in range(0, num_rows, chunk_size)]
+    seed_sequences = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+    columns = list(generator(1, np.random.default_rng(0)).columns)
+    num_workers = min(max(1, num_workers), max(1, len(chunk_sizes)))
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    writer = _ChunkWriter(output_path, file_format)
+    try:
+        if num_workers == 1:
+            for size, seed_sequence in zip(chunk_sizes, seed_sequences):
+                writer.write(_generate_chunk(generator, size, seed_sequence, file_format), columns, size)
+        else:
+            # keep at most two chunks per worker in flight, and write them back in order
+            pending: Deque[tuple[Future, int]] = deque()
+            with ProcessPoolExecutor(max_workers=num_workers) as executor:
+                for size, seed_sequence in zip(chunk_sizes, seed_sequences):
+                    pending.append((executor.submit(_generate_chunk, generator, size, seed_sequence, file_format), size))
+                    if len(pending) >= 2 * num_workers:
+                        future, written_size = pending.popleft()
+                        writer.write(future.result(), columns, written_size)
+                while pending:
+                    future, written_size = pending.popleft()
+                    writer.write(future.result(), columns, written_size)
+    finally:
+        writer.close()
+    return writer.num_rows
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--data_name", required=True)
+    parser.add_argument("--data_name", required=True, choices=["microservices_latencies", "medical_case"])
+    parser.add_argument("--num_rows", type=int, default=None, help="Rows of the main dataset, the packaged size by default")
+    parser.add_argument("--output", default=None, help="A .csv or .parquet path, the packaged data file by default")
+    parser.add_argument("--chunk_size", type=int, default=DATA_GENERATION_CHUNK_SIZE)
+    parser.add_argument("--num_workers", type=int, default=DATA_GENERATION_NUM_WORKERS)
+    parser.add_argument("--seed", type=int, default=RANDOM_SEED)
     args = parser.parse_args()
     source = files(data)
+    options = dict(chunk_size=args.chunk_size, num_workers=args.num_workers, seed=args.seed)
     if args.data_name == "microservices_latencies":
-        normal_data = create_observed_latency_data(unobserved_intrinsic_latencies_normal(10000))
-        outlier_data = create_observed_latency_data(unobserved_intrinsic_latencies_anomalous(1000))
-        normal_data.to_csv(source.joinpath(f"{args.data_name}_data.csv"), index=False)
-        outlier_data.to_csv(source.joinpath(f"{args.data_name}_outlier_data.csv"), index=False)
-        print(f"generated data with shape : normal_data {normal_data.shape}, outlier_data {outlier_data.shape}")
+        output = args.output or str(source.joinpath(f"{args.data_name}_data.csv"))
+        num_rows = generate_to_file("microservices_latencies", args.num_rows or 10000, output, **options)
+        print(f"generated {num_rows} rows of normal data at {output}")
+        if args.output is None:
+            outlier_output = str(source.joinpath(f"{args.data_name}_outlier_data.csv"))
+            num_rows = generate_to_file("microservices_latencies_outlier", 1000, outlier_output, **options)
+            print(f"generated {num_rows} rows of outlier data at {outlier_output}")
     if args.data_name == "medical_case":
-        medical_data = create_observed_medical_data(create_unobserved_medical_data())
-        specific_patient_data = generate_specific_patient_data()
-        medical_data.to_csv(source.joinpath(f"{args.data_name}_data.csv"), index=False)
-        specific_patient_data.to_csv(source.joinpath(f"{args.data_name}_counterfactual_data.csv"), index=False)
-        print(f"generated data with shape : medical_data {medical_data.shape}, specific_patient_data {specific_patient_data.shape}")
+        output = args.output or str(source.joinpath(f"{args.data_name}_data.csv"))
+        num_rows = generate_to_file("medical_case", args.num_rows or 10000, output, **options)
+        print(f"generated {num_rows} rows of medical data at {output}")
+        if args.output is None:
+            specific_patient_data = generate_specific_patient_data(rng=np.random.default_rng(args.seed))
+            specific_patient_data.to_csv(source.joinpath(f"{args.data_name}_counterfactual_data.csv"), index=False)
+            print(f"generated specific patient data with shape {specific_patient_data.shape}")
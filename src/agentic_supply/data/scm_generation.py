@@ -0,0 +1,275 @@
+"""
+Generic synthetic structural causal models, for any graph form or for random DAGs with thousands of nodes.
+
+Each node gets a parameterized mechanism, applied to its parents in topological order with vectorized numpy draws :
+- "root" : the noise alone
+- "linear" : weighted sum of the parents plus the noise
+- "nonlinear" : weighted sum of tanh of the parents plus the noise
+- "max" : maximum of the weighted parents plus a non-negative noise, like the latencies of the microservices data
+- "categorical" : category drawn from a softmax over the categories, whose logits are linear in the weighted sum of the parents
+The aggregate of the parents is standardized with constants estimated once at construction, so that the values stay
+of order one however deep the graph is, and those constants are part of the ground truth.
+The whole model is a pydantic object : its JSON dump is the ground truth (graph, mechanisms and parameters), and it can
+sample under interventions or from given noise values, for the true effects and counterfactuals.
+
+Examples :
+    python -m agentic_supply.data.scm_generation --data_name microservices_latencies --num_rows 100000 --output ./logs/scm_microservices.csv
+    python -m agentic_supply.data.scm_generation --num_nodes 2000 --expected_degree 3 --num_rows 1000000 --output ./logs/scm_2000.parquet
+"""
+
+import argparse
+import os
+from typing import Callable, Dict, List, Literal, Optional, Tuple
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel, Field
+
+from agentic_supply.data.data_generation import generate_to_file
+from agentic_supply.utilities.config import DATA_GENERATION_CHUNK_SIZE, DATA_GENERATION_NUM_WORKERS, RANDOM_SEED
+
+
+MECHANISM_KINDS = Literal["root", "linear", "nonlinear", "max", "categorical"]
+NOISE_KINDS = Literal["gaussian", "uniform", "exponential", "halfnormal"]
+DEFAULT_MECHANISM_MIX: Dict[str, float] = {"linear": 0.5, "nonlinear": 0.3, "max": 0.1, "categorical": 0.1}
+NUM_CALIBRATION_SAMPLES = 10000
+
+
+class Mechanism(BaseModel):
+    kind: MECHANISM_KINDS
+    parents: List[str] = Field(default_factory=list)
+    weights: List[float] = Field(default_factory=list, description="One weight per parent")
+    offset: float = Field(default=0.0, description="Subtracted from the aggregate of the parents")
+    scale: float = Field(default=1.0, description="Divides the aggregate of the parents")
+    noise: NOISE_KINDS = Field(default="gaussian")
+    noise_scale: float = Field(default=1.0)
+    category_coefficients: List[float] = Field(default_factory=list, description="Logit slope of each category, for categorical nodes")
+
+    def get_aggregate(self, parent_values: List[np.ndarray]) -> np.ndarray:
+        weighted = [weight * values for weight, values in zip(self.weights, parent_values)]
+        if self.kind == "max":
+            aggregate = np.maximum.reduce(weighted)
+        elif self.kind == "nonlinear":
+            aggregate = np.sum([weight * np.tanh(values) for weight, values in zip(self.weights, parent_values)], axis=0)
+        else:
+            aggregate = np.sum(weighted, axis=0)
+        return (aggregate - self.offset) / self.scale
+
+    def draw_noise(self, rng: np.random.Generator, num_samples: int) -> np.ndarray:
+        if self.kind == "categorical":
+            # Gumbel noise : the argmax of the noisy logits is a draw from their softmax
+            return rng.gumbel(size=(num_samples, len(self.category_coefficients)))
+        if self.noise == "gaussian":
+            return self.noise_scale * rng.standard_normal(num_samples)
+        if self.noise == "uniform":
+            return self.noise_scale * rng.uniform(-1.0, 1.0, num_samples)
+        if self.noise == "exponential":
+            return self.noise_scale * rng.standard_exponential(num_samples)
+        return self.noise_scale * np.abs(rng.standard_normal(num_samples))
+
+    def apply(self, parent_values: List[np.ndarray], noise: np.ndarray) -> np.ndarray:
+        aggregate = self.get_aggregate(parent_values) if self.parents else np.zeros(len(noise))
+        if self.kind == "categorical":
+            logits = aggregate[:, None] * np.asarray(self.category_coefficients)[None, :] + noise
+            return np.argmax(logits, axis=1)
+        return aggregate + noise
+
+
+class SyntheticSCM(BaseModel):
+    """
+    Examples :
+    >>> scm = SyntheticSCM.from_form(DATA_TO_GRAPH_FORM["online_shop_data"], seed=0)
+    >>> scm = SyntheticSCM.from_random_dag(2000, expected_degree=3, seed=0)
+    >>> data = scm.sample(10**6)
+    >>> interventional_data = scm.sample(10**5, interventions={"X3": lambda x: x + 1})
+    >>> scm.model_dump_json() # ground truth
+    """
+
+    form: List[Tuple[str, str]]
+    nodes: List[str] = Field(description="Nodes in topological order")
+    mechanisms: Dict[str, Mechanism]
+    seed: Optional[int] = Field(default=RANDOM_SEED)
+
+    @classmethod
+    def from_form(
+        cls,
+        form: List[Tuple[str, str]],
+        mechanism_mix: Optional[Dict[str, float]] = None,
+        kinds: Optional[Dict[str, str]] = None,
+        num_categories: int = 3,
+        seed: Optional[int] = RANDOM_SEED,
+        nodes: Optional[List[str]] = None,
+    ) -> "SyntheticSCM":
+        """
+        Random mechanisms over the graph form : roots get a random noise, the other nodes a kind drawn from mechanism_mix
+        (probabilities per kind) unless set in kinds, with random weights.
+        """
+        import networkx as nx
+
+        graph = nx.DiGraph(form)
+        graph.add_nodes_from(nodes or [])
+        mechanism_mix = mechanism_mix if mechanism_mix is not None else DEFAULT_MECHANISM_MIX
+        kinds = kinds or {}
+        rng = np.random.default_rng(seed)
+        mix_kinds = list(mechanism_mix)
+        mix_probabilities = np.array([mechanism_mix[kind] for kind in mix_kinds], dtype=float)
+        mix_probabilities /= mix_probabilities.sum()
+
+        mechanisms = {}
+        for node in nx.topological_sort(graph):
+            parents = sorted(graph.predecessors(node))
+            kind = kinds.get(node) or ("root" if not parents else mix_kinds[rng.choice(len(mix_kinds), p=mix_probabilities)])
+            if kind == "root" and parents:
+                raise ValueError(f"The node {node} has parents {parents}, it cannot have a root mechanism")
+            signs = rng.choice([-1.0, 1.0], size=len(parents)) if kind not in ("max", "categorical") else np.ones(len(parents))
+            mechanisms[node] = Mechanism(
+                kind=kind,
+                parents=parents,
+                weights=(signs * rng.uniform(0.5, 1.5, size=len(parents))).tolist(),
+                noise="halfnormal" if kind == "max" else str(rng.choice(["gaussian", "uniform", "exponential"])),
+                noise_scale=float(rng.uniform(0.5, 1.0)) if parents else 1.0,
+                category_coefficients=sorted(rng.normal(0.0, 2.0, size=num_categories).tolist()) if kind == "categorical" else [],
+            )
+        scm = cls(form=[tuple(edge) for edge in form], nodes=list(mechanisms), mechanisms=mechanisms, seed=seed)
+        return scm._calibrate()
+
+    @classmethod
+    def from_random_dag(
+        cls,
+        num_nodes: int,
+        expected_degree: float = 2.0,
+        max_parents: Optional[int] = None,
+        mechanism_mix: Optional[Dict[str, float]] = None,
+        seed: Optional[int] = RANDOM_SEED,
+    ) -> "SyntheticSCM":
+        form = get_random_dag_form(num_nodes, expected_degree, max_parents, seed)
+        return cls.from_form(form, mechanism_mix=mechanism_mix, seed=seed, nodes=[f"X{i}" for i in range(num_nodes)])
+
+    def _calibrate(self) -> "SyntheticSCM":
+        # the offset and scale of each aggregate are set in topological order, from the already calibrated parents
+        rng = np.random.default_rng(np.random.SeedSequence(self.seed).spawn(2)[1])
+        values: Dict[str, np.ndarray] = {}
+        for node in self.nodes:
+            mechanism = self.mechanisms[node]
+            if mechanism.parents:
+                aggregate = mechanism.get_aggregate([values[parent] for parent in mechanism.parents])
+                mechanism.offset = float(np.mean(aggregate))
+                mechanism.scale = float(np.std(aggregate)) or 1.0
+            values[node] = mechanism.apply([values[parent] for parent in mechanism.parents], mechanism.draw_noise(rng, NUM_CALIBRATION_SAMPLES))
+        return self
+
+    def draw_noise(self, num_samples: int, rng: Optional[np.random.Generator] = None) -> Dict[str, np.ndarray]:
+        rng = rng if rng is not None else np.random.default_rng(self.seed)
+        return {node: self.mechanisms[node].draw_noise(rng, num_samples) for node in self.nodes}
+
+    def sample(
+        self,
+        num_samples: int,
+        rng: Optional[np.random.Generator] = None,
+        interventions: Optional[Dict[str, Callable[[np.ndarray], np.ndarray]]] = None,
+        noise: Optional[Dict[str, np.ndarray]] = None,
+    ) -> pd.DataFrame:
+        """
+        Samples in topological order. An intervention replaces the value of its node by a function of its natural value.
+        Given the same noise, samples with and without interventions are counterfactuals of each other.
+        """
+        rng = rng if rng is not None else np.random.default_rng(self.seed)
+        interventions = interventions or {}
+        # one column per node, filled in place : the noise of a node is drawn right before it is used,
+        # in the same order as draw_noise, so that the samples do not depend on whether the noise is given
+        values = np.empty((num_samples, len(self.nodes)), order="F")
+        columns = {node: i for i, node in enumerate(self.nodes)}
+        for node in self.nodes:
+            mechanism = self.mechanisms[node]
+            node_noise = noise[node] if noise is not None else mechanism.draw_noise(rng, num_samples)
+            values[:, columns[node]] = mechanism.apply([values[:, columns[parent]] for parent in mechanism.parents], node_noise)
+            if node in interventions:
+                values[:, columns[node]] = interventions[node](values[:, columns[node]])
+        data = pd.DataFrame(values, columns=self.nodes, copy=False)
+        categorical_nodes = [node for node in self.nodes if self.mechanisms[node].kind == "categorical"]
+        return data.astype({node: np.int64 for node in categorical_nodes}) if categorical_nodes else data
+
+    def get_average_causal_effect(
+        self,
+        target: str,
+        interventions_alternative: Dict[str, Callable[[np.ndarray], np.ndarray]],
+        interventions_reference: Dict[str, Callable[[np.ndarray], np.ndarray]],
+        num_samples: int = 100000,
+    ) -> float:
+        """
+        Ground truth of gcm.average_causal_effect, with the same noise for both interventions.
+        """
+        noise = self.draw_noise(num_samples)
+        alternative = self.sample(num_samples, interventions=interventions_alternative, noise=noise)[target]
+        reference = self.sample(num_samples, interventions=interventions_reference, noise=noise)[target]
+        return float(np.mean(alternative - reference))
+
+    def get_sinks(self) -> List[str]:
+        parents = {parent for mechanism in self.mechanisms.values() for parent in mechanism.parents}
+        return [node for node in self.nodes if node not in parents]
+
+    def save_ground_truth(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            f.write(self.model_dump_json(indent=4))
+
+    @classmethod
+    def load_ground_truth(cls, path: str) -> "SyntheticSCM":
+        with open(path, "r") as f:
+            return cls.model_validate_json(f.read())
+
+    def write(
+        self,
+        num_rows: int,
+        output_path: str,
+        chunk_size: int = DATA_GENERATION_CHUNK_SIZE,
+        num_workers: int = DATA_GENERATION_NUM_WORKERS,
+        seed: Optional[int] = None,
+    ) -> int:
+        """
+        Writes num_rows samples to a CSV or Parquet file in chunks across processes, next to the ground truth JSON.
+        """
+        self.save_ground_truth(f"{os.path.splitext(output_path)[0]}.ground_truth.json")
+        return generate_to_file(self.sample, num_rows, output_path, chunk_size, num_workers, seed if seed is not None else self.seed)
+
+
+def get_random_dag_form(num_nodes: int, expected_degree: float = 2.0, max_parents: Optional[int] = None, seed: Optional[int] = RANDOM_SEED) -> List[Tuple[str, str]]:
+    """
+    Random DAG over the nodes X0 ... X{num_nodes - 1}, in that topological order, where each pair of nodes is linked
+    with the same probability, so that a node has expected_degree neighbours (parents and children) on average.
+    Examples :
+    >>> form = get_random_dag_form(2000, expected_degree=3, max_parents=10)
+    """
+    if num_nodes < 2:
+        raise ValueError(f"num_nodes should be at least 2, got {num_nodes}")
+    rng = np.random.default_rng(seed)
+    probability = min(1.0, expected_degree / (num_nodes - 1))
+    form = []
+    for child in range(1, num_nodes):
+        num_parents = rng.binomial(child, probability)
+        if max_parents is not None:
+            num_parents = min(num_parents, max_parents)
+        for parent in np.sort(rng.choice(child, size=num_parents, replace=False)):
+            form.append((f"X{parent}", f"X{child}"))
+    return form
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data_name", default=None, help="Dataset whose graph form is used, a random DAG if not set")
+    parser.add_argument("--num_nodes", type=int, default=100)
+    parser.add_argument("--expected_degree", type=float, default=2.0)
+    parser.add_argument("--max_parents", type=int, default=None)
+    parser.add_argument("--num_rows", type=int, default=10000)
+    parser.add_argument("--output", required=True, help="A .csv or .parquet path, the ground truth is written next to it")
+    parser.add_argument("--chunk_size", type=int, default=DATA_GENERATION_CHUNK_SIZE)
+    parser.add_argument("--num_workers", type=int, default=DATA_GENERATION_NUM_WORKERS)
+    parser.add_argument("--seed", type=int, default=RANDOM_SEED)
+    args = parser.parse_args()
+    if args.data_name is not None:
+        from agentic_supply.causality_assistant.causal_graph import DATA_TO_GRAPH_FORM
+
+        scm = SyntheticSCM.from_form(DATA_TO_GRAPH_FORM[args.data_name], seed=args.seed)
+    else:
+        scm = SyntheticSCM.from_random_dag(args.num_nodes, args.expected_degree, args.max_parents, seed=args.seed)
+    num_rows = scm.write(args.num_rows, args.output, args.chunk_size, args.num_workers, args.seed)
+    print(f"generated {num_rows} rows over {len(scm.nodes)} nodes and {len(scm.form)} edges at {args.output}")
@@ -3,22 +3,25 @@ References :
 """
 
 import os
-import pandas as pd
-import tkinter as tk
-from tkinter import filedialog
 import shutil
 from importlib.resources import files, as_file
-from typing import Dict, List, Tuple, Optional, Literal
+from typing import Dict, List, Tuple, Optional, Literal, TYPE_CHECKING
 
 from agentic_supply.utilities.log_utils import set_logging, get_logger
 from agentic_supply.utilities.config import DATA_NAMES, DATA_TO_FILE
 from agentic_supply import data
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 set_logging()
 logger = get_logger(__name__)
 
 
 def select_target_path(mode: Literal["save", "openname"]) -> str:
+    import tkinter as tk
+    from tkinter import filedialog
+
     root = tk.Tk()
     root.withdraw()
     if mode == "openname":
@@ -29,7 +32,7 @@ def select_target_path(mode: Literal["save", "openname"]) -> str:
     return target_path
 
 
-def download_data(df: Optional[pd.DataFrame] = None, data_name: Optional[DATA_NAMES] = None, open_file: bool = True) -> str:
+def download_data(df: Optional["pd.DataFrame"] = None, data_name: Optional[DATA_NAMES] = None, open_file: bool = True) -> str:
     """
     Examples :
     >>> target_path = download_data(data_name="example_data")
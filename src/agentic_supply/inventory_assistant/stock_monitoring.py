@@ -8,6 +8,7 @@ from importlib.resources import files
 
 from agentic_supply import data
 from agentic_supply.utilities.log_utils import set_logging, get_logger
+from agentic_supply.utilities.instrumentation import instrument
 
 
 set_logging()
@@ -51,11 +52,13 @@ class SitesDB(BaseModel):
         return [elem for elem in self.sites if product_name in [el.name for el in elem.products]]
 
 
+@instrument("json_db_read")
 def get_products_db():
     json_data = files(data).joinpath("products.json").read_text()
     return ProductsDB.model_validate_json(json_data)
 
 
+@instrument("json_db_read")
 def get_sites_db():
     json_data = files(data).joinpath("sites.json").read_text()
     return SitesDB.model_validate_json(json_data)
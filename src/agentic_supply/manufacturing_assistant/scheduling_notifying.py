@@ -9,6 +9,7 @@ from typing import Dict, List, Tuple, Optional
 from pydantic import BaseModel, Field
 
 from agentic_supply.utilities.log_utils import set_logging, get_logger
+from agentic_supply.utilities.instrumentation import instrument
 from agentic_supply.utilities.config import PRODUCT_NAMES, DESTINATIONS, ARTIFACTS_DIR
 from agentic_supply.inventory_assistant.stock_monitoring import get_products_db
 
@@ -60,11 +61,13 @@ class OrderDB(BaseModel):
     def get_order(self, order_id: str) -> Order:
         return next((elem for elem in self.orders if elem.id == order_id))
 
+    @instrument("json_db_write")
     def save(self):
         with open(ORDER_DB_PATH, "w") as f:
             f.write(self.model_dump_json(indent=4))
 
 
+@instrument("json_db_read")
 def get_order_db():
     with open(ORDER_DB_PATH, "r") as f:
         json_data = f.read()
@@ -1,3 +1,4 @@
+import multiprocessing
 import os
 from importlib import resources
 from dotenv import load_dotenv
@@ -54,3 +55,63 @@ WHAT_IF_QUESTION_TYPES = Literal["intervention", "counterfactual"]
 PRODUCT_NAMES = Literal["lactic_acid", "ascorbic_acid"]
 DESTINATIONS = Literal["Germany", "Netherlands", "Belgium", "Denmark"]
 ARTIFACTS_DIR = "./logs"
+MODEL_CACHE_MAX_ENTRIES = 8
+MODEL_CACHE_MAX_BYTES = 1024**3
+BOOTSTRAP_NUM_WORKERS = int(os.getenv("BOOTSTRAP_NUM_WORKERS", os.cpu_count() or 1))
+BOOTSTRAP_NUM_RESAMPLES = 10
+EVALUATION_NUM_WORKERS = BOOTSTRAP_NUM_WORKERS  # nodes whose mechanisms are evaluated in parallel
+EVALUATION_MAX_NUM_SAMPLES = int(os.getenv("EVALUATION_MAX_NUM_SAMPLES", 0)) or None  # rows evaluated by the tools, all of them if 0
+EVALUATION_CONFIDENCE_LEVEL = 0.95
+EVALUATION_DIR = os.path.join(ARTIFACTS_DIR, "evaluations")
+DOSE_RESPONSE_NUM_SAMPLES = 10000  # common noise samples shared by the grid points of a dose-response sweep
+MECHANISM_ASSIGNMENT_QUALITY = "good"  # model selection preset of the causal mechanisms : "good", "better" or "best"
+MECHANISM_CACHE_DIR = os.path.join(ARTIFACTS_DIR, "mechanism_cache")
+NOISE_CACHE_MAX_ENTRIES = 16  # noise inferred from observed rows, kept per causal analysis for the counterfactuals
+INCREMENTAL_FIT_SIGNIFICANCE_LEVEL = 0.01  # incremental fits refit a node when its appended rows differ from its fitted rows at this level
+PRUNE_TO_TARGET_ANCESTORS = True  # causal models only cover the target and its ancestors
+COMPACT_DATA = True  # causal analyses load categorical string columns and float32/int32 numerics
+COMPACT_FLOAT_TOLERANCE = 1e-6  # relative error allowed when downcasting floats to float32, 0 for lossless only
+RANDOM_SEED = 0
+STREAMING_BATCH_SIZE = 2048  # rows scored together by the streaming anomaly scorer
+STREAMING_BUFFER_SIZE = 10000  # recent rows kept by the streaming anomaly scorer
+STREAMING_ANOMALY_QUANTILE = 0.999  # quantile of the training row scores used as the default alert threshold
+STREAMING_POLL_INTERVAL_S = 0.2
+STREAMING_ATTRIBUTION_COOLDOWN_S = 5.0  # minimum time between two full anomaly attributions of streamed rows
+BULK_ATTRIBUTION_CHUNK_SIZE = 100
+INTERVENTION_CACHE_SIZE = 256
+IMPORT_TIME_BUDGET_S = 2.0
+IMPORT_TIME_BUDGETS_S: Dict[str, float] = {
+    "agentic_supply.agentic_causality.data_tools": 0.5,
+}
+RESULT_CACHE_DIR = os.path.join(ARTIFACTS_DIR, "result_cache")
+RESULT_CACHE_MAX_BYTES = 64 * 1024**2  # pickled causal task results kept in memory
+RESULT_CACHE_DISK_MAX_BYTES = 512 * 1024**2
+CI_TEST_NUM_WORKERS = BOOTSTRAP_NUM_WORKERS
+CI_TEST_CACHE_DIR = os.path.join(ARTIFACTS_DIR, "ci_test_cache")
+TOOL_TIMEOUT_S = float(os.getenv("TOOL_TIMEOUT_S", 900))
+TOOL_NUM_THREADS = int(os.getenv("TOOL_NUM_THREADS", 8))
+TOOL_NUM_PROCESSES = int(os.getenv("TOOL_NUM_PROCESSES", os.cpu_count() or 1))
+# persistent tool worker processes : started from a single-threaded server process, never forked from the threaded tool server
+TOOL_WORKER_START_METHOD = os.getenv("TOOL_WORKER_START_METHOD", "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+TOOL_WORKER_PRELOAD_MODULES = ["agentic_supply.causality_assistant.causal_analysis", "agentic_supply.causality_assistant.causal_graph"]
+# models loaded by every worker when it starts, among those already fitted, comma-separated : none by default,
+# the workers load the models they are called with into their model cache
+TOOL_WORKER_PRELOAD_DATA_NAMES = [name for name in os.getenv("TOOL_WORKER_PRELOAD_DATA_NAMES", "").split(",") if name]
+DATA_CACHE_DIR = os.path.join(ARTIFACTS_DIR, "data_cache")
+APPROXIMATION_LEVEL = os.getenv("APPROXIMATION_LEVEL", "auto")  # batch use : dowhy's defaults, exact Shapley values up to 5 nodes
+# interactive use by the CodedTools : cheap Shapley estimates, reported with their estimated error
+TOOL_APPROXIMATION_LEVEL = os.getenv("TOOL_APPROXIMATION_LEVEL", "permutation")
+PLOTS_DIR = os.path.join(ARTIFACTS_DIR, "plots")
+RENDER_OPEN_BROWSER = os.getenv("RENDER_OPEN_BROWSER", "false").lower() == "true"
+BENCHMARK_DIR = os.path.join(ARTIFACTS_DIR, "benchmarks")
+METRICS_PROMETHEUS_PATH = os.path.join(ARTIFACTS_DIR, "metrics.prom")
+METRICS_JSON_PATH = os.path.join(ARTIFACTS_DIR, "metrics.json")
+METRICS_EXPORT_INTERVAL_S = 10.0  # minimum time between two exports of the metrics after tool calls
+METRICS_SAMPLING_INTERVAL_S = 0.01  # resident memory sampling period while instrumented calls run
+METRICS_BUCKETS_S = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0]
+BENCHMARK_SIZES = [10**3, 10**4, 10**5, 10**6]
+BENCHMARK_REGRESSION_TOLERANCE = 0.25
+BENCHMARK_MIN_WALL_TIME_DELTA_S = 0.05
+BENCHMARK_MIN_RSS_DELTA_MB = 20.0
+DATA_GENERATION_CHUNK_SIZE = 1_000_000
+DATA_GENERATION_NUM_WORKERS = BOOTSTRAP_NUM_WORKERS
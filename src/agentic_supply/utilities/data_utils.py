@@ -1,16 +1,21 @@
 import os
+import json
 import pickle
+import hashlib
+import shutil
+import tempfile
+import numpy as np
 import pandas as pd
 import base64
-import webbrowser
-import matplotlib.pyplot as plt
 from importlib.resources import files, as_file
-from typing import Optional
+from typing import Any, Optional, Dict, List, Tuple
+from pydantic import BaseModel, Field
 
 
 from agentic_supply import data
-from agentic_supply.utilities.config import DATA_NAMES, DATA_TO_FILE, ARTIFACTS_DIR
+from agentic_supply.utilities.config import DATA_NAMES, DATA_TO_FILE, DATA_CACHE_DIR, COMPACT_FLOAT_TOLERANCE
 from agentic_supply.utilities.log_utils import set_logging, get_logger
+from agentic_supply.utilities.instrumentation import instrument
 
 
 set_logging()
@@ -24,11 +29,239 @@ def save_object(object_: object, filebasename):
     logger.info(f"Saved object at {source}")
 
 
-def get_data(data_name: DATA_NAMES) -> pd.DataFrame:
+_FINGERPRINTS: Dict[Tuple[str, int, int], str] = {}
+
+
+def get_data_fingerprint(data_name: DATA_NAMES) -> str:
+    """
+    Content hash of the packaged data file, memoised on the file path, size and modification time,
+    so that repeated calls only cost a stat of the file.
+    Examples :
+    >>> fingerprint = get_data_fingerprint("mini_data")
+    """
     source = files(data).joinpath(DATA_TO_FILE[data_name])
     with as_file(source) as myfile:
-        df = pd.read_csv(myfile)
-    return df
+        stat = os.stat(myfile)
+        key = (str(myfile), stat.st_size, stat.st_mtime_ns)
+        if key not in _FINGERPRINTS:
+            with open(myfile, "rb") as f:
+                _FINGERPRINTS[key] = hashlib.file_digest(f, "sha256").hexdigest()
+    return _FINGERPRINTS[key]
+
+
+def _build_columnar_cache(source_path: str, cache_dir: str):
+    """
+    One .npy file per column, string columns being stored as int32 codes with their categories in the metadata.
+    The cache is written in a temporary directory renamed at the end, so that readers never see a partial cache.
+    """
+    df = pd.read_csv(source_path)
+    os.makedirs(os.path.dirname(cache_dir), exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(cache_dir))
+    columns = []
+    for i, (name, series) in enumerate(df.items()):
+        if series.dtype == object:
+            codes, categories = pd.factorize(series)  # missing values get the code -1
+            np.save(os.path.join(tmp_dir, f"{i}.npy"), codes.astype(np.int32))
+            columns.append(dict(name=name, kind="string", categories=categories.tolist()))
+        else:
+            np.save(os.path.join(tmp_dir, f"{i}.npy"), series.to_numpy())
+            columns.append(dict(name=name, kind="numeric"))
+    with open(os.path.join(tmp_dir, "metadata.json"), "w") as f:
+        json.dump(dict(source=os.path.basename(source_path), num_rows=len(df), columns=columns), f)
+    try:
+        os.rename(tmp_dir, cache_dir)
+        logger.info(f"Built the columnar cache of {source_path} at {cache_dir}")
+    except OSError:
+        # built concurrently by another process
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+_CACHE_METADATA: Dict[str, Dict] = {}
+
+
+def _get_cache_metadata(cache_dir: str) -> Dict:
+    if cache_dir not in _CACHE_METADATA:
+        with open(os.path.join(cache_dir, "metadata.json"), "r") as f:
+            metadata = json.load(f)
+        for i, column in enumerate(metadata["columns"]):
+            column["path"] = os.path.join(cache_dir, f"{i}.npy")
+            if column["kind"] == "string":
+                # the code -1 of missing values indexes the trailing NaN
+                column["lookup"] = np.array(column["categories"] + [np.nan], dtype=object)
+                # compact columns have sorted categories, so that they sort and group like the strings : codes are mapped to ranks
+                order = np.argsort(np.array(column["categories"], dtype=str), kind="stable")
+                column["sorted_categories"] = [column["categories"][i] for i in order]
+                column["ranks"] = np.append(np.argsort(order), -1).astype(np.int32)
+        metadata["columns"] = {column["name"]: column for column in metadata["columns"]}
+        _CACHE_METADATA[cache_dir] = metadata
+    return _CACHE_METADATA[cache_dir]
+
+
+def _get_filter_mask(column: Dict, values: np.ndarray, value: Any) -> np.ndarray:
+    accepted = list(value) if isinstance(value, (list, tuple, set)) else [value]
+    if column["kind"] == "string":
+        accepted = [column["categories"].index(elem) for elem in accepted if elem in column["categories"]]
+    return np.isin(values, accepted)
+
+
+def _compact_values(values: np.ndarray, tolerance: float = COMPACT_FLOAT_TOLERANCE) -> np.ndarray:
+    """
+    int32 for integers within its range, float32 for floats whose relative rounding error is within the tolerance
+    (a tolerance of 0 only allows lossless conversions), the values unchanged otherwise.
+    """
+    if values.dtype.kind in "iu" and values.dtype.itemsize > 4:
+        if len(values) == 0 or (values.min() >= np.iinfo(np.int32).min and values.max() <= np.iinfo(np.int32).max):
+            return values.astype(np.int32)
+    elif values.dtype.kind == "f" and values.dtype.itemsize > 4:
+        compact_values = values.astype(np.float32)
+        with np.errstate(over="ignore", invalid="ignore"):
+            if np.allclose(compact_values, values, rtol=tolerance, atol=0.0, equal_nan=True):
+                return compact_values
+    return values
+
+
+def compact_dataframe(df: pd.DataFrame, tolerance: float = COMPACT_FLOAT_TOLERANCE) -> pd.DataFrame:
+    """
+    The data with categorical dtypes for the string columns and numerics downcast to int32 and float32 where lossless,
+    or within the relative tolerance for floats.
+    Examples :
+    >>> compact_df = compact_dataframe(pd.read_csv("./logs/scm_microservices.csv"), tolerance=0)
+    """
+    columns_data = {}
+    for name, series in df.items():
+        if series.dtype == object:
+            columns_data[name] = series.astype("category")
+        elif isinstance(series.dtype, np.dtype):
+            columns_data[name] = _compact_values(series.to_numpy(), tolerance)
+        else:
+            columns_data[name] = series
+    return pd.DataFrame(columns_data, index=df.index, copy=False)
+
+
+class MemoryReport(BaseModel):
+    data_name: str
+    original_bytes: int
+    compact_bytes: int
+    dtypes: Dict[str, str] = Field(default_factory=dict, description="Compact dtype of each column whose dtype changed")
+
+    @property
+    def saved_bytes(self) -> int:
+        return self.original_bytes - self.compact_bytes
+
+    @property
+    def ratio(self) -> float:
+        return self.original_bytes / self.compact_bytes if self.compact_bytes else float("inf")
+
+    def __str__(self) -> str:
+        return (
+            f"{self.data_name} : {self.original_bytes / 1024**2:.2f}MB with the default dtypes, {self.compact_bytes / 1024**2:.2f}MB compact, "
+            f"{self.saved_bytes / 1024**2:.2f}MB saved ({self.ratio:.1f}x) ; compact dtypes : {self.dtypes}"
+        )
+
+
+def get_memory_report(data_name: DATA_NAMES, tolerance: float = COMPACT_FLOAT_TOLERANCE) -> MemoryReport:
+    """
+    Memory of the data with the default dtypes against the compact dtypes, string objects included.
+    Examples :
+    >>> print(get_memory_report("supply_chain_medical"))
+    """
+    original = get_data(data_name)
+    compact = get_data(data_name, compact=True, tolerance=tolerance)
+    return MemoryReport(
+        data_name=data_name,
+        original_bytes=int(original.memory_usage(deep=True).sum()),
+        compact_bytes=int(compact.memory_usage(deep=True).sum()),
+        dtypes={name: str(dtype) for name, dtype in compact.dtypes.items() if dtype != original.dtypes[name]},
+    )
+
+
+def _load_columnar_cache(
+    cache_dir: str,
+    columns: Optional[List[str]],
+    filters: Optional[Dict[str, Any]],
+    compact: bool = False,
+    tolerance: float = COMPACT_FLOAT_TOLERANCE,
+) -> pd.DataFrame:
+    metadata = _get_cache_metadata(cache_dir)
+    columns = list(metadata["columns"]) if columns is None else list(columns)
+    unknown_columns = [name for name in [*columns, *(filters or {})] if name not in metadata["columns"]]
+    if unknown_columns:
+        raise ValueError(f"Unknown columns {unknown_columns} for {metadata['source']}")
+
+    index, mask = None, None
+    for name, value in (filters or {}).items():
+        column = metadata["columns"][name]
+        column_mask = _get_filter_mask(column, np.load(column["path"], mmap_mode="r"), value)
+        mask = column_mask if mask is None else mask & column_mask
+    if mask is not None:
+        # keep the row labels of the full data, as boolean indexing of the full dataframe would
+        index = np.flatnonzero(mask)
+
+    columns_data = {}
+    for name in columns:
+        column = metadata["columns"][name]
+        # copy-on-write memory map : the pages are shared until written to
+        values = np.load(column["path"], mmap_mode="c").view(np.ndarray)
+        if index is not None:
+            values = values[index]
+        if column["kind"] == "string" and compact:
+            # built from the stored codes, without materialising the strings
+            columns_data[name] = pd.Categorical.from_codes(column["ranks"][values], categories=column["sorted_categories"])
+        elif column["kind"] == "string":
+            columns_data[name] = column["lookup"][values]
+        else:
+            columns_data[name] = _compact_values(values, tolerance) if compact else values
+    return pd.DataFrame(columns_data, index=index, copy=False)
+
+
+def _get_cache_dir(data_name: DATA_NAMES) -> Optional[str]:
+    """
+    Directory of the columnar cache of the data, built if missing, or None if it cannot be built.
+    """
+    cache_dir = os.path.join(DATA_CACHE_DIR, get_data_fingerprint(data_name))
+    if not os.path.isdir(cache_dir):
+        try:
+            with as_file(files(data).joinpath(DATA_TO_FILE[data_name])) as myfile:
+                _build_columnar_cache(str(myfile), cache_dir)
+        except OSError as e:
+            logger.warning(f"Could not build the columnar cache of {data_name} : {e}")
+            return None
+    return cache_dir
+
+
+def get_data_columns(data_name: DATA_NAMES) -> List[str]:
+    cache_dir = _get_cache_dir(data_name)
+    if cache_dir is None:
+        return list(pd.read_csv(files(data).joinpath(DATA_TO_FILE[data_name]), nrows=0).columns)
+    return list(_get_cache_metadata(cache_dir)["columns"])
+
+
+@instrument("data_load")
+def get_data(
+    data_name: DATA_NAMES,
+    columns: Optional[List[str]] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    compact: bool = False,
+    tolerance: float = COMPACT_FLOAT_TOLERANCE,
+) -> pd.DataFrame:
+    """
+    Loads the packaged data through a columnar cache built on first load in DATA_CACHE_DIR, keyed by the file content hash.
+    Numeric columns are memory-mapped, so repeated loads do not parse nor copy the file.
+    Filters select the rows where each column equals the given value, or one of the given values for a list.
+    In compact mode, string columns are categorical (with sorted categories) and numerics are downcast, see compact_dataframe.
+    Examples :
+    >>> df = get_data("microservices_latencies")
+    >>> df = get_data("supply_chain_logistics", columns=["demand", "submitted"], filters={"week": "w1"})
+    >>> df = get_data("supply_chain_medical", compact=True)
+    """
+    cache_dir = _get_cache_dir(data_name)
+    if cache_dir is None:
+        df = pd.read_csv(files(data).joinpath(DATA_TO_FILE[data_name]))
+        for name, value in (filters or {}).items():
+            df = df[df[name].isin(list(value) if isinstance(value, (list, tuple, set)) else [value])]
+        df = df if columns is None else df[columns]
+        return compact_dataframe(df, tolerance) if compact else df
+    return _load_columnar_cache(cache_dir, columns, filters, compact, tolerance)
 
 
 def write_png_to_html(png_path: str, title: str, html_path: Optional[str] = None):
@@ -52,13 +285,3 @@ def write_png_to_html(png_path: str, title: str, html_path: Optional[str] = None
 
     with open(html_path, "w") as f:
         f.write(encoded_html)
-
-
-def visualise_graph(image_basename: str, title: str, in_memory: bool = True):
-    image_filepath_png, image_filepath_html = (os.path.join(ARTIFACTS_DIR, image_basename + extension) for extension in [".png", ".html"])
-    if in_memory:
-        plt.tight_layout()
-        plt.savefig(image_filepath_png, bbox_inches="tight")
-    plt.clf()
-    write_png_to_html(png_path=image_filepath_png, html_path=image_filepath_html, title=title)
-    webbrowser.open_new_tab(f"file://{os.path.abspath(image_filepath_html)}")
@@ -0,0 +1,305 @@
+"""
+Shared executor moving the blocking work of the CodedTools off the neuro-san event loop.
+
+- Thread mode, for I/O and short or cached calls sharing in-process state (e.g. the model cache, the result cache).
+  A call that times out is abandoned : it is cancelled if it has not started, otherwise it finishes in the background.
+- Worker mode, for CPU-heavy calls (model fitting, evaluation, refutation, bootstrapped causal tasks).
+  The calls run in persistent worker processes, started with the forkserver (or spawn) method : never forked from the
+  threaded tool server, and each keeping its own model cache between calls, filled on demand.
+  The number of workers is capped, and each worker caps its own pools (bootstrap, CI tests, evaluation, dowhy's n_jobs)
+  to its share of the cores, so that concurrent calls do not oversubscribe them.
+  A call that times out or is cancelled terminates its worker for real,
+  and a fresh worker replaces it for the next call.
+  The function, its arguments and its result are pickled : pass module-level functions and data names rather than
+  bound methods of loaded models, so that the worker uses its own cached model.
+"""
+
+import asyncio
+import atexit
+import multiprocessing
+import os
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from multiprocessing.connection import Connection
+from typing import Any, Callable, List, Optional, Tuple
+
+from agentic_supply.utilities.config import (
+    TOOL_TIMEOUT_S,
+    TOOL_NUM_THREADS,
+    TOOL_NUM_PROCESSES,
+    TOOL_WORKER_START_METHOD,
+    TOOL_WORKER_PRELOAD_MODULES,
+    TOOL_WORKER_PRELOAD_DATA_NAMES,
+)
+from agentic_supply.utilities.instrumentation import metrics
+from agentic_supply.utilities.log_utils import set_logging, get_logger
+from agentic_supply.utilities.parallel import set_max_num_workers
+
+
+set_logging()
+logger = get_logger(__name__)
+
+
+def _get_name(func: Callable) -> str:
+    return getattr(func, "__qualname__", None) or getattr(func, "__name__", None) or repr(func)
+
+
+def _preload_models(data_names: List[str]):
+    from agentic_supply.causality_assistant.causal_analysis import CausalAnalysis
+    from agentic_supply.causality_assistant.model_store import model_store
+
+    for data_name in data_names:
+        if not os.path.isfile(model_store.get_model_path(data_name)):
+            continue
+        try:
+            CausalAnalysis.from_cache(data_name)
+        except (OSError, ValueError) as e:
+            logger.warning(f"The worker could not preload the model for {data_name} : {e}")
+
+
+def _serve(connection: Connection, data_names: List[str], max_num_workers: int):
+    """
+    Loop of a worker process : runs the calls received on the connection until the parent closes it.
+    """
+    set_max_num_workers(max_num_workers)
+    _preload_models(data_names)
+    while True:
+        try:
+            func, args, kwargs = connection.recv()
+        except (EOFError, OSError):
+            break
+        except Exception:
+            # the call could not be unpickled, e.g. a function that can not be imported in the worker
+            result = (False, RuntimeError(traceback.format_exc()))
+        else:
+            try:
+                result = (True, func(*args, **kwargs))
+            except BaseException as e:
+                result = (False, e)
+        # the metrics of the calls instrumented in the worker go back with the result, to be exported by the parent
+        try:
+            connection.send((*result, metrics.snapshot()))
+        except Exception:
+            # the result or the exception could not be pickled
+            connection.send((False, RuntimeError(traceback.format_exc()), metrics.snapshot()))
+        metrics.reset()
+    connection.close()
+
+
+class _Worker:
+    """
+    A persistent worker process, running one call at a time.
+    """
+
+    def __init__(self, context: multiprocessing.context.BaseContext, data_names: List[str], max_num_workers: int):
+        self.connection, child_connection = context.Pipe(duplex=True)
+        # not a daemon, since the calls may start their own worker pools
+        self.process = context.Process(target=_serve, args=(child_connection, data_names, max_num_workers), name="tool-worker")
+        self.process.start()
+        child_connection.close()
+
+    def call(self, func: Callable, args: tuple, kwargs: dict) -> Tuple[bool, Any, dict]:
+        self.connection.send((func, args, kwargs))
+        return self.connection.recv()
+
+    def terminate(self):
+        if self.process.is_alive():
+            self.process.terminate()
+        self.connection.close()
+
+    def close(self):
+        # the worker leaves its loop when its connection is closed, after finishing its background work (e.g. rendering plots)
+        self.connection.close()
+
+
+class _WorkerPool:
+    """
+    Persistent workers, started on demand : the number of workers in use is capped by the executor's slots.
+    """
+
+    def __init__(self, start_method: str, preload_modules: List[str], data_names: List[str], num_workers: int):
+        self.context = multiprocessing.get_context(start_method)
+        if start_method == "forkserver":
+            # imported once by the server process, which every worker is forked from
+            self.context.set_forkserver_preload(preload_modules)
+        self.data_names = data_names
+        # the cores are shared by the workers in use
+        self.max_num_workers = max(1, (os.cpu_count() or 1) // num_workers)
+        self._idle: List[_Worker] = []
+        self._workers: List[_Worker] = []
+        self._lock = threading.Lock()
+
+    def acquire(self) -> _Worker:
+        with self._lock:
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.process.is_alive():
+                    return worker
+                self._workers.remove(worker)
+            worker = _Worker(self.context, self.data_names, self.max_num_workers)
+            self._workers.append(worker)
+            return worker
+
+    def release(self, worker: _Worker):
+        with self._lock:
+            self._idle.append(worker)
+
+    def discard(self, worker: _Worker):
+        worker.terminate()
+        worker.process.join()
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+
+    def shutdown(self):
+        with self._lock:
+            workers, self._workers, self._idle = self._workers, [], []
+        for worker in workers:
+            worker.close()
+
+
+class _WorkerCall:
+    """
+    A call running in a worker process, which can be terminated from another thread.
+    """
+
+    def __init__(self, pool: _WorkerPool, func: Callable, args: tuple, kwargs: dict):
+        self.pool = pool
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.worker: Optional[_Worker] = None
+        self.cancelled = threading.Event()
+        self._lock = threading.Lock()
+
+    def run(self) -> Any:
+        with self._lock:
+            if self.cancelled.is_set():
+                raise RuntimeError(f"{_get_name(self.func)} was cancelled before starting")
+            self.worker = self.pool.acquire()
+        try:
+            success, result, worker_metrics = self.worker.call(self.func, self.args, self.kwargs)
+        except (EOFError, OSError):
+            worker = self._detach()
+            self.pool.discard(worker)
+            if self.cancelled.is_set():
+                raise RuntimeError(f"{_get_name(self.func)} was cancelled")
+            raise RuntimeError(f"The worker running {_get_name(self.func)} exited unexpectedly with code {worker.process.exitcode}")
+        except Exception:
+            # the call could not be pickled : the worker did not receive it
+            self.pool.release(self._detach())
+            raise
+        self.pool.release(self._detach())
+        metrics.merge(worker_metrics)
+        if not success:
+            raise result
+        return result
+
+    def _detach(self) -> _Worker:
+        # a later cancellation must not terminate a worker already serving another call
+        with self._lock:
+            worker, self.worker = self.worker, None
+            return worker
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled.set()
+            if self.worker is not None and self.worker.process.is_alive():
+                self.worker.terminate()
+                logger.warning(f"Terminated the worker running {_get_name(self.func)}")
+
+
+class ToolExecutor:
+    """
+    Examples :
+    >>> from agentic_supply.utilities.execution import tool_executor
+    >>> causal_analysis = await tool_executor.run(CausalAnalysis.from_cache, data_name)
+    >>> _, _, interpretation = await tool_executor.run(causal_analysis.get_arrow_strength, timeout=600)
+    >>> _, _, interpretation = await tool_executor.run(run_from_cache, data_name, "get_intrinsic_causal_influence", in_worker=True)
+    """
+
+    def __init__(
+        self,
+        num_threads: int = TOOL_NUM_THREADS,
+        num_processes: int = TOOL_NUM_PROCESSES,
+        timeout: Optional[float] = TOOL_TIMEOUT_S,
+        start_method: str = TOOL_WORKER_START_METHOD,
+        preload_modules: List[str] = TOOL_WORKER_PRELOAD_MODULES,
+        preload_data_names: List[str] = TOOL_WORKER_PRELOAD_DATA_NAMES,
+    ):
+        self.num_threads = max(1, num_threads)
+        self.num_processes = max(1, num_processes)
+        self.timeout = timeout
+        self.start_method = start_method
+        self.preload_modules = preload_modules
+        self.preload_data_names = preload_data_names
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._worker_pool: Optional[_WorkerPool] = None
+        # one thread per busy worker, waiting for its result : its size caps the number of workers
+        self._worker_slots: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def thread_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._thread_pool is None:
+                self._thread_pool = ThreadPoolExecutor(max_workers=self.num_threads, thread_name_prefix="tool")
+            return self._thread_pool
+
+    @property
+    def worker_pool(self) -> _WorkerPool:
+        with self._lock:
+            if self._worker_pool is None:
+                self._worker_pool = _WorkerPool(self.start_method, self.preload_modules, self.preload_data_names, self.num_processes)
+            return self._worker_pool
+
+    @property
+    def worker_slots(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._worker_slots is None:
+                self._worker_slots = ThreadPoolExecutor(max_workers=self.num_processes, thread_name_prefix="tool-worker")
+            return self._worker_slots
+
+    async def run(self, func: Callable, *args, in_worker: bool = False, timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        Runs func(*args, **kwargs) off the event loop and returns its result.
+        Raises a TimeoutError when the call takes more than timeout seconds (the executor's default if None).
+        In worker mode, func, its arguments and its result must be picklable, and side effects on the arguments are not seen by the caller.
+        """
+        timeout = timeout if timeout is not None else self.timeout
+        name = _get_name(func)
+        if in_worker:
+            call = _WorkerCall(self.worker_pool, func, args, kwargs)
+            future = self.worker_slots.submit(call.run)
+            cancel = call.cancel
+        else:
+            future = self.thread_pool.submit(partial(func, *args, **kwargs))
+            cancel = future.cancel
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except TimeoutError:
+            cancel()
+            raise TimeoutError(f"{name} did not complete within {timeout} seconds and was cancelled") from None
+        except asyncio.CancelledError:
+            cancel()
+            logger.info(f"{name} was cancelled")
+            raise
+        finally:
+            if not in_worker and future.running():
+                logger.warning(f"{name} cannot be interrupted in its thread and keeps running in the background")
+
+    def shutdown(self):
+        with self._lock:
+            for pool in (self._thread_pool, self._worker_slots):
+                if pool is not None:
+                    pool.shutdown(wait=False, cancel_futures=True)
+            if self._worker_pool is not None:
+                self._worker_pool.shutdown()
+            self._thread_pool = self._worker_slots = self._worker_pool = None
+
+
+tool_executor = ToolExecutor()
+# registered after multiprocessing's own exit handler, so run before it : the idle workers leave before being joined
+atexit.register(tool_executor.shutdown)
@@ -0,0 +1,38 @@
+"""
+Atomic file writes for the caches and stores shared between threads and processes.
+
+A file is written under a temporary name in its directory, then renamed over the target : concurrent readers see
+either the previous content or the new one, never a partial file, and a crash leaves the previous content intact.
+
+Examples :
+>>> from agentic_supply.utilities.file_utils import atomic_write_json, atomic_write_pickle
+>>> atomic_write_json("./logs/ci_test_cache/fingerprint.json", {"key": 0.42})
+>>> atomic_write_pickle("./logs/mechanism_cache/key.pkl", entry)
+"""
+
+import json
+import os
+import pickle
+import threading
+from typing import Any, Union
+
+
+def atomic_write(path: str, payload: Union[bytes, str]):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb" if isinstance(payload, bytes) else "w") as out:
+            out.write(payload)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def atomic_write_json(path: str, obj: Any, **kwargs):
+    atomic_write(path, json.dumps(obj, **kwargs))
+
+
+def atomic_write_pickle(path: str, obj: Any):
+    atomic_write(path, pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
@@ -0,0 +1,333 @@
+"""
+Latency and resource instrumentation of the CodedTools and of the key internal phases, exported as metrics files.
+
+Every instrumented call records its duration, whether it raised, and the peak resident memory of the process while it
+ran (sampled by a single background thread, shared by all the calls in flight). The metrics are aggregated per
+(kind, name) : call and error counts, total / max duration, a duration histogram and the peak memory.
+They are exported to ARTIFACTS_DIR, as a Prometheus text file (for the node exporter's textfile collector) and as JSON,
+at most every METRICS_EXPORT_INTERVAL_S seconds after a tool call and when the process exits.
+Calls running in the worker processes of the tool executor are sent back to the parent with their result.
+
+Examples :
+>>> from agentic_supply.utilities.instrumentation import instrument, metrics
+>>> @instrument("fit")
+... def fit(): ...
+>>> with instrument("plotting"):
+...     draw()
+>>> metrics.export()
+"""
+
+import asyncio
+import atexit
+import functools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from agentic_supply.utilities.config import (
+    METRICS_BUCKETS_S,
+    METRICS_EXPORT_INTERVAL_S,
+    METRICS_JSON_PATH,
+    METRICS_PROMETHEUS_PATH,
+    METRICS_SAMPLING_INTERVAL_S,
+)
+from agentic_supply.utilities.log_utils import set_logging, get_logger
+
+
+set_logging()
+logger = get_logger(__name__)
+
+
+METRICS_PREFIX = "agentic_supply"
+MetricKey = Tuple[str, str]
+
+
+def get_rss_mb() -> float:
+    """
+    Current resident memory of the process in MB.
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024**2
+    except (OSError, ValueError):
+        # no procfs : the peak over the whole process lifetime is the best available
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss / 1024**2 if sys.platform == "darwin" else maxrss / 1024
+
+
+class _Call:
+    __slots__ = ("peak_mb",)
+
+    def __init__(self, start_mb: float):
+        self.peak_mb = start_mb
+
+
+class MetricsRegistry:
+    """
+    Thread-safe aggregates of the instrumented calls, keyed by (kind, name).
+
+    Examples :
+    >>> registry = MetricsRegistry()
+    >>> with registry.measure("phase", "fit"):
+    ...     causal_analysis.fit()
+    >>> registry.snapshot()
+    """
+
+    def __init__(self, buckets: List[float] = METRICS_BUCKETS_S, sampling_interval: float = METRICS_SAMPLING_INTERVAL_S):
+        self.buckets = sorted(buckets)
+        self.sampling_interval = sampling_interval
+        self._stats: Dict[MetricKey, Dict[str, Any]] = {}
+        self._active: Dict[int, _Call] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._sampler: Optional[threading.Thread] = None
+        self._last_export = 0.0
+
+    def _get_stats(self, key: MetricKey) -> Dict[str, Any]:
+        if key not in self._stats:
+            self._stats[key] = dict(calls=0, errors=0, total_s=0.0, max_s=0.0, peak_rss_mb=0.0, buckets=[0] * len(self.buckets))
+        return self._stats[key]
+
+    def _sample(self):
+        # one thread for all the calls in flight, idle while there is none
+        with self._lock:
+            while True:
+                while not self._active:
+                    self._wakeup.wait()
+                rss_mb = get_rss_mb()
+                for call in self._active.values():
+                    call.peak_mb = max(call.peak_mb, rss_mb)
+                self._wakeup.wait(self.sampling_interval)
+
+    def _start(self) -> Tuple[int, _Call]:
+        call = _Call(get_rss_mb())
+        with self._lock:
+            if self._sampler is None or not self._sampler.is_alive():
+                self._sampler = threading.Thread(target=self._sample, daemon=True, name="metrics-sampler")
+                self._sampler.start()
+            call_id = id(call)
+            self._active[call_id] = call
+            self._wakeup.notify()
+        return call_id, call
+
+    def _stop(self, kind: str, name: str, call_id: int, call: _Call, duration: float, failed: bool):
+        peak_mb = max(call.peak_mb, get_rss_mb())
+        with self._lock:
+            self._active.pop(call_id, None)
+            self._record(kind, name, calls=1, errors=int(failed), total_s=duration, max_s=duration, peak_rss_mb=peak_mb, durations=[duration])
+
+    def _record(self, kind: str, name: str, calls: int, errors: int, total_s: float, max_s: float, peak_rss_mb: float, durations=(), buckets=None):
+        stats = self._get_stats((kind, name))
+        stats["calls"] += calls
+        stats["errors"] += errors
+        stats["total_s"] += total_s
+        stats["max_s"] = max(stats["max_s"], max_s)
+        stats["peak_rss_mb"] = max(stats["peak_rss_mb"], peak_rss_mb)
+        for duration in durations:
+            for i, bound in enumerate(self.buckets):
+                if duration <= bound:
+                    stats["buckets"][i] += 1
+                    break
+        for i, count in enumerate(buckets or []):
+            stats["buckets"][i] += count
+
+    def measure(self, kind: str, name: str) -> "_Measure":
+        return _Measure(self, kind, name)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """
+        The aggregates keyed by "kind/name", with non-cumulative bucket counts.
+        """
+        with self._lock:
+            return {f"{kind}/{name}": dict(stats, kind=kind, name=name, buckets=list(stats["buckets"])) for (kind, name), stats in self._stats.items()}
+
+    def merge(self, snapshot: Dict[str, Dict[str, Any]]):
+        """
+        Adds the aggregates of another registry, e.g. those of a child process.
+        """
+        with self._lock:
+            for stats in snapshot.values():
+                self._record(
+                    stats["kind"],
+                    stats["name"],
+                    calls=stats["calls"],
+                    errors=stats["errors"],
+                    total_s=stats["total_s"],
+                    max_s=stats["max_s"],
+                    peak_rss_mb=stats["peak_rss_mb"],
+                    buckets=stats["buckets"],
+                )
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def _reset_after_fork(self):
+        # a forked child reports its own calls only, and the sampler thread of the parent does not exist in it
+        self._stats = {}
+        self._active = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._sampler = None
+
+    def to_prometheus(self) -> str:
+        lines = []
+        snapshot = self.snapshot()
+        metrics = [
+            ("calls_total", "counter", "Number of calls", "calls"),
+            ("errors_total", "counter", "Number of calls which raised", "errors"),
+            ("duration_seconds_max", "gauge", "Longest call duration in seconds", "max_s"),
+            ("peak_rss_bytes", "gauge", "Peak resident memory of the process during the calls", "peak_rss_mb"),
+        ]
+        for metric, metric_type, description, field in metrics:
+            lines += [f"# HELP {METRICS_PREFIX}_{metric} {description}", f"# TYPE {METRICS_PREFIX}_{metric} {metric_type}"]
+            for stats in snapshot.values():
+                value = stats[field] * 1024**2 if field == "peak_rss_mb" else stats[field]
+                lines.append(f"{METRICS_PREFIX}_{metric}{{{_get_labels(stats)}}} {_format_value(value)}")
+        lines += [f"# HELP {METRICS_PREFIX}_duration_seconds Call durations in seconds", f"# TYPE {METRICS_PREFIX}_duration_seconds histogram"]
+        for stats in snapshot.values():
+            labels = _get_labels(stats)
+            cumulative = 0
+            for bound, count in zip(self.buckets, stats["buckets"]):
+                cumulative += count
+                lines.append(f'{METRICS_PREFIX}_duration_seconds_bucket{{{labels},le="{_format_value(bound)}"}} {cumulative}')
+            lines.append(f'{METRICS_PREFIX}_duration_seconds_bucket{{{labels},le="+Inf"}} {stats["calls"]}')
+            lines.append(f"{METRICS_PREFIX}_duration_seconds_sum{{{labels}}} {_format_value(stats['total_s'])}")
+            lines.append(f"{METRICS_PREFIX}_duration_seconds_count{{{labels}}} {stats['calls']}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, prometheus_path: str = METRICS_PROMETHEUS_PATH, json_path: str = METRICS_JSON_PATH):
+        """
+        Writes the metrics as a Prometheus text file and as JSON, each under a temporary name first :
+        scrapers never read a partial file.
+        """
+        self._last_export = time.monotonic()
+        snapshot = self.snapshot()
+        if not snapshot:
+            return
+        for path, content in (
+            (prometheus_path, self.to_prometheus()),
+            (json_path, json.dumps(dict(pid=os.getpid(), exported_at=time.time(), metrics=snapshot), indent=4)),
+        ):
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as out:
+                out.write(content)
+            os.replace(tmp_path, path)
+
+    def export_if_due(self, interval: float = METRICS_EXPORT_INTERVAL_S):
+        if time.monotonic() - self._last_export >= interval:
+            try:
+                self.export()
+            except OSError as e:
+                logger.warning(f"Could not export the metrics : {e}")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _get_labels(stats: Dict[str, Any]) -> str:
+    return f'kind="{_escape(stats["kind"])}",name="{_escape(stats["name"])}"'
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Measure:
+    def __init__(self, registry: MetricsRegistry, kind: str, name: str):
+        self.registry = registry
+        self.kind = kind
+        self.name = name
+        self._calls: List[Tuple[int, _Call, float]] = []
+
+    def __enter__(self) -> "_Measure":
+        call_id, call = self.registry._start()
+        self._calls.append((call_id, call, time.perf_counter()))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        call_id, call, start = self._calls.pop()
+        self.registry._stop(self.kind, self.name, call_id, call, time.perf_counter() - start, failed=exc_type is not None)
+        return False
+
+
+metrics = MetricsRegistry()
+os.register_at_fork(after_in_child=metrics._reset_after_fork)
+atexit.register(metrics.export_if_due, 0.0)
+
+
+class instrument:
+    """
+    Measures a block, or every call of a function (sync or async), under the given phase name.
+
+    Examples :
+    >>> @instrument("model_load")
+    ... def load(): ...
+    >>> with instrument("json_db_read"):
+    ...     sites_db = get_sites_db()
+    """
+
+    def __init__(self, name: str, kind: str = "phase", registry: Optional[MetricsRegistry] = None):
+        self.name = name
+        self.kind = kind
+        self.registry = registry
+        self._measures: List[_Measure] = []
+
+    def _get_registry(self) -> MetricsRegistry:
+        # looked up at call time, so that the registry reset in forked children is the one used
+        return self.registry if self.registry is not None else metrics
+
+    def __enter__(self) -> "instrument":
+        measure = self._get_registry().measure(self.kind, self.name)
+        measure.__enter__()
+        self._measures.append(measure)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self._measures.pop().__exit__(exc_type, exc_value, traceback)
+
+    def __call__(self, func: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with self._get_registry().measure(self.kind, self.name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self._get_registry().measure(self.kind, self.name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+
+def instrument_tool(async_invoke: Callable) -> Callable:
+    """
+    Decorator of the async_invoke of a CodedTool : measured under the name of the tool class, then the metrics are exported
+    if the last export is older than METRICS_EXPORT_INTERVAL_S.
+
+    Examples :
+    >>> class InventoryMonitor(CodedTool):
+    ...     @instrument_tool
+    ...     async def async_invoke(self, args, sly_data): ...
+    """
+    name = async_invoke.__qualname__.rsplit(".", 1)[0]
+
+    @functools.wraps(async_invoke)
+    async def wrapper(*args, **kwargs):
+        try:
+            with metrics.measure("tool", name):
+                return await async_invoke(*args, **kwargs)
+        finally:
+            metrics.export_if_due()
+
+    return wrapper
@@ -0,0 +1,25 @@
+import importlib
+import sys
+import types
+
+
+class LazyModule(types.ModuleType):
+    """
+    Module placeholder importing the actual module on first attribute access.
+    Used for heavy dependencies (e.g. dowhy.gcm takes seconds to import), so that importing a tool module stays cheap
+    and the cost is only paid by the first call that needs the dependency.
+
+    Examples :
+    >>> gcm = lazy_import("dowhy.gcm")
+    >>> model = gcm.InvertibleStructuralCausalModel(graph)  # dowhy.gcm is imported here
+    """
+
+    def __getattr__(self, attribute: str):
+        module = importlib.import_module(self.__name__)
+        # later attribute accesses are served directly from the placeholder's namespace
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attribute)
+
+
+def lazy_import(name: str) -> types.ModuleType:
+    return sys.modules.get(name) or LazyModule(name)
@@ -0,0 +1,47 @@
+"""
+Helpers shared by the process pools of the causal tasks (bootstrap resamples, CI tests, bulk attribution, drift pairs).
+
+Examples :
+>>> from agentic_supply.utilities.parallel import configure_pool_worker, get_num_workers
+>>> def _run_chunk(chunk, in_worker: bool = False):
+...     if in_worker:
+...         configure_pool_worker()
+>>> num_workers = min(get_num_workers(BOOTSTRAP_NUM_WORKERS), len(chunks))
+"""
+
+from typing import Optional
+
+
+# cap on the size of the pools started by this process, set in the tool worker processes
+_max_num_workers: Optional[int] = None
+
+
+def set_max_num_workers(max_num_workers: int):
+    """
+    Caps the pools started by this process, including the parallel sections inside dowhy.
+    Called by each tool worker with its share of the cores, so that concurrent tool calls do not oversubscribe them.
+    """
+    from dowhy.gcm import config
+
+    global _max_num_workers
+    _max_num_workers = max(1, max_num_workers)
+    config.set_default_n_jobs(_max_num_workers)
+
+
+def get_num_workers(num_workers: int) -> int:
+    """
+    The number of workers a pool of this process should start, at least 1 and at most the cap of the process.
+    """
+    num_workers = max(1, num_workers)
+    return num_workers if _max_num_workers is None else min(num_workers, _max_num_workers)
+
+
+def configure_pool_worker():
+    """
+    To be called in each worker of a pool : the workers already use all the cores, so the parallel sections inside
+    dowhy run with a single job (no oversubscription), and without progress bars.
+    """
+    from dowhy.gcm import config
+
+    config.set_default_n_jobs(1)
+    config.disable_progress_bars()
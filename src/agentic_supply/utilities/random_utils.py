@@ -0,0 +1,43 @@
+"""
+Seeded sections of code drawing from the global random generators.
+
+dowhy draws from the process-wide np.random and random generators, so a reproducible estimation has to seed them.
+Seeding them in place would race with the other threads of the tool server, and would leave every later unseeded
+draw of the process starting again from the same seed. Here, the seeded sections run one at a time, under a
+process-wide lock, and the previous states of both generators are restored when they end.
+
+Examples :
+>>> from agentic_supply.utilities.random_utils import seeded_random_state
+>>> with seeded_random_state(0):
+...     arrow_strengths = gcm.arrow_strength(model, "Z")
+"""
+
+import random
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional
+import numpy as np
+
+
+# reentrant : a seeded section may run another one, e.g. a cached task estimated by split halves
+_RANDOM_STATE_LOCK = threading.RLock()
+
+
+@contextmanager
+def seeded_random_state(seed: Optional[int]) -> Iterator[None]:
+    """
+    Seeds np.random and random for the duration of the section, then restores their previous states.
+    Without a seed, the section runs unseeded and without the lock.
+    """
+    if seed is None:
+        yield
+        return
+    with _RANDOM_STATE_LOCK:
+        np_state, state = np.random.get_state(), random.getstate()
+        np.random.seed(seed)
+        random.seed(seed)
+        try:
+            yield
+        finally:
+            np.random.set_state(np_state)
+            random.setstate(state)
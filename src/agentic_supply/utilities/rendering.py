@@ -0,0 +1,257 @@
+"""
+Headless plot rendering, off the request path.
+
+Every plot is drawn on its own matplotlib Figure with the Agg canvas, never through the global pyplot state,
+so that plots can be drawn from any thread and without a display.
+A plot is identified by the hash of what is plotted (the drawing function, its data and its title) :
+an image already rendered is served from its files, and the file paths are known before the rendering is done,
+so that the callers can return them while the image is drawn by the background thread.
+Opening the images in a browser is left to the client, with open_in_browser.
+
+Examples :
+>>> from agentic_supply.utilities.rendering import renderer, draw_bar
+>>> plot = renderer.render("arrow_strength_mini_data", "Arrow strength plot", draw_bar, values={"X": 1.0, "Y": 2.0}, ylabel="Strength")
+>>> plot.png_path, plot.get_bytes()
+>>> future = renderer.submit("arrow_strength_mini_data", "Arrow strength plot", draw_bar, values={"X": 1.0, "Y": 2.0})
+"""
+
+import hashlib
+import json
+import os
+import threading
+import webbrowser
+from concurrent.futures import Future, ThreadPoolExecutor
+from multiprocessing.util import Finalize
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+from pydantic import BaseModel
+
+from agentic_supply.utilities.config import PLOTS_DIR
+from agentic_supply.utilities.data_utils import write_png_to_html
+from agentic_supply.utilities.log_utils import set_logging, get_logger
+from agentic_supply.utilities.instrumentation import instrument
+
+
+set_logging()
+logger = get_logger(__name__)
+
+
+BAR_COLOR = "#ff0d57"
+ERROR_BAR_COLOR = "#1E88E5"
+
+
+class RenderedPlot(BaseModel):
+    key: str
+    png_path: str
+    html_path: str
+
+    def get_bytes(self) -> bytes:
+        with open(self.png_path, "rb") as f:
+            return f.read()
+
+
+def _to_jsonable(value: Any) -> Any:
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    return str(value)
+
+
+def get_plot_key(draw: Callable, title: str, plot_data: Dict[str, Any]) -> str:
+    """
+    Examples :
+    >>> get_plot_key(draw_bar, "Arrow strength plot", {"values": {"X": 1.0}})
+    """
+    payload = json.dumps({"draw": draw.__name__, "title": title, "data": plot_data}, sort_keys=True, default=_to_jsonable)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# Drawing functions : each one draws on the given figure only
+
+def draw_bar(
+    figure: "Figure",
+    values: Dict[str, float],
+    uncertainties: Optional[Dict[str, Tuple[float, float]]] = None,
+    ylabel: str = "",
+    xticks: Optional[List[str]] = None,
+):
+    """
+    Same plot as dowhy.utils.bar_plot, with error bars from the uncertainty bounds when given.
+    """
+    ax = figure.add_subplot()
+    names = list(values)
+    heights = np.array([float(np.mean(values[name])) for name in names])
+    bounds = np.array([uncertainties[name] if uncertainties is not None and name in uncertainties else (heights[i], heights[i]) for i, name in enumerate(names)], dtype=float)
+    bounds = bounds.reshape(len(names), 2)
+    errors = np.array([heights - bounds[:, 0], bounds[:, 1] - heights])
+    errors[:, (errors < 0).any(axis=0)] = 0
+    ax.bar(names, heights, yerr=errors, ecolor=ERROR_BAR_COLOR, color=BAR_COLOR)
+    ax.set_ylabel(ylabel)
+    ax.set_xticks(range(len(names)), xticks if xticks else names, rotation=90)
+    ax.spines["right"].set_visible(False)
+    ax.spines["top"].set_visible(False)
+
+
+def draw_lines(figure: "Figure", series: Dict[str, Dict[str, float]], xlabel: str = "", ylabel: str = ""):
+    """
+    One line per key of series, over the keys of its values (e.g. one line per node over the week pairs).
+    """
+    ax = figure.add_subplot()
+    for name, points in series.items():
+        ax.plot(list(points), list(points.values()), marker="o", label=name)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.legend(loc="upper left", bbox_to_anchor=(1.02, 1), borderaxespad=0.0)
+
+
+def draw_curve(
+    figure: "Figure", x: List[float], y: List[float], lower: List[float], upper: List[float], xlabel: str = "", ylabel: str = ""
+):
+    """
+    A curve with its confidence band, e.g. a dose-response curve.
+    """
+    ax = figure.add_subplot()
+    ax.fill_between(x, lower, upper, color=ERROR_BAR_COLOR, alpha=0.3, linewidth=0)
+    ax.plot(x, y, marker="o", color=BAR_COLOR)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.spines["right"].set_visible(False)
+    ax.spines["top"].set_visible(False)
+
+
+def draw_graph(figure: "Figure", edges: List[Tuple[str, str]]):
+    import networkx as nx
+
+    ax = figure.add_subplot()
+    nx.draw_networkx(nx.DiGraph(edges), ax=ax)
+    ax.set_axis_off()
+
+
+def draw_refutation(figure: "Figure", violations: Dict[str, Dict[str, Any]]):
+    """
+    Same plot as dowhy.gcm.falsify.plot_evaluation_results : per falsification method, the histogram of the fractions
+    of violations of the permuted graphs, the fraction of violations of the given graph and the p-value.
+    """
+    from dowhy.gcm.falsify import COLORS
+
+    figure.set_size_inches(8, 3)
+    ax = figure.add_subplot()
+    p_values = "".join(f"p-value {method} = {method_violations['p_value']:.2f}\n" for method, method_violations in violations.items())
+    ax.hist(
+        [method_violations["permuted"] for method_violations in violations.values()],
+        color=COLORS[: len(violations)],
+        alpha=0.5,
+        label=[f"Violations of {method} of permuted DAGs" for method in violations],
+        edgecolor="k",
+    )
+    for i, (method, method_violations) in enumerate(violations.items()):
+        ylim = ax.get_ylim()[1]
+        ax.plot([method_violations["given"]] * 2, [0, ylim], "--", c=COLORS[i], label=f"Violations of {method} of given DAG")
+        ax.set_ylim([0, ylim])
+    ax.set_xlabel("Fraction of violations")
+    ax.set_ylabel("# Permutations")
+    ax.legend(loc="upper left", bbox_to_anchor=(1.05, 1), borderaxespad=0.0, title=p_values)
+
+
+class PlotRenderer:
+    """
+    Examples :
+    >>> from agentic_supply.utilities.rendering import renderer, draw_graph
+    >>> plot = renderer.render("causal_graph_mini_data", "Causal Graph for mini_data", draw_graph, edges=[("X", "Y"), ("Y", "Z")])
+    >>> open_in_browser(plot)
+    """
+
+    def __init__(self, directory: str = PLOTS_DIR, dpi: int = 100):
+        self.directory = directory
+        self.dpi = dpi
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.RLock()
+
+    @property
+    def pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="render")
+                # child processes leave with os._exit, without waiting for the threads : finish the renderings first
+                Finalize(self, self.shutdown, exitpriority=10)
+            return self._pool
+
+    def _reset_after_fork(self):
+        # the rendering thread of the parent does not exist in a forked child
+        self._pool = None
+        self._pending = {}
+        self._lock = threading.RLock()
+
+    def get_plot(self, basename: str, key: str) -> RenderedPlot:
+        path = os.path.join(self.directory, f"{basename}_{key[:16]}")
+        return RenderedPlot(key=key, png_path=f"{path}.png", html_path=f"{path}.html")
+
+    def _draw(self, plot: RenderedPlot, title: str, draw: Callable, plot_data: Dict[str, Any]) -> RenderedPlot:
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        if os.path.isfile(plot.png_path) and os.path.isfile(plot.html_path):
+            return plot
+        with instrument("plotting"):
+            figure = Figure(dpi=self.dpi)
+            FigureCanvasAgg(figure)
+            draw(figure, **plot_data)
+            figure.suptitle(title)
+            os.makedirs(self.directory, exist_ok=True)
+            # written under a temporary name, so that a half-written image is never served from cache
+            tmp_path = f"{plot.png_path}.{threading.get_ident()}.tmp"
+            figure.savefig(tmp_path, format="png", bbox_inches="tight")
+            os.replace(tmp_path, plot.png_path)
+            write_png_to_html(png_path=plot.png_path, title=title, html_path=plot.html_path)
+        logger.info(f"Rendered {plot.png_path}")
+        return plot
+
+    def submit(self, basename: str, title: str, draw: Callable, **plot_data) -> Future:
+        """
+        Renders the plot in the background thread, and returns a future of the RenderedPlot.
+        A plot already rendered or being rendered is not drawn again.
+        """
+        key = get_plot_key(draw, title, plot_data)
+        plot = self.get_plot(basename, key)
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None and os.path.isfile(plot.png_path) and os.path.isfile(plot.html_path):
+                future = Future()
+                future.set_result(plot)
+            elif future is None:
+                future = self.pool.submit(self._draw, plot, title, draw, plot_data)
+                self._pending[key] = future
+                future.add_done_callback(lambda _: self._forget(key))
+            return future
+
+    def _forget(self, key: str):
+        with self._lock:
+            self._pending.pop(key, None)
+
+    def render(self, basename: str, title: str, draw: Callable, wait: bool = True, **plot_data) -> RenderedPlot:
+        """
+        Returns the rendered plot, waiting for the rendering when wait is True.
+        Otherwise the paths are returned right away and the files appear once the background thread is done.
+        """
+        future = self.submit(basename, title, draw, **plot_data)
+        if wait:
+            return future.result()
+        return self.get_plot(basename, get_plot_key(draw, title, plot_data))
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        # waited for outside the lock, which the done callbacks of the pending renderings take
+        if pool is not None:
+            pool.shutdown(wait=wait)
+
+
+def open_in_browser(plot: RenderedPlot):
+    """
+    Client-side action : opens the HTML page of a rendered plot in a new browser tab.
+    """
+    webbrowser.open_new_tab(f"file://{os.path.abspath(plot.html_path)}")
+
+
+renderer = PlotRenderer()
+os.register_at_fork(after_in_child=renderer._reset_after_fork)